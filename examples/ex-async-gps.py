@@ -32,7 +32,6 @@ Requires running `gpsd` daemon.
 """
 
 import asyncio
-import functools
 import logging
 import json
 import redis
@@ -44,9 +43,6 @@ from geotiler.cache import redis_downloader
 
 client = redis.Redis('localhost')
 downloader = redis_downloader(client)
-render_map_async = functools.partial(
-    geotiler.render_map_async, downloader=downloader
-)
 
 async def read_gps(queue):
     """
@@ -60,16 +56,34 @@ async def read_gps(queue):
         if 'lon' in data:
             await queue.put((data['lon'], data['lat']))
         
+async def save_map(session, map):
+    """
+    Save map to a file unless map rendering is superseded.
+    """
+    img = await session.render(map)
+    if img is not None:
+        img.save('ex-async-gps.png', 'png')
+
 async def show_map(queue, map):
     """
     Save map centered at location to a file.
+
+    Rendering of a map at previous location is superseded by rendering of
+    the map at new location.
     """
-    while True:
-        pos = yield from queue.get()
+    session = geotiler.RenderSession(downloader=downloader)
+    task = None
+    try:
+        while True:
+            pos = await queue.get()
 
-        map.center = pos
-        img = await render_map_async(map)
-        img.save('ex-async-gps.png', 'png')
+            map.center = pos
+            if task is not None:
+                task.cancel()
+            task = asyncio.ensure_future(save_map(session, map))
+    finally:
+        if task is not None:
+            task.cancel()
 
 
 size = 800, 800
@@ -71,6 +71,7 @@ class Map:
         """
         self.mm = geotiler.Map(center=center, zoom=zoom, size=size)
         self.markers = []
+        self.pil_image = None
         self.update_map()
 
 
@@ -78,7 +79,8 @@ class Map:
         """
         Download new map tiles and redraw everyting on the map.
         """
-        self.pil_image = geotiler.render_map(self.mm)
+        # map size does not change, so reuse the map image
+        self.pil_image = geotiler.render_map(self.mm, image=self.pil_image)
         self.draw_map()
 
 
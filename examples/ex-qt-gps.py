@@ -39,13 +39,13 @@ Requirements:
 """
 
 import asyncio
-import functools
 import json
 import logging
 import redis
 import sys
 from collections import deque
 
+import PIL.Image
 from PIL.ImageQt import ImageQt
 
 from PyQt5 import QtCore
@@ -116,39 +116,53 @@ async def refresh_map(widget):
     # use redis to cache map tiles
     client = redis.Redis('localhost')
     downloader = redis_downloader(client)
-    render_map = functools.partial(
-        geotiler.render_map_async, downloader=downloader
-    )
-    fetch_tiles = functools.partial(
-        geotiler.fetch_tiles, downloader=downloader
-    )
+    session = geotiler.RenderSession(downloader=downloader)
 
     pixmap = QPixmap(*map.size)
 
+    # render all map images into the same image object
+    image = PIL.Image.new('RGBA', map.size)
+
+    task = None
     while True:
         await event.wait()
         event.clear()
 
         logger.debug('fetching map image...')
 
-        img = await render_map(map)
-        pixmap.convertFromImage(ImageQt(img))
+        scroll_map(widget, map.center)
 
-        # TODO: use `fetch_tiles` to update map as tiles arrive, but try to
-        # avoid `setPixmap` within the loop.
-        # tiles = fetch_tiles(map)
-        # async for tile in tiles:
-        #     painter = QPainter(pixmap)
-        #     img = QImage()
-        #     img.loadFromData(tile.img)
-        #     painter.drawImage(*tile.offset, img)
-        #     painter.end()
-        #     widget.map_layer.setPixmap(pixmap)
+        # stop rendering of the map at previous position; downloads of
+        # still needed tiles are reused by the new render
+        if task is not None:
+            task.cancel()
+        task = asyncio.ensure_future(
+            show_map(widget, session, map, pixmap, image)
+        )
 
-        scroll_map(widget, map.center)
+
+async def show_map(widget, session, map, pixmap, image):
+    """
+    Render map and update map widget as map tiles arrive.
+
+    This is asyncio coroutine.
+
+    :param widget: Map widget.
+    :param session: Render session.
+    :param map: Geotiler map object.
+    :param pixmap: Pixmap displayed by the map widget.
+    :param image: Image to render map into.
+    """
+    # update map image as tiles arrive, at most 10 times per second
+    tiles = session.fetch_tiles(map)
+    images = geotiler.render_map_progressive(
+        map, tiles=tiles, rate=10, image=image
+    )
+    async for img, boxes in images:
+        pixmap.convertFromImage(ImageQt(img))
         widget.map_layer.setPixmap(pixmap)
 
-        logger.debug('got map image')
+    logger.debug('got map image')
 
 
 async def locate(widget, queue):
@@ -25,11 +25,23 @@
 #   License: BSD
 #
 
-from importlib.metadata import version
+from .map import Map, render_map, render_map_async, render_map_future, \
+    render_map_progressive, render_map_layers, render_map_layers_async, \
+    render_map_encoded, render_map_async_encoded, render_map_sizes, \
+    render_map_async_sizes, render_map_region, render_map_async_region, \
+    fetch_tiles
+from .provider import find_provider, providers, reload_providers
+from .session import RenderSession
+from .tile.img import CanvasPool
 
-from .map import Map, render_map, render_map_async, fetch_tiles
-from .provider import find_provider, providers
-
-__version__ = version('geotiler')
+def __getattr__(name):
+    # read version from package metadata on first use to keep import of
+    # GeoTiler fast
+    if name == '__version__':
+        from importlib.metadata import version
+        return version('geotiler')
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name
+    ))
 
 # vim: sw=4:et:ai
@@ -29,15 +29,24 @@
 Caching strategies for GeoTiler.
 """
 
+import asyncio
+import hashlib
 import logging
+import os
+import tempfile
+import time
 from functools import partial
 from cytoolz.itertoolz import groupby, partition_all  # type: ignore
 
+from .errors import TileNotFoundError
 from .util import log_tiles, obfuscate
 from .tile.io import fetch_tiles
 
 logger = logging.getLogger(__name__)
 
+# cache value of map tile, which does not exist at map provider service
+MISSING = b''
+
 def log_tile_cache_hit(tile):
     if tile.img:
         logger.debug('cache hit for: {}'.format(obfuscate(tile.url)))
@@ -49,7 +58,10 @@ def fetch_from_cache(get, tiles):
         tiles = log_tiles(log_tile_cache_hit, tiles)
     return tiles
 
-async def caching_downloader(get, set, downloader, tiles, num_workers, **kw):
+async def caching_downloader(
+        get, set, downloader, tiles, num_workers, *, set_missing=None,
+        placeholder=None, **kw
+    ):
     """
     Download tiles from cache and missing tiles with the downloader.
 
@@ -64,6 +76,18 @@ async def caching_downloader(get, set, downloader, tiles, num_workers, **kw):
     The cache getter function (`get` parameter) should return `None` if
     tile data is not in cache for given URL.
 
+    If `set_missing` function is specified, then map tiles, which do not
+    exist at map provider service, are stored in cache as known missing
+    tiles (:py:data:`MISSING` value), usually with shorter expiry
+    timeout. The known missing tiles are not downloaded again. Their data
+    is `placeholder` data, if specified. Otherwise, their error is set to
+    :py:class:`geotiler.errors.TileNotFoundError`, and they are rendered
+    blank.
+
+    If `timeout` parameter is passed to the downloader, then it is the
+    timeout of the whole download of missing tiles, not of each call of the
+    original downloader.
+
     A collection of tiles is returned.
 
     :param get: Function to get a tile data from cache.
@@ -72,35 +96,177 @@ async def caching_downloader(get, set, downloader, tiles, num_workers, **kw):
     :param tiles: Collection tiles to fetch.
     :param num_workers: Number of workers used to connect to a map provider
         service.
+    :param set_missing: Function to mark a tile as missing in cache.
+    :param placeholder: Tile data used for known missing tiles.
     :param kw: Parameters passed to downloader coroutine.
     """
+    loop = asyncio.get_running_loop()
+    timeout = kw.get('timeout')
+    deadline = None if timeout is None else loop.time() + timeout
+
     tiles = fetch_from_cache(get, tiles)
     groups = partition_all(10, tiles)
     for tg in groups:
-        missing = groupby(lambda t: t.img is None, tg)
+        if deadline is not None:
+            kw['timeout'] = max(0, deadline - loop.time())
+
+        missing = groupby(_cache_state, tg)
         for t in missing.get(False, []):
             # reset cache for new and old tiles
             set(t.url, t.img)
             yield t
 
+        for t in missing.get(MISSING, []):
+            yield _missing_tile(t, placeholder)
+
         result = downloader(missing.get(True, []), num_workers, **kw)
         async for t in result:
-            # reset cache for new and old tiles
-            set(t.url, t.img)
+            if t.img is not None:
+                # reset cache for new and old tiles
+                set(t.url, t.img)
+            elif set_missing is not None \
+                    and isinstance(t.error, TileNotFoundError):
+                set_missing(t.url)
+                t = _missing_tile(t, placeholder)
             yield t
 
-def redis_downloader(client, downloader=None, timeout=3600 * 24 * 7):
+def redis_downloader(
+        client, downloader=None, timeout=3600 * 24 * 7, missing_timeout=3600,
+        placeholder=None
+    ):
     """
     Create downloader using Redis as cache for map tiles.
 
+    Map tiles, which do not exist at map provider service, are cached as
+    known missing tiles (see :py:func:`caching_downloader`).
+
     :param client: Redis client object.
     :param downloader: Map tiles downloader, use `None` for default downloader.
     :param timeout: Map tile data expiry timeout, default 1 week.
+    :param missing_timeout: Known missing map tile expiry timeout, default
+        1 hour.
+    :param placeholder: Tile data used for known missing tiles.
     """
     if downloader is None:
         downloader = fetch_tiles
     set = lambda key, value: client.setex(key, timeout, value)
-    return partial(caching_downloader, client.get, set, downloader)
+    set_missing = lambda key: client.setex(key, missing_timeout, MISSING)
+    return partial(
+        caching_downloader, client.get, set, downloader,
+        set_missing=set_missing, placeholder=placeholder
+    )
+
+def fs_downloader(path, downloader=None, missing_timeout=3600, placeholder=None):
+    """
+    Create downloader using file system directory as cache for map tiles.
+
+    Map tile data is written to cache atomically, so the cache can be
+    shared by multiple processes.
+
+    Map tiles, which do not exist at map provider service, are cached as
+    known missing tiles (see :py:func:`caching_downloader`).
+
+    :param path: Cache directory.
+    :param downloader: Map tiles downloader, use `None` for default downloader.
+    :param missing_timeout: Known missing map tile expiry timeout, default
+        1 hour.
+    :param placeholder: Tile data used for known missing tiles.
+    """
+    if downloader is None:
+        downloader = fetch_tiles
+    get = partial(fs_get, path, missing_timeout=missing_timeout)
+    set = partial(fs_set, path)
+    set_missing = lambda url: fs_set(path, url, MISSING)
+    return partial(
+        caching_downloader, get, set, downloader, set_missing=set_missing,
+        placeholder=placeholder
+    )
+
+def fs_get(path, url, missing_timeout=None):
+    """
+    Get map tile data from file system cache.
+
+    If there is no tile data in the cache, then `None` is returned.
+
+    Known missing map tile is stored as empty file. It expires after
+    `missing_timeout` seconds, if specified.
+
+    :param path: Cache directory.
+    :param url: Map tile URL.
+    :param missing_timeout: Known missing map tile expiry timeout.
+    """
+    fn = _fs_path(path, url)
+    try:
+        with open(fn, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if data == MISSING and missing_timeout is not None \
+            and time.time() - os.path.getmtime(fn) > missing_timeout:
+        return None
+    return data
+
+def fs_set(path, url, data):
+    """
+    Put map tile data into file system cache.
+
+    Null map tile data is ignored.
+
+    :param path: Cache directory.
+    :param url: Map tile URL.
+    :param data: Map tile data.
+    """
+    if data is None:
+        return
+
+    fn = _fs_path(path, url)
+    dn = os.path.dirname(fn)
+    os.makedirs(dn, exist_ok=True)
+
+    # write to temporary file and rename it to make the write atomic
+    fd, tmp = tempfile.mkstemp(dir=dn)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, fn)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def _cache_state(tile):
+    """
+    Get cache state of a map tile.
+
+    The state is `False` for cached tile, `True` for tile to download and
+    :py:data:`MISSING` for known missing tile.
+
+    :param tile: Map tile read from cache.
+    """
+    return MISSING if tile.img == MISSING else tile.img is None
+
+def _missing_tile(tile, placeholder):
+    """
+    Create known missing map tile.
+
+    :param tile: Map tile.
+    :param placeholder: Tile data used for known missing tiles.
+    """
+    if placeholder is not None:
+        return tile._replace(img=placeholder, error=None)
+
+    msg = 'Map tile does not exist: {}'.format(obfuscate(tile.url))
+    return tile._replace(img=None, error=TileNotFoundError(msg))
+
+def _fs_path(path, url):
+    """
+    Get path of file system cache file for a map tile URL.
+
+    :param path: Cache directory.
+    :param url: Map tile URL.
+    """
+    key = hashlib.sha1(url.encode()).hexdigest()
+    return os.path.join(path, key[:2], key)
 
 
 # vim: sw=4:et:ai
@@ -30,4 +30,16 @@ class GeoTilerError(Exception):
     Basic GeoTiler error.
     """
 
+class TileNotFoundError(GeoTilerError, ValueError):
+    """
+    Map tile does not exist at map provider service, i.e. HTTP status 404
+    was received.
+    """
+
+class CircuitOpenError(GeoTilerError, ValueError):
+    """
+    Map tile is not downloaded as circuit breaker of map provider service
+    is open.
+    """
+
 # vim: sw=4:et:ai
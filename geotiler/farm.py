@@ -0,0 +1,338 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Render maps with a pool of processes.
+
+Map tiles of all maps are downloaded once by the main process into a file
+system cache. Worker processes read the map tiles from the cache, and
+decode, paste and encode the map tiles into map images. A map is rendered
+as soon as its map tiles are downloaded. The map images
+are sent back to the main process via shared memory.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import tempfile
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+
+import PIL.Image  # type: ignore
+
+from .cache import MISSING, fs_downloader, fs_get, _missing_tile
+from .loop import run_coroutine
+from .map import Map, _map_tiles
+from .provider import find_provider
+from .tile.img import render_image
+
+logger = logging.getLogger(__name__)
+
+MapSpec = namedtuple('MapSpec', ['provider', 'zoom', 'size', 'origin', 'offset'])
+MapSpec.__doc__ = """
+Picklable map specification.
+
+:var provider: Map provider identificator.
+:var zoom: Map zoom.
+:var size: Map image size.
+:var origin: Tile coordinates at map zoom level of base tile.
+:var offset: Position of base tile relative to map center.
+"""
+
+def render_maps(
+        maps, workers=None, cache_dir=None, downloader=None,
+        placeholder=None
+    ):
+    """
+    Render maps with a pool of processes.
+
+    Map tiles of all maps are downloaded once into a file system cache
+    (see :py:func:`geotiler.cache.fs_downloader`) and the maps are
+    rendered by worker processes, as soon as their map tiles are
+    downloaded. Map tiles, which could not be downloaded,
+    are rendered as error tiles and listed in `missing_tiles` item of map
+    image `info` dictionary. Known missing map tiles are rendered with
+    placeholder data, if specified, or blank otherwise (see
+    :py:func:`geotiler.cache.caching_downloader`).
+
+    The map providers of the maps have to be identified with an
+    identificator (see :py:func:`geotiler.find_provider`).
+
+    Generator of map images (instances of `PIL.Image` class) is returned.
+    The order of the images is the order of the maps.
+
+    :param maps: Collection of maps.
+    :param workers: Number of worker processes, by default number of CPUs.
+    :param cache_dir: Map tiles cache directory. If null, then temporary
+        directory is used.
+    :param downloader: Map tiles downloader, use `None` for default
+        downloader.
+    :param placeholder: Tile data used for known missing tiles.
+    """
+    specs = [map_spec(m) for m in maps]
+    maps = [spec_map(s) for s in specs]
+    render = partial(
+        _render_maps, maps, specs, workers, downloader=downloader,
+        placeholder=placeholder
+    )
+
+    if cache_dir is None:
+        with tempfile.TemporaryDirectory(prefix='geotiler-') as cache_dir:
+            yield from render(cache_dir)
+    else:
+        yield from render(cache_dir)
+
+def map_spec(map):
+    """
+    Create picklable specification of a map.
+
+    :param map: Map instance.
+    """
+    pid = map.provider.id
+    if pid is None:
+        raise ValueError('Map provider has no identificator')
+    return MapSpec(
+        pid, map.zoom, tuple(map.size), tuple(map.origin), tuple(map.offset)
+    )
+
+def spec_map(spec):
+    """
+    Create map from its specification.
+
+    :param spec: Map specification.
+    """
+    map = Map(
+        center=(0, 0), zoom=spec.zoom, size=spec.size,
+        provider=find_provider(spec.provider)
+    )
+    map.origin = spec.origin
+    map.offset = spec.offset
+    return map
+
+def _render_maps(maps, specs, workers, cache_dir, downloader, placeholder):
+    """
+    Download map tiles of maps and render the maps with a pool of
+    processes.
+
+    A map is rendered as soon as its map tiles are downloaded, so
+    downloading of map tiles overlaps with rendering of the maps. Shared
+    memory of map images, which are not consumed, is released.
+
+    :param maps: Collection of maps.
+    :param specs: Specifications of the maps.
+    :param workers: Number of worker processes.
+    :param cache_dir: Map tiles cache directory.
+    :param downloader: Map tiles downloader.
+    :param placeholder: Tile data used for known missing tiles.
+    """
+    # spawn clean worker processes, each with its own event loop
+    ctx = multiprocessing.get_context('spawn')
+    render = partial(_render, cache_dir, placeholder)
+
+    # map renders are submitted within the background event loop; null
+    # item signals end of downloads
+    ready = queue.SimpleQueue()
+    lock = threading.Lock()
+    closed = threading.Event()
+    futures = {}
+
+    with ProcessPoolExecutor(workers, mp_context=ctx) as executor:
+        def submit(i):
+            with lock:
+                if not closed.is_set():
+                    ready.put((i, executor.submit(render, specs[i])))
+
+        download = run_coroutine(
+            _fetch_tiles(maps, cache_dir, downloader, submit)
+        )
+        download.add_done_callback(lambda f: ready.put(None))
+        try:
+            for i in range(len(specs)):
+                while i not in futures:
+                    item = ready.get()
+                    if item is None:
+                        # raise download error, if any
+                        download.result()
+                    else:
+                        futures.update([item])
+                yield _read_image(*futures.pop(i).result())
+        finally:
+            with lock:
+                closed.set()
+            download.cancel()
+
+            while not ready.empty():
+                item = ready.get()
+                if item is not None:
+                    futures.update([item])
+            for future in futures.values():
+                _release_image(future)
+
+async def _fetch_tiles(maps, cache_dir, downloader, ready):
+    """
+    Download unique map tiles of maps into file system cache.
+
+    The `ready` function is called with index of a map, when all map tiles
+    of the map are downloaded.
+
+    :param maps: Collection of maps.
+    :param cache_dir: Map tiles cache directory.
+    :param downloader: Map tiles downloader.
+    :param ready: Function called when map tiles of a map are downloaded.
+    """
+    fetch = fs_downloader(cache_dir, downloader)
+
+    # group unique tiles by map provider to respect its limits; count
+    # map tiles of each map, which are not downloaded yet
+    groups = {}
+    owners = defaultdict(list)
+    counts = []
+    for i, map in enumerate(maps):
+        limit, tiles = groups.setdefault(
+            map.provider.id, (map.provider.limit, {})
+        )
+        urls = {t.url: t for t in _map_tiles(map)}
+        tiles.update(urls)
+        counts.append(len(urls))
+        for url in urls:
+            owners[url].append(i)
+
+    for i, n in enumerate(counts):
+        if n == 0:
+            ready(i)
+
+    for limit, tiles in groups.values():
+        if __debug__:
+            logger.debug('fetching {} unique tiles'.format(len(tiles)))
+        async for tile in fetch(tiles.values(), limit):
+            for i in owners.pop(tile.url, []):
+                counts[i] -= 1
+                if counts[i] == 0:
+                    ready(i)
+
+    # render maps with map tiles skipped by the downloader anyway
+    for i, n in enumerate(counts):
+        if n > 0:
+            ready(i)
+
+def _render(cache_dir, placeholder, spec):
+    """
+    Render map image using map tiles from file system cache.
+
+    The map image is stored in shared memory. Name of the shared memory
+    block, image data length, image mode, image size and the map tiles
+    missing in the map image are returned.
+
+    :param cache_dir: Map tiles cache directory.
+    :param placeholder: Tile data used for known missing tiles.
+    :param spec: Map specification.
+    """
+    map = spec_map(spec)
+    tiles = _cached_tiles(map, cache_dir, placeholder)
+    image = asyncio.run(render_image(map, tiles))
+
+    data = image.tobytes()
+    shm = SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[:len(data)] = data
+    finally:
+        shm.close()
+    return (
+        shm.name, len(data), image.mode, image.size,
+        image.info['missing_tiles']
+    )
+
+async def _cached_tiles(map, cache_dir, placeholder):
+    """
+    Create asynchronous generator of map tiles read from file system cache.
+
+    Known missing map tiles are handled like by caching downloader (see
+    :py:func:`geotiler.cache.caching_downloader`).
+
+    :param map: Map instance.
+    :param cache_dir: Map tiles cache directory.
+    :param placeholder: Tile data used for known missing tiles.
+    """
+    for tile in _map_tiles(map):
+        img = fs_get(cache_dir, tile.url)
+        if img is None:
+            tile = tile._replace(error=ValueError('Map tile not in cache'))
+        elif img == MISSING:
+            tile = _missing_tile(tile, placeholder)
+        else:
+            tile = tile._replace(img=img)
+        yield tile
+
+def _release_image(future):
+    """
+    Release shared memory of map image rendered by a worker process, which
+    is not consumed.
+
+    :param future: Future of map image rendering.
+    """
+    if future.cancel():
+        return
+
+    try:
+        name = future.result()[0]
+    except Exception:
+        return
+
+    shm = SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+def _read_image(name, length, mode, size, missing):
+    """
+    Read image from shared memory and release the shared memory.
+
+    The missing map tiles are stored in `missing_tiles` item of the image
+    `info` dictionary.
+
+    :param name: Name of shared memory block.
+    :param length: Length of image data.
+    :param mode: Image mode.
+    :param size: Image size.
+    :param missing: Map tiles missing in the image.
+    """
+    shm = SharedMemory(name=name)
+    try:
+        buf = shm.buf[:length]
+        image = PIL.Image.frombytes(mode, size, buf)
+        buf.release()
+    finally:
+        shm.close()
+        shm.unlink()
+    image.info['missing_tiles'] = missing
+    return image
+
+# vim: sw=4:et:ai
@@ -0,0 +1,241 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Render sequences of map images, i.e. frames of map animation or video.
+
+Map tiles needed by the frames are downloaded window by window. A decoded
+map tile image is kept in memory until the last frame, which needs it, is
+rendered.
+"""
+
+import copy
+import logging
+
+from .loop import run_sync
+from .map import _map_tiles
+from .tile.io import fetch_tiles as _fetch_tiles
+from .tile.img import CanvasPool, _missing_image, _new_image, _tile_image
+
+logger = logging.getLogger(__name__)
+
+def frame_maps(map, positions):
+    """
+    Create maps of frames of map animation.
+
+    Each position is a tuple `(lon, lat)` or `(lon, lat, zoom)`. A map of
+    a frame is copy of the map with center (and zoom) set to the position.
+
+    Generator of maps is returned.
+
+    :param map: Map instance.
+    :param positions: Collection of positions, i.e. points of a track.
+    """
+    for pos in positions:
+        m = copy.copy(map)
+        if len(pos) > 2:
+            m.zoom = pos[2]
+        m.center = pos[:2]
+        yield m
+
+def keyframe_positions(keyframes, steps):
+    """
+    Interpolate positions between keyframes linearly.
+
+    Each keyframe is a tuple `(lon, lat, zoom)`. There are `steps`
+    positions from a keyframe to the next keyframe. The last keyframe is
+    the last position.
+
+    Generator of positions is returned.
+
+    :param keyframes: Collection of keyframes.
+    :param steps: Number of positions between keyframes.
+    """
+    keyframes = list(keyframes)
+    for k1, k2 in zip(keyframes, keyframes[1:]):
+        for i in range(steps):
+            t = i / steps
+            yield tuple(v1 + (v2 - v1) * t for v1, v2 in zip(k1, k2))
+    if keyframes:
+        yield tuple(keyframes[-1])
+
+def render_frames(
+        maps, downloader=None, window=16, resample=None, mode='RGBA', **kw
+    ):
+    """
+    Render map images of a sequence of maps.
+
+    Map tiles of next `window` frames are downloaded with one call of the
+    downloader. Map tile image is decoded once and kept in memory until
+    the last frame, which needs it, is rendered.
+
+    Generator of map images (instances of `PIL.Image` class) is returned.
+    A map image is reused to render next frame of the same size, so it is
+    valid until next map image is requested from the generator. Use
+    :py:func:`write_images` or :py:func:`write_raw` to store the frames.
+
+    :param maps: Collection of maps.
+    :param downloader: Map tiles downloader.
+    :param window: Number of frames, for which map tiles are downloaded at
+        once.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB` or `L`.
+    :param kw: Parameters passed to the downloader.
+    """
+    if downloader is None:
+        downloader = _fetch_tiles
+    if mode == 'P':
+        raise ValueError('Frames rendering does not support P mode')
+
+    maps = list(maps)
+    layouts = [list(_map_tiles(m)) for m in maps]
+
+    # index of last frame, which needs a map tile
+    last = {t.url: i for i, tiles in enumerate(layouts) for t in tiles}
+
+    pool = CanvasPool(size=1)
+    images = {}
+    for start in range(0, len(maps), window):
+        items = list(zip(maps, layouts))[start:start + window]
+        data = _fetch_window(items, images, downloader, **kw)
+
+        for i, (map, tiles) in enumerate(items, start):
+            image = pool.get(map.size, mode)
+            image, error = _new_image(map, mode, image)
+            for tile in tiles:
+                _paste_frame_tile(image, tile, images, data, error, resample)
+            for tile in tiles:
+                if last[tile.url] == i:
+                    images.pop(tile.url, None)
+                    data.pop(tile.url, None)
+
+            yield image
+            pool.put(image)
+
+        if __debug__:
+            logger.debug('decoded tiles in memory: {}'.format(len(images)))
+
+def write_images(frames, path):
+    """
+    Save frames as sequence of image files.
+
+    The path is a format string receiving frame number, i.e.
+    `frame-{:05d}.png`. Image file format is determined by path
+    extension.
+
+    Number of saved frames is returned.
+
+    :param frames: Collection of frames.
+    :param path: Format string of path of image file.
+    """
+    n = 0
+    for n, image in enumerate(frames, 1):
+        image.save(path.format(n - 1))
+    return n
+
+def write_raw(frames, f):
+    """
+    Write raw data of frames into a binary file.
+
+    The file can be a pipe, i.e. standard input of `ffmpeg -f rawvideo
+    -pix_fmt rgba -s WxH -i -` command.
+
+    Number of written frames is returned.
+
+    :param frames: Collection of frames.
+    :param f: Binary file object.
+    """
+    n = 0
+    for n, image in enumerate(frames, 1):
+        f.write(image.tobytes())
+    return n
+
+def _fetch_window(items, images, downloader, **kw):
+    """
+    Download map tiles of a window of frames.
+
+    Map tiles already decoded are not downloaded again. Dictionary of
+    map tile URL and map tile is returned.
+
+    :param items: Collection of maps and their map tiles.
+    :param images: Decoded map tile images.
+    :param downloader: Map tiles downloader.
+    :param kw: Parameters passed to the downloader.
+    """
+    groups = {}
+    for map, tiles in items:
+        limit, pending = groups.setdefault(
+            map.provider.id, (map.provider.limit, {})
+        )
+        pending.update((t.url, t) for t in tiles if t.url not in images)
+
+    async def fetch():
+        result = {}
+        for limit, tiles in groups.values():
+            if __debug__:
+                logger.debug('fetching {} tiles'.format(len(tiles)))
+            async for t in downloader(tiles.values(), limit, **kw):
+                result[t.url] = t
+        return result
+
+    return run_sync(fetch())
+
+def _paste_frame_tile(image, tile, images, data, error, resample):
+    """
+    Paste map tile into map image of a frame.
+
+    Map tile image is decoded on first use and stored in the dictionary
+    of decoded map tile images.
+
+    :param image: Map image.
+    :param tile: Map tile of the frame.
+    :param images: Decoded map tile images.
+    :param data: Downloaded map tiles.
+    :param error: Error tile image.
+    :param resample: Resampling filter.
+    """
+    img = images.get(tile.url)
+    if img is None:
+        t = data.get(tile.url)
+        if t is not None and t.img:
+            img = images[tile.url] = _tile_image(t.img, mode=image.mode)
+            img.load()
+            del data[tile.url]
+
+    if img is None:
+        img = _missing_image(data.get(tile.url), error)
+        image.info['missing_tiles'].append(tile)
+
+    offset = tile.offset
+    if len(offset) == 4:
+        size = offset[2] - offset[0], offset[3] - offset[1]
+        if img.size != size:
+            img = img.resize(size, resample)
+    image.paste(img, offset)
+
+# vim: sw=4:et:ai
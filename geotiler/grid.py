@@ -0,0 +1,299 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Array based grid of map tiles.
+
+Coordinates and offsets of map tiles are stored in NumPy arrays. URLs of
+map tiles and `Tile` objects are created on demand, i.e. batch by batch
+by a map tiles downloader. This allows to process very large maps and
+seed map tiles cache without creating Python object for each map tile
+up front.
+
+The module requires NumPy library.
+"""
+
+import itertools
+import math
+
+import numpy as np
+
+from .geo import zoom_to
+from .map import Map, Tile, _find_top_left_tile, _tile_zoom
+from .provider import _compile_url
+
+class TileGrid:
+    """
+    Grid of map tiles at integer zoom level.
+
+    :var provider: Map provider.
+    :var zoom: Zoom level of map tiles.
+    :var coords: Array of tile coordinates, `(n, 2)` shape.
+    :var offsets: Array of tile offsets, `(n, 2)` or `(n, 4)` shape, or
+        null.
+    """
+    def __init__(self, provider, zoom, coords, offsets=None):
+        """
+        Create grid of map tiles.
+
+        :param provider: Map provider.
+        :param zoom: Zoom level of map tiles.
+        :param coords: Array of tile coordinates.
+        :param offsets: Array of tile offsets.
+        """
+        self.provider = provider
+        self.zoom = zoom
+        self.coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+        self.offsets = None if offsets is None \
+            else np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_map(cls, map):
+        """
+        Create grid of map tiles of a map.
+
+        The grid has the same tiles as map tiles downloaded by
+        :py:func:`geotiler.fetch_tiles` function.
+
+        :param map: Map instance.
+        """
+        zoom = _tile_zoom(map.zoom, map.provider.max_zoom)
+        if zoom == map.zoom:
+            return cls(map.provider, zoom, *_grid_arrays(map, zoom))
+        else:
+            return cls(map.provider, zoom, *_scaled_arrays(map, zoom))
+
+    @classmethod
+    def from_extent(cls, provider, extent, zoom):
+        """
+        Create grid of map tiles covering geographical extent.
+
+        The map tiles have no offsets. Use the grid to seed map tiles
+        cache.
+
+        :param provider: Map provider.
+        :param extent: Geographical extent `(lon1, lat1, lon2, lat2)`.
+        :param zoom: Integer zoom level.
+        """
+        projection = provider.projection
+        lon1, lat1, lon2, lat2 = extent
+        c1 = projection.rev_geocode((lon1, lat2))
+        c1 = zoom_to(c1, projection.zoom, zoom)
+        c2 = projection.rev_geocode((lon2, lat1))
+        c2 = zoom_to(c2, projection.zoom, zoom)
+
+        n = 2 ** zoom - 1
+        x1, y1 = (min(max(int(v), 0), n) for v in c1)
+        x2, y2 = (min(max(int(v), 0), n) for v in c2)
+
+        cols = np.arange(x1, x2 + 1, dtype=np.int64)
+        rows = np.arange(y1, y2 + 1, dtype=np.int64)
+        coords = np.stack(np.meshgrid(cols, rows, indexing='ij'), -1)
+        return cls(provider, zoom, coords)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, index):
+        """
+        Get grid of subset of map tiles.
+
+        :param index: Slice, integer array or boolean mask.
+        """
+        if isinstance(index, int):
+            index = slice(index, index + 1 if index != -1 else None)
+        offsets = None if self.offsets is None else self.offsets[index]
+        return TileGrid(self.provider, self.zoom, self.coords[index], offsets)
+
+    def keys(self):
+        """
+        Get array of unique keys of map tiles at the grid zoom level.
+        """
+        return self.coords[:, 1] * 2 ** self.zoom + self.coords[:, 0]
+
+    def urls(self, template=None):
+        """
+        Get array of URLs of map tiles.
+
+        :param template: URL template of a mirror of map provider service.
+        """
+        return _tile_urls(self.provider, self.zoom, self.coords, template)
+
+    def difference(self, other):
+        """
+        Get grid of map tiles, which are not in the other grid.
+
+        :param other: Grid of map tiles.
+        """
+        self._check(other)
+        return self[~np.isin(self.keys(), other.keys())]
+
+    def union(self, other):
+        """
+        Get grid of map tiles of this grid and the other grid.
+
+        The map tiles of the other grid, which are in this grid, are
+        skipped. Offsets of map tiles are kept if both grids have offsets
+        of the same kind.
+
+        :param other: Grid of map tiles.
+        """
+        other = other.difference(self)
+        coords = np.concatenate([self.coords, other.coords])
+        offsets = None
+        if self.offsets is not None and other.offsets is not None \
+                and self.offsets.shape[1:] == other.offsets.shape[1:]:
+            offsets = np.concatenate([self.offsets, other.offsets])
+        return TileGrid(self.provider, self.zoom, coords, offsets)
+
+    def batches(self, size=1024):
+        """
+        Split the grid into grids of at most `size` map tiles.
+
+        :param size: Maximum number of map tiles in a batch.
+        """
+        for i in range(0, len(self), size):
+            yield self[i:i + size]
+
+    def tiles(self, size=1024):
+        """
+        Create map tiles batch by batch.
+
+        The result can be passed to a map tiles downloader.
+
+        Generator of map tiles without tile data is returned.
+
+        :param size: Number of map tiles created at once.
+        """
+        for batch in self.batches(size):
+            urls = batch.urls().tolist()
+            if batch.offsets is None:
+                offsets = [None] * len(urls)
+            else:
+                offsets = map(tuple, batch.offsets.tolist())
+            mirrors = [batch.urls(m).tolist() for m in batch.provider.mirrors]
+            mirrors = zip(*mirrors) if mirrors else itertools.repeat(())
+            items = zip(urls, offsets, mirrors)
+            yield from (Tile(u, o, None, None, m) for u, o, m in items)
+
+    def _check(self, other):
+        # copies of a map provider are the same map provider
+        key = lambda p: (p.url, p.extension, p.api_key)
+        if self.zoom != other.zoom or key(self.provider) != key(other.provider):
+            raise ValueError('Grids of different zoom or map provider')
+
+def _grid_arrays(map, zoom):
+    """
+    Create arrays of coordinates and offsets of map tiles of a map at
+    integer zoom level.
+
+    :param map: Map instance.
+    :param zoom: Integer zoom level of the map.
+
+    .. seealso:: :py:func:`geotiler.map._grid_tiles`
+    """
+    w, h = map.size
+    tw = map.provider.tile_width
+    th = map.provider.tile_height
+    coord, offset = _find_top_left_tile(map)
+
+    cols = np.arange(offset[0], w, tw, dtype=np.int64)
+    rows = np.arange(offset[1], h, th, dtype=np.int64)
+    offsets = np.stack(np.meshgrid(cols, rows, indexing='ij'), -1)
+    offsets = offsets.reshape(-1, 2)
+
+    coords = (offsets - offset) // (tw, th) + coord
+    coords[:, 0] %= 2 ** zoom
+
+    bounds = map.provider.tile_bounds(zoom)
+    if bounds is None:
+        mask = np.zeros(len(coords), dtype=bool)
+    else:
+        x0, y0, x1, y1 = bounds
+        mask = (coords[:, 0] >= x0) & (coords[:, 0] <= x1) \
+            & (coords[:, 1] >= y0) & (coords[:, 1] <= y1)
+    return coords[mask], offsets[mask]
+
+def _scaled_arrays(map, zoom):
+    """
+    Create arrays of coordinates and boxes of map tiles of a map at
+    fractional zoom level.
+
+    :param map: Map instance.
+    :param zoom: Integer zoom level of the map tiles.
+
+    .. seealso:: :py:func:`geotiler.map._scaled_tiles`
+    """
+    scale = 2 ** (map.zoom - zoom)
+    w, h = map.size
+
+    size = math.ceil(w / scale) + 2, math.ceil(h / scale) + 2
+    source = Map(center=map.center, zoom=zoom, size=size, provider=map.provider)
+    coords, offsets = _grid_arrays(source, zoom)
+
+    tw = map.provider.tile_width
+    th = map.provider.tile_height
+    center = np.array(source.rev_geocode(map.center))
+    half = np.array([w / 2, h / 2])
+    p1 = np.round((offsets - center) * scale + half)
+    p2 = np.round((offsets + (tw, th) - center) * scale + half)
+    boxes = np.concatenate([p1, p2], axis=1).astype(np.int64)
+
+    mask = (boxes[:, 0] < boxes[:, 2]) & (boxes[:, 1] < boxes[:, 3]) \
+        & (boxes[:, 2] > 0) & (boxes[:, 3] > 0) \
+        & (boxes[:, 0] < w) & (boxes[:, 1] < h)
+    return coords[mask], boxes[mask]
+
+def _tile_urls(provider, zoom, coords, template=None):
+    """
+    Create array of URLs of map tiles.
+
+    The URLs are created with compiled URL builder of map provider (see
+    :py:meth:`geotiler.provider.MapProvider.tile_urls`), once for each
+    unique tile coordinates. The first subdomain is used for an URL
+    template of a mirror.
+
+    :param provider: Map provider.
+    :param zoom: Zoom level of map tiles.
+    :param coords: Array of tile coordinates.
+    :param template: URL template of a mirror of map provider service.
+    """
+    if len(coords) == 0:
+        return np.array([], dtype=str)
+
+    keys = coords[:, 1].astype(np.int64) * 2 ** zoom + coords[:, 0]
+    _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    unique = coords[index].tolist()
+    if template is None:
+        urls = provider.tile_urls(unique, zoom)
+    else:
+        build = _compile_url(template, provider.extension, provider.api_key)
+        subdomain = provider.subdomains[0] if provider.subdomains else ''
+        urls = [build(subdomain, x, y, zoom) for x, y in unique]
+    return np.array(urls)[inverse.reshape(-1)]
+
+# vim: sw=4:et:ai
@@ -0,0 +1,155 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Asyncio event loop running in a background thread.
+
+The event loop is used by synchronous GeoTiler API, so it can be used in
+any thread and within an application running its own event loop.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+
+def run_coroutine(coro):
+    """
+    Schedule coroutine in the background event loop.
+
+    Instance of `concurrent.futures.Future` class is returned. The function
+    can be called in any thread, including the thread of the loop.
+
+    :param coro: Coroutine to run.
+
+    .. seealso:: :py:func:`run_sync`
+    """
+    return asyncio.run_coroutine_threadsafe(coro, event_loop())
+
+def run_sync(coro):
+    """
+    Run coroutine in the background event loop and wait for its result.
+
+    Waiting for the result within the thread of the loop would block the
+    loop forever, so `RuntimeError` is raised in such case.
+
+    :param coro: Coroutine to run.
+    """
+    loop = event_loop()
+    if is_loop_thread():
+        coro.close()
+        raise RuntimeError(
+            'Cannot wait for a coroutine within the background event loop'
+        )
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+def is_loop_thread():
+    """
+    Check if current thread is the thread of the background event loop.
+    """
+    return _thread is not None and threading.current_thread() is _thread
+
+def event_loop():
+    """
+    Get the background event loop.
+
+    The event loop and its thread are started on first call.
+    """
+    global _loop, _thread
+
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_run, args=(_loop,), name='geotiler-loop', daemon=True
+            )
+            _thread.start()
+
+            if __debug__:
+                logger.debug('background event loop started')
+
+    return _loop
+
+def _run(loop):
+    """
+    Run event loop forever.
+
+    :param loop: Event loop to run.
+    """
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+def shutdown():
+    """
+    Stop the background event loop.
+
+    HTTP client session of the loop is closed. The function is called at
+    exit of the process. The loop is started again on next call of
+    :py:func:`event_loop`.
+    """
+    global _loop, _thread
+
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+
+    if loop is None:
+        return
+
+    from .tile.io import close_session
+    try:
+        asyncio.run_coroutine_threadsafe(close_session(), loop).result()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    if __debug__:
+        logger.debug('background event loop stopped')
+
+def _reset():
+    """
+    Reset the background event loop in a forked process, which does not
+    inherit thread of the loop.
+    """
+    global _lock, _loop, _thread
+    _lock = threading.Lock()
+    _loop = None
+    _thread = None
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_reset)
+
+# vim: sw=4:et:ai
@@ -30,6 +30,7 @@ GeoTiler map functionality.
 """
 
 import asyncio
+import copy
 import itertools
 import math
 import numbers
@@ -39,15 +40,20 @@ from collections import namedtuple
 
 from .provider import DEFAULT_PROVIDER, find_provider, MapProvider
 from .geo import zoom_to
+from .loop import run_coroutine, run_sync
 from .tile.io import fetch_tiles as _fetch_tiles
-from .tile.img import render_image
+from .tile.img import render_image, render_image_progressive, \
+    render_layers_image, encode_image, image_format, downsample_image, \
+    FORMATS, _finish_image
 from .util import div_ceil
 
 logger = logging.getLogger(__name__)
 
 MAX_ZOOM = 25
 
-Tile = namedtuple('Tile', ['url', 'offset', 'img', 'error'])
+Tile = namedtuple(
+    'Tile', ['url', 'offset', 'img', 'error', 'mirrors'], defaults=[()]
+)
 Tile.__doc__ = """
 Map tile.
 
@@ -59,6 +65,7 @@ error.
 :var offset: Tile offest in a map image.
 :var img: Tile image data.
 :var error: Tile error information.
+:var mirrors: URLs of the tile at mirrors of map provider service.
 """
 
 class Map:
@@ -77,7 +84,8 @@ class Map:
     """
     def __init__(
         self, extent=None, center=None, zoom=None, size=None,
-        provider: tp.Union[str, MapProvider]=DEFAULT_PROVIDER
+        provider: tp.Union[str, MapProvider]=DEFAULT_PROVIDER,
+        exact: bool=False
     ) -> None:
         """
         Create map.
@@ -91,11 +99,18 @@ class Map:
         If none of above parameters combination is provided, then `ValueError`
         exception is raised.
 
+        When map is created with extent and size, then integer zoom is
+        calculated, so the extent fits into the map image. If `exact` is
+        true, then fractional zoom is calculated to fit the extent into the
+        map image exactly.
+
         :param extent: Map geographical extent.
         :param center: Map geographical center.
         :param zoom: Map zoom.
         :param size: Map image size.
         :param provider: Map tiles provider.
+        :param exact: Fit extent into map image exactly with fractional
+            zoom.
         """
         super().__init__()
 
@@ -124,7 +139,7 @@ class Map:
         elif center is not None and zoom is not None and size is not None:
             self._change_center_zoom(center, zoom)
         elif extent is not None and size is not None:
-            self._change_extent_and_zoom(extent)
+            self._change_extent_and_zoom(extent, exact)
         elif extent is not None and zoom is not None:
             self.extent = extent
         else:
@@ -217,6 +232,10 @@ class Map:
         """
         Map zoom value.
 
+        Map zoom can be fractional. Map tiles for such map are downloaded
+        at the next integer zoom level and resampled when map image is
+        rendered.
+
         Setting map value does *not* affect any other map properties like
         extent, center or image size.
         """
@@ -274,19 +293,22 @@ class Map:
         self._zoom = zoom
 
 
-    def _change_extent_and_zoom(self, extent):
+    def _change_extent_and_zoom(self, extent, exact=False):
         """
         Recalculate map to have new geographical extent and calculate map
         zoom.
 
         :param extent: Map geographical extent.
+        :param exact: Calculate fractional zoom to fit the extent exactly.
         """
         width, height = self._size
 
         p1 = extent[:2]
         p2 = extent[2:]
 
-        map_origin, map_offset, zoom = calculateMapExtent(self.provider, width, height, p1, p2)
+        map_origin, map_offset, zoom = calculateMapExtent(
+            self.provider, width, height, p1, p2, exact=exact
+        )
         self.origin = map_origin
         self.offset = map_offset
         self._zoom = zoom
@@ -354,7 +376,10 @@ class Map:
         return location
 
 
-def render_map(map, tiles=None, downloader=None, **kw):
+def render_map(
+        map, tiles=None, downloader=None, resample=None, mode='RGBA',
+        image=None, **kw
+    ):
     """
     Download map tiles and render map image.
 
@@ -366,16 +391,62 @@ def render_map(map, tiles=None, downloader=None, **kw):
 
     The function returns an image (instance of `PIL.Image` class).
 
+    The function is thread safe, see :py:func:`geotiler.render_map_future`.
+
     :param map: Map instance.
     :param tiles: Optional map tiles.
     :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param image: Optional image to render map into (see
+        :py:func:`geotiler.tile.img.render_image`).
     :param kw: Parameters passed to the downloader.
     """
-    task = render_map_async(map, downloader=downloader, **kw)
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(task)
+    task = render_map_async(
+        copy.copy(map), tiles=tiles, downloader=downloader,
+        resample=resample, mode=mode, image=image, **kw
+    )
+    return run_sync(task)
+
+def render_map_future(
+        map, tiles=None, downloader=None, resample=None, mode='RGBA',
+        image=None, **kw
+    ):
+    """
+    Download map tiles and render map image in the background.
+
+    The map is rendered by asyncio event loop running in a background
+    thread, which is shared by all threads of an application. Therefore,
+    the function can be called from any thread and within an application
+    running its own event loop.
+
+    The function returns future (instance of `concurrent.futures.Future`
+    class) of an image (instance of `PIL.Image` class).
 
-async def render_map_async(map, tiles=None, downloader=None, **kw):
+    The map object is copied, so it can be changed while the map image is
+    rendered.
+
+    :param map: Map instance.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param image: Optional image to render map into (see
+        :py:func:`geotiler.tile.img.render_image`).
+    :param kw: Parameters passed to the downloader.
+    """
+    task = render_map_async(
+        copy.copy(map), tiles=tiles, downloader=downloader,
+        resample=resample, mode=mode, image=image, **kw
+    )
+    return run_coroutine(task)
+
+async def render_map_async(
+        map, tiles=None, downloader=None, resample=None, mode='RGBA',
+        image=None, **kw
+    ):
     """
     Asyncio coroutine to download map tiles asynchronously and render map
     image.
@@ -391,12 +462,355 @@ async def render_map_async(map, tiles=None, downloader=None, **kw):
     :param map: Map instance.
     :param tiles: Optional map tiles.
     :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param image: Optional image to render map into (see
+        :py:func:`geotiler.tile.img.render_image`).
     :param kw: Parameters passed to the downloader.
     """
     if not tiles:
         tiles = fetch_tiles(map, downloader, **kw)
         tiles = (t async for t in tiles)
-    return await render_image(map, tiles)
+    return await render_image(
+        map, tiles, resample=resample, mode=mode, image=image
+    )
+
+async def render_map_progressive(
+        map, tiles=None, downloader=None, rate=None, resample=None,
+        mode='RGBA', image=None, **kw
+    ):
+    """
+    Download map tiles asynchronously and render map image progressively.
+
+    Asynchronous generator of tuples is returned. Each tuple contains the
+    map image (instance of `PIL.Image` class) and the list of rectangles
+    of the map image, which changed since the previous tuple was yielded.
+    The same image object is yielded each time, so it can be drawn as soon
+    as first tiles arrive.
+
+    If tiles are specified, then the provided tiles are used to render map.
+    Otherwise, map tiles are downloaded from map provider.
+
+    If `downloader` is null, then default map tiles downloader is used
+    (:py:func:`geotiler.tile.io.fetch_tiles`).
+
+    :param map: Map instance.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param rate: Maximum number of map image updates per second.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB` or `L`.
+    :param image: Optional image to render map into (see
+        :py:func:`geotiler.tile.img.render_image`).
+    :param kw: Parameters passed to the downloader.
+
+    .. seealso:: :py:func:`geotiler.tile.img.render_image_progressive`
+    """
+    if not tiles:
+        tiles = fetch_tiles(map, downloader, **kw)
+    images = render_image_progressive(
+        map, tiles, rate=rate, resample=resample, mode=mode, image=image
+    )
+    async for image, boxes in images:
+        yield image, boxes
+
+def render_map_encoded(
+        map, format='png', quality=None, tiles=None, downloader=None,
+        resample=None, **kw
+    ):
+    """
+    Download map tiles, render map image and encode it.
+
+    The function is thread safe, see :py:func:`geotiler.render_map_future`.
+
+    :param map: Map instance.
+    :param format: Image format, one of `png`, `jpg`, `jpeg` or `webp`.
+    :param quality: Quality of image for JPEG and WebP formats.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param kw: Parameters passed to the downloader.
+
+    .. seealso:: :py:func:`geotiler.render_map_async_encoded`
+    """
+    task = render_map_async_encoded(
+        copy.copy(map), format=format, quality=quality, tiles=tiles,
+        downloader=downloader, resample=resample, **kw
+    )
+    return run_sync(task)
+
+async def render_map_async_encoded(
+        map, format='png', quality=None, tiles=None, downloader=None,
+        resample=None, **kw
+    ):
+    """
+    Asyncio coroutine to download map tiles asynchronously, render map
+    image and encode it in PNG, JPEG or WebP format.
+
+    The map image is encoded with the default executor of the event loop,
+    so the event loop is not blocked.
+
+    If map image is exactly one map tile, and the map tile has format
+    of the map image, then the map tile data is returned without decoding
+    and encoding.
+
+    The function returns encoded image data (`bytes` object).
+
+    :param map: Map instance.
+    :param format: Image format, one of `png`, `jpg`, `jpeg` or `webp`.
+    :param quality: Quality of image for JPEG and WebP formats.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param kw: Parameters passed to the downloader.
+    """
+    fmt = image_format(format)
+    if not tiles and _is_tile_format(map, fmt):
+        tiles = [t async for t in fetch_tiles(map, downloader, **kw)]
+        if tiles[0].img:
+            if __debug__:
+                logger.debug('map tile {} passed through'.format(tiles[0].url))
+            return bytes(tiles[0].img)
+        tiles = _tile_generator(tiles)
+
+    mode = 'RGB' if fmt == 'JPEG' else 'RGBA'
+    image = await render_map_async(
+        map, tiles=tiles, downloader=downloader, resample=resample,
+        mode=mode, **kw
+    )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, encode_image, image, format, quality
+    )
+
+def render_map_sizes(
+        map, sizes, tiles=None, downloader=None, resample=None, mode='RGBA',
+        **kw
+    ):
+    """
+    Download map tiles, render map image and downsample it to multiple
+    sizes.
+
+    The function is thread safe, see :py:func:`geotiler.render_map_future`.
+
+    :param map: Map instance.
+    :param sizes: Collection of map image sizes.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+
+    .. seealso:: :py:func:`geotiler.render_map_async_sizes`
+    """
+    task = render_map_async_sizes(
+        copy.copy(map), sizes, tiles=tiles, downloader=downloader,
+        resample=resample, mode=mode, **kw
+    )
+    return run_sync(task)
+
+async def render_map_async_sizes(
+        map, sizes, tiles=None, downloader=None, resample=None, mode='RGBA',
+        **kw
+    ):
+    """
+    Asyncio coroutine to download map tiles asynchronously, render map
+    image and downsample it to multiple sizes.
+
+    Map tiles are downloaded and map image is rendered once, at the size
+    of the map. The map image is downsampled to each size with area
+    averaging (see :py:func:`geotiler.tile.img.downsample_image`) using
+    the default executor of the event loop. A size cannot be larger than
+    the size of the map. Create the map with the largest size, i.e.
+    `Map(extent=extent, size=(1920, 1080))`, and request smaller sizes of
+    the same aspect ratio.
+
+    List of images (instances of `PIL.Image` class) is returned, one for
+    each size.
+
+    :param map: Map instance.
+    :param sizes: Collection of map image sizes.
+    :param tiles: Optional map tiles.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+    """
+    sizes = [tuple(s) for s in sizes]
+    width, height = map.size
+    if any(w > width or h > height for w, h in sizes):
+        raise ValueError('Map image size larger than map size')
+
+    # downsample in RGB(A) mode and quantize images in P mode at the end
+    image = await render_map_async(
+        map, tiles=tiles, downloader=downloader, resample=resample,
+        mode='RGB' if mode == 'P' else mode, **kw
+    )
+    loop = asyncio.get_running_loop()
+    images = await loop.run_in_executor(None, _downsample, image, sizes, mode)
+    return images
+
+def render_map_region(
+        map, box, downloader=None, resample=None, mode='RGBA', **kw
+    ):
+    """
+    Download map tiles and render region of map image.
+
+    The function is thread safe, see :py:func:`geotiler.render_map_future`.
+
+    :param map: Map instance.
+    :param box: Region of map image `(x0, y0, x1, y1)`.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+
+    .. seealso:: :py:func:`geotiler.render_map_async_region`
+    """
+    task = render_map_async_region(
+        copy.copy(map), box, downloader=downloader, resample=resample,
+        mode=mode, **kw
+    )
+    return run_sync(task)
+
+async def render_map_async_region(
+        map, box, downloader=None, resample=None, mode='RGBA', **kw
+    ):
+    """
+    Asyncio coroutine to download map tiles asynchronously and render
+    region of map image.
+
+    The region is a rectangle `(x0, y0, x1, y1)` of map image, i.e. an
+    area of a map widget to repaint. It is clipped to the map image. Only
+    the map tiles intersecting the region are downloaded and rendered.
+
+    The function returns an image (instance of `PIL.Image` class) of the
+    size of the region. Pixel `(x0, y0)` of map image is pixel `(0, 0)` of
+    the region image.
+
+    :param map: Map instance.
+    :param box: Region of map image `(x0, y0, x1, y1)`.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+    """
+    if downloader is None:
+        downloader = _fetch_tiles
+
+    width, height = map.size
+    x0, y0, x1, y1 = box
+    x0, y0 = max(x0, 0), max(y0, 0)
+    x1, y1 = min(x1, width), min(y1, height)
+    if x0 >= x1 or y0 >= y1:
+        raise ValueError('Empty region of map image: {}'.format(box))
+
+    tiles = _region_tiles(map, (x0, y0, x1, y1))
+    tiles = _fetch_unique(downloader, tiles, map.provider.limit, **kw)
+
+    region = copy.copy(map)
+    region.size = x1 - x0, y1 - y0
+    return await render_image(region, tiles, resample=resample, mode=mode)
+
+def render_map_layers(
+        map, providers, downloader=None, resample=None, mode='RGBA', **kw
+    ):
+    """
+    Download map tiles of multiple map layers and render map image.
+
+    The function is thread safe, see :py:func:`geotiler.render_map_future`.
+
+    :param map: Map instance.
+    :param providers: Collection of map providers of map layers.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+
+    .. seealso:: :py:func:`geotiler.render_map_layers_async`
+    """
+    task = render_map_layers_async(
+        copy.copy(map), providers, downloader=downloader,
+        resample=resample, mode=mode, **kw
+    )
+    return run_sync(task)
+
+async def render_map_layers_async(
+        map, providers, downloader=None, resample=None, mode='RGBA', **kw
+    ):
+    """
+    Asyncio coroutine to download map tiles of multiple map layers and
+    render map image.
+
+    Each map layer is defined by a map provider (identificator or object).
+    The first layer is the bottom layer. The map provider of the map
+    instance defines the geometry of map tiles only. All map providers
+    need to have the same size of map tiles.
+
+    Map tiles of all layers are downloaded with one call of the
+    downloader, and then alpha composited tile by tile into map image.
+
+    If `downloader` is null, then default map tiles downloader is used
+    (:py:func:`geotiler.tile.io.fetch_tiles`). The number of workers used
+    by the downloader is the lowest download limit of the map providers.
+
+    The function returns an image (instance of `PIL.Image` class).
+
+    :param map: Map instance.
+    :param providers: Collection of map providers of map layers.
+    :param downloader: Map tiles downloader.
+    :param resample: Resampling filter used for fractional zoom (see
+        `PIL.Image.resize`).
+    :param mode: Map image mode, one of `RGBA`, `RGB`, `L` or `P`.
+    :param kw: Parameters passed to the downloader.
+    """
+    if downloader is None:
+        downloader = _fetch_tiles
+
+    providers = [
+        p if isinstance(p, MapProvider) else find_provider(p)
+        for p in providers
+    ]
+    size = map.provider.tile_width, map.provider.tile_height
+    if any((p.tile_width, p.tile_height) != size for p in providers):
+        raise ValueError('Map providers have different size of map tiles')
+
+    # number of layers for each tile offset; a map provider might not
+    # have tiles for all offsets
+    # the layers are tracked for each map tile URL, so layers using the
+    # same map tile URL share the map tile
+    layers = {}
+    depth = {}
+    tiles = {}
+    for i, provider in enumerate(providers):
+        m = copy.copy(map)
+        m.provider = provider
+        for t in _map_tiles(m):
+            indexes = layers.setdefault(t.url, [])
+            if i not in indexes:
+                indexes.append(i)
+            depth[t.offset] = depth.get(t.offset, 0) + 1
+            tiles.setdefault((t.url, t.offset), t)
+    tiles = list(tiles.values())
+
+    # tiles ordered by offset, so all layers of a tile arrive together
+    order = {o: k for k, o in enumerate(depth)}
+    tiles.sort(key=lambda t: order[t.offset])
+
+    limit = min(p.limit for p in providers)
+    tiles = _fetch_unique(downloader, tiles, limit, **kw)
+    return await render_layers_image(
+        map, tiles, layers, resample=resample, mode=mode, depth=depth
+    )
 
 def fetch_tiles(map, downloader=None, **kw):
     """
@@ -404,6 +818,10 @@ def fetch_tiles(map, downloader=None, **kw):
 
     Asynchronous generator of map tiles is returned.
 
+    If map zoom is fractional, then map tiles are fetched at the next
+    integer zoom level and tile offset is a box `(x0, y0, x1, y1)` of the
+    map image, to which tile image is to be resampled.
+
     :param map: Map instance.
     :param downloader: Map tiles downloader.
     :param kw: Parameters passed to the downloader.
@@ -411,14 +829,192 @@ def fetch_tiles(map, downloader=None, **kw):
     if downloader is None:
         downloader = _fetch_tiles
 
-    tile_url = map.provider.tile_url
+    tiles = _map_tiles(map)
+    return _fetch_unique(downloader, tiles, map.provider.limit, **kw)
+
+async def _fetch_unique(downloader, tiles, num_workers, **kw):
+    """
+    Fetch map tiles with downloader, each map tile URL once.
+
+    Map tiles of the same URL, i.e. wrapped around the world, are yielded
+    for each of their offsets.
+
+    :param downloader: Map tiles downloader.
+    :param tiles: Collection of map tiles.
+    :param num_workers: Number of workers used by the downloader.
+    :param kw: Parameters passed to the downloader.
+    """
+    offsets = {}
+    for t in tiles:
+        offsets.setdefault(t.url, (t, []))[1].append(t.offset)
+
+    unique = [t for t, _ in offsets.values()]
+    async for tile in downloader(unique, num_workers, **kw):
+        for offset in offsets[tile.url][1]:
+            yield tile._replace(offset=offset)
+
+def _downsample(image, sizes, mode):
+    """
+    Downsample map image to multiple sizes.
+
+    :param image: Map image.
+    :param sizes: Collection of map image sizes.
+    :param mode: Map image mode.
+    """
+    missing = image.info['missing_tiles']
+    images = [downsample_image(image, s) for s in sizes]
+    images = [_finish_image(img, mode) for img in images]
+    for img in images:
+        img.info['missing_tiles'] = missing
+    return images
+
+def _is_tile_format(map, fmt):
+    """
+    Check if map image is exactly one map tile in the image format.
+
+    :param map: Map instance.
+    :param fmt: Name of PIL image format.
+    """
+    provider = map.provider
+    size = provider.tile_width, provider.tile_height
+    if tuple(map.size) != size \
+            or FORMATS.get(provider.extension.lower()) != fmt:
+        return False
+
+    tiles = list(_map_tiles(map))
+    return len(tiles) == 1 and tiles[0].offset == (0, 0)
+
+async def _tile_generator(tiles):
+    """
+    Create asynchronous generator of map tiles.
+
+    :param tiles: Collection of map tiles.
+    """
+    for t in tiles:
+        yield t
+
+def _region_tiles(map, box):
+    """
+    Create map tiles intersecting region of map image.
+
+    Tile offsets are relative to the region.
+
+    :param map: Map instance.
+    :param box: Region of map image `(x0, y0, x1, y1)`.
+    """
+    x0, y0, x1, y1 = box
+    tw, th = map.provider.tile_width, map.provider.tile_height
+    for tile in _map_tiles(map):
+        offset = tile.offset
+        if len(offset) == 2:
+            tx0, ty0 = offset
+            tx1, ty1 = tx0 + tw, ty0 + th
+        else:
+            tx0, ty0, tx1, ty1 = offset
+
+        if tx0 < x1 and tx1 > x0 and ty0 < y1 and ty1 > y0:
+            shift = (x0, y0) * (len(offset) // 2)
+            offset = tuple(v - d for v, d in zip(offset, shift))
+            yield tile._replace(offset=offset)
+
+def _map_tiles(map):
+    """
+    Create map tiles without tile data.
+
+    :param map: Map instance.
+    """
+    zoom = _tile_zoom(map.zoom, map.provider.max_zoom)
+    if zoom == map.zoom:
+        return _grid_tiles(map, zoom)
+    else:
+        return _scaled_tiles(map, zoom)
+
+def _grid_tiles(map, zoom):
+    """
+    Create map tiles without tile data for map at integer zoom level.
+
+    Tile columns are wrapped around the world. The map tiles out of the
+    valid range of the map provider are skipped (see
+    :py:meth:`geotiler.provider.MapProvider.tile_bounds`).
 
+    :param map: Map instance.
+    :param zoom: Map zoom as integer.
+    """
+    provider = map.provider
+    bounds = provider.tile_bounds(zoom)
+    if bounds is None:
+        return
+
+    # wrap columns around the world; skip tiles out of the valid range,
+    # the map image is left empty there
+    n = 2 ** zoom
+    x0, y0, x1, y1 = bounds
     coord, offset = _find_top_left_tile(map)
     coords = _tile_coords(map, coord, offset)
     offsets = _tile_offsets(map, offset)
-    urls = (tile_url(c, map.zoom) for c in coords)
-    tiles = (Tile(u, o, None, None) for u, o in zip(urls, offsets))
-    return downloader(tiles, map.provider.limit, **kw)
+    items = (((x % n, y), o) for (x, y), o in zip(coords, offsets))
+    items = [
+        (c, o) for c, o in items if x0 <= c[0] <= x1 and y0 <= c[1] <= y1
+    ]
+
+    # create URL once for each tile coordinates, so a tile wrapped around
+    # the world has the same URL, i.e. subdomain, at all its offsets
+    unique = list(dict.fromkeys(c for c, _ in items))
+    urls = dict(zip(unique, provider.tile_urls(unique, zoom)))
+    mirrors = {c: provider.mirror_urls(c, zoom) for c in unique}
+    for c, o in items:
+        yield Tile(urls[c], o, None, None, mirrors[c])
+
+def _scaled_tiles(map, zoom):
+    """
+    Create map tiles without tile data for map at fractional zoom level.
+
+    The map tiles are created for a map at the integer zoom level. Offset
+    of each tile is a box of map image, to which tile image is resampled.
+    The boxes of adjacent tiles share their edges.
+
+    The map tiles are downscaled if the map zoom is lower than zoom level
+    of map tiles, and upscaled otherwise.
+
+    :param map: Map instance.
+    :param zoom: Integer zoom level of the map tiles.
+    """
+    scale = 2 ** (map.zoom - zoom)
+    w, h = map.size
+
+    # add a pixel on each side to cover rounding of map offset
+    size = math.ceil(w / scale) + 2, math.ceil(h / scale) + 2
+    source = Map(center=map.center, zoom=zoom, size=size, provider=map.provider)
+
+    cx, cy = source.rev_geocode(map.center)
+    fx = lambda x: round((x - cx) * scale + w / 2)
+    fy = lambda y: round((y - cy) * scale + h / 2)
+
+    tw = map.provider.tile_width
+    th = map.provider.tile_height
+    for tile in _grid_tiles(source, zoom):
+        x, y = tile.offset
+        box = fx(x), fy(y), fx(x + tw), fy(y + th)
+        if box[0] < box[2] and box[1] < box[3] \
+                and box[2] > 0 and box[3] > 0 and box[0] < w and box[1] < h:
+            yield tile._replace(offset=box)
+
+def _tile_zoom(zoom, max_zoom=None):
+    """
+    Calculate zoom level of map tiles for a map zoom.
+
+    Integer value is returned. For fractional zoom, the next integer zoom
+    level is returned, so map tiles are downscaled.
+
+    The zoom level is limited by maximum zoom level of map provider. Map
+    tiles are upscaled for map zoom above the maximum zoom level.
+
+    :param zoom: Map zoom.
+    :param max_zoom: Maximum zoom level of map provider.
+    """
+    z = round(zoom)
+    z = int(z) if abs(zoom - z) < 1e-9 else math.ceil(zoom)
+    return z if max_zoom is None else min(z, max_zoom)
 
 def _tile_coords(map, coord, offset):
     """
@@ -495,10 +1091,13 @@ def calculateMapCenter(provider, tile_coord):
 
     return initTileCoord, initPoint
 
-def calculateMapExtent(provider, width, height, *args):
+def calculateMapExtent(provider, width, height, *args, exact=False):
     """ Based on a provider, width & height values, and a list of locations,
         returns the coordinate of an initial tile and its point placement,
         relative to the map center.
+
+        If `exact` is true, then fractional zoom fitting the locations
+        exactly is calculated.
     """
     projection = provider.projection
     coordinates = [projection.rev_geocode(p) for p in args]
@@ -526,6 +1125,8 @@ def calculateMapExtent(provider, width, height, *args):
 
     # initial zoom to fit extent vertically and horizontally
     initZoom = min(hPossibleZoom, vPossibleZoom)
+    if exact:
+        initZoom = projection.zoom - max(hZoomDiff, vZoomDiff)
 
     ## additionally, make sure it's not outside the boundaries set by provider limits
     #initZoom = min(initZoom, provider.outerLimits()[1].zoom)
@@ -0,0 +1,211 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Prefetch map tiles, which are likely to be needed by a moving map.
+"""
+
+import copy
+import logging
+import math
+
+from .map import MAX_ZOOM, _map_tiles, _tile_zoom
+from .tile.io import background, fetch_tiles as _fetch_tiles
+
+logger = logging.getLogger(__name__)
+
+# mean Earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+async def prefetch_tiles(
+        map, downloader=None, margin=1, speed=0, heading=0, horizon=60,
+        zoom=True, num_workers=1, **kw
+    ):
+    """
+    Prefetch map tiles around a map.
+
+    The map tiles are prefetched for
+
+    - the margin ring of tiles around the map
+    - the maps along the projected path of map movement
+    - the map at the next zoom level in and out
+
+    The tiles of the map itself are not prefetched.
+
+    Prefetching makes sense with a caching downloader (see
+    :py:func:`geotiler.cache.caching_downloader`), which puts the
+    prefetched tiles into a cache. If `downloader` is null, then default map
+    tiles downloader is used (:py:func:`geotiler.tile.io.fetch_tiles`).
+
+    The tiles are downloaded in background (see
+    :py:func:`geotiler.tile.io.background`) with low number of workers,
+    which never exceeds map provider limit. Within the background event
+    loop (see :py:mod:`geotiler.loop`), the downloads share HTTP client
+    session and limits of concurrent downloads with map rendering, and
+    yield to downloads of map tiles of rendered maps. Pass the adaptive
+    limiter used for map rendering, if any, as `limiter` parameter.
+
+    Number of successfully prefetched tiles is returned.
+
+    :param map: Map instance.
+    :param downloader: Map tiles downloader.
+    :param margin: Width of margin ring in number of tiles.
+    :param speed: Speed of map movement in meters per second.
+    :param heading: Heading of map movement in degrees, clockwise from
+        north.
+    :param horizon: Time horizon of projected path of map movement in
+        seconds.
+    :param zoom: Prefetch map tiles at the next zoom level in and out if
+        true.
+    :param num_workers: Number of workers used to connect to a map provider
+        service.
+    :param kw: Parameters passed to the downloader.
+    """
+    if downloader is None:
+        downloader = _fetch_tiles
+
+    maps = _prefetch_maps(map, margin, speed * horizon, heading, zoom)
+    tiles = _prefetch_tiles(map, maps)
+
+    if __debug__:
+        logger.debug('prefetching {} tiles'.format(len(tiles)))
+
+    num_workers = min(num_workers, map.provider.limit)
+    with background():
+        result = downloader(tiles, num_workers, **kw)
+        return sum([1 async for t in result if t.img])
+
+def _prefetch_tiles(map, maps):
+    """
+    Create list of unique map tiles of maps, which are not tiles of the
+    map.
+
+    The order of the maps is preserved.
+
+    :param map: Map instance.
+    :param maps: Collection of maps.
+    """
+    seen = {t.url for t in _map_tiles(map)}
+    tiles = []
+    for m in maps:
+        for t in _map_tiles(m):
+            if t.url not in seen:
+                seen.add(t.url)
+                tiles.append(t)
+    return tiles
+
+def _prefetch_maps(map, margin, distance, heading, zoom):
+    """
+    Create maps covering area around a map, which should be prefetched.
+
+    The maps are generated in order of priority
+
+    - map enlarged with the margin ring
+    - maps along the projected path, nearest first
+    - maps at the next zoom level in and out
+
+    :param map: Map instance.
+    :param margin: Width of margin ring in number of tiles.
+    :param distance: Distance of projected path in meters.
+    :param heading: Heading of projected path in degrees.
+    :param zoom: Generate maps at the next zoom level in and out if true.
+    """
+    provider = map.provider
+    w, h = map.size
+
+    if margin > 0:
+        m = copy.copy(map)
+        m.size = (
+            w + 2 * margin * provider.tile_width,
+            h + 2 * margin * provider.tile_height,
+        )
+        yield m
+
+    # move by half of map size at each step of the projected path
+    lon, lat = map.center
+    step = _resolution(map, lat) * min(w, h) / 2
+    n = math.ceil(distance / step) if distance > 0 else 0
+    for i in range(1, n + 1):
+        m = copy.copy(map)
+        m.center = _destination((lon, lat), min(i * step, distance), heading)
+        yield m
+
+    if zoom:
+        zooms = (map.zoom + 1, map.zoom - 1)
+        zooms = (z for z in zooms if _valid_zoom(provider, z))
+        for z in zooms:
+            m = copy.copy(map)
+            m.zoom = z
+            yield m
+
+def _valid_zoom(provider, zoom):
+    """
+    Check if map at a zoom level can be rendered with map tiles of a map
+    provider.
+
+    :param provider: Map provider.
+    :param zoom: Map zoom level.
+    """
+    if not 0 <= zoom <= MAX_ZOOM:
+        return False
+    zoom = _tile_zoom(zoom, provider.max_zoom)
+    return provider.tile_bounds(zoom) is not None
+
+def _resolution(map, lat):
+    """
+    Calculate map resolution in meters per pixel at a latitude.
+
+    :param map: Map instance.
+    :param lat: Latitude.
+    """
+    size = map.provider.tile_width * 2 ** map.zoom
+    return 2 * math.pi * EARTH_RADIUS * math.cos(math.radians(lat)) / size
+
+def _destination(location, distance, heading):
+    """
+    Calculate destination location given start location, distance and
+    heading.
+
+    :param location: Start location (longitude, latitude).
+    :param distance: Distance in meters.
+    :param heading: Heading in degrees, clockwise from north.
+    """
+    lon, lat = math.radians(location[0]), math.radians(location[1])
+    d = distance / EARTH_RADIUS
+    h = math.radians(heading)
+
+    lat2 = math.asin(
+        math.sin(lat) * math.cos(d) + math.cos(lat) * math.sin(d) * math.cos(h)
+    )
+    lon2 = lon + math.atan2(
+        math.sin(h) * math.sin(d) * math.cos(lat),
+        math.cos(d) - math.sin(lat) * math.sin(lat2)
+    )
+    return math.degrees(lon2), math.degrees(lat2)
+
+# vim: sw=4:et:ai
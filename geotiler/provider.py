@@ -30,14 +30,17 @@ Load and create map providers.
 """
 
 import configparser
+import copy
 import glob
-import itertools
 import json
 import logging
 import os.path
+import string
+import threading
 import typing as tp
 
-from .geo import WebMercator
+from .geo import WebMercator, zoom_to
+from .tile.hosts import SubdomainSelector, url_host
 from .errors import GeoTilerError
 from .util import obfuscate
 
@@ -48,7 +51,12 @@ DEFAULT_PROVIDER = 'osm'
 # the attributes inspired by poor-maps project tile source definition
 # https://github.com/otsaloma/poor-maps/tree/master/tilesources
 ATTRIBUTES = 'id', 'name', 'attribution', 'url', 'subdomains', 'extension', \
-    'limit', 'api-key-ref', 'tile-width', 'tile-height'
+    'limit', 'api-key-ref', 'tile-width', 'tile-height', 'min-zoom', \
+    'max-zoom', 'bounds', 'mirrors'
+
+# fields of URL template of map tile, which vary between map tiles, in
+# order of arguments of compiled URL builder
+URL_FIELDS = 'subdomain', 'x', 'y', 'z'
 
 class MapProvider:
     def __init__(self, data: tp.Dict, api_key: tp.Optional[str]=None) -> None:
@@ -63,6 +71,10 @@ class MapProvider:
         self.api_key = api_key
         self.tile_width = 256
         self.tile_height = 256
+        self.min_zoom = 0
+        self.max_zoom: tp.Optional[int] = None
+        self.bounds: tp.Optional[tp.Tuple[float, ...]] = None
+        self.mirrors: tp.Tuple[str, ...] = tuple()
 
         # change a-b-c to a_b_c to allow python attribute access
         norm = lambda n: n.replace('-', '_')
@@ -70,65 +82,282 @@ class MapProvider:
         self.__dict__.update(attrs)
 
         self.projection = WebMercator(0)
-        if self.subdomains:
-            self.subdomain_cycler = itertools.cycle(self.subdomains)
-        else:
-            self.subdomain_cycler = itertools.cycle(('', ))
+        self._builder = None
+        self._builder_key = None
+        subdomains = self.subdomains if self.subdomains else ('',)
+        hosts = [self._host(s) for s in subdomains]
+        self.subdomain_selector = SubdomainSelector(subdomains, hosts)
 
     def tile_url(self, tile_coord, zoom):
+        build = self._url_builder()
+        x, y = tile_coord
+        url = build(next(self.subdomain_selector), x, y, zoom)
+        if __debug__ and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('tile url: {}'.format(obfuscate(url)))
+        return url
+
+    def tile_urls(self, coords, zoom):
+        """
+        Get URLs of map tiles at a zoom level.
+
+        The URL template is compiled once, and subdomains are selected for
+        all map tiles at once. Use it to create URLs of many map tiles.
+
+        :param coords: Collection of tile coordinates.
+        :param zoom: Zoom level of map tiles.
+        """
+        build = self._url_builder()
+        coords = list(coords)
+        subdomains = self.subdomain_selector.take(len(coords))
+        urls = [build(s, x, y, zoom) for s, (x, y) in zip(subdomains, coords)]
+        if __debug__ and logger.isEnabledFor(logging.DEBUG):
+            logger.debug('tile urls: {}'.format(len(urls)))
+        return urls
+
+    def mirror_urls(self, tile_coord, zoom):
+        """
+        Get URLs of a map tile at the mirrors of map provider service.
+
+        The mirrors are used in order of their definition. Subdomain
+        of a mirror URL is the first subdomain of map provider.
+
+        Empty tuple is returned if map provider has no mirrors.
+
+        :param tile_coord: Tile coordinates.
+        :param zoom: Zoom level of map tile.
+        """
+        if not self.mirrors:
+            return ()
         params = {
-            'subdomain': next(self.subdomain_cycler),
+            'subdomain': self.subdomains[0] if self.subdomains else '',
             'x': tile_coord[0],
             'y': tile_coord[1],
             'z': zoom,
             'ext': self.extension,
             'api_key': self.api_key,
         }
-        url = self.url.format(**params)
-        if __debug__:
-            logger.debug('tile url: {}'.format(obfuscate(url)))
-        return url
+        return tuple(m.format(**params) for m in self.mirrors)
+
+    def _url_builder(self):
+        """
+        Get function building URL of a map tile.
+
+        The function is compiled from the URL template on first use, and
+        again when the template, extension or API key change.
+        """
+        key = self.url, self.extension, self.api_key
+        if self._builder_key != key:
+            self._builder = _compile_url(*key)
+            self._builder_key = key
+        return self._builder
+
+    def tile_bounds(self, zoom):
+        """
+        Get range of valid tile coordinates at zoom level.
+
+        The range is tuple `(x0, y0, x1, y1)` of tile coordinates, which
+        includes its bounds. It is limited by the world size at the zoom
+        level, and by geographical bounds of the map provider, if defined.
+
+        If the zoom level is not supported by the map provider, then null
+        is returned.
+
+        :param zoom: Integer zoom level.
+        """
+        if zoom < self.min_zoom \
+                or self.max_zoom is not None and zoom > self.max_zoom:
+            return None
+
+        n = 2 ** zoom - 1
+        if self.bounds is None:
+            return 0, 0, n, n
+
+        projection = self.projection
+        lon1, lat1, lon2, lat2 = self.bounds
+        c1 = projection.rev_geocode((lon1, lat2))
+        c1 = zoom_to(c1, projection.zoom, zoom)
+        c2 = projection.rev_geocode((lon2, lat1))
+        c2 = zoom_to(c2, projection.zoom, zoom)
+
+        clip = lambda v: min(max(int(v), 0), n)
+        return clip(c1[0]), clip(c1[1]), clip(c2[0]), clip(c2[1])
+
+    def _host(self, subdomain):
+        """
+        Get host name of map provider service for a subdomain.
+
+        :param subdomain: Map provider subdomain.
+        """
+        try:
+            url = self.url.format(
+                subdomain=subdomain, x=0, y=0, z=0, ext=self.extension,
+                api_key=self.api_key
+            )
+        except (AttributeError, KeyError, IndexError):
+            return subdomain
+        return url_host(url) or subdomain
 
     def __str__(self):
         return self.name
 
-def providers():
+def _compile_url(url, extension, api_key):
     """
-    Get sorted list of all map providers identificators.
+    Compile URL template of map tile into URL builder.
+
+    Constant fields of the template, i.e. extension and API key, are
+    substituted. The varying fields are converted into positional fields
+    in the order of `URL_FIELDS`. The builder is a function taking
+    subdomain, tile coordinates and zoom as arguments.
+
+    :param url: URL template of map tile.
+    :param extension: Map tile file extension.
+    :param api_key: Map provider API key.
     """
-    path = os.path.join(base_dir(), '*.json')
-    if __debug__:
-        logger.debug('list map providers from {}'.format(path))
-    pid = lambda fn: os.path.splitext(os.path.basename(fn))[0]
-    return sorted(pid(fn) for fn in glob.iglob(path))
+    constants = {'ext': extension, 'api_key': api_key}
+    escape = lambda v: v.replace('{', '{{').replace('}', '}}')
+    parts = []
+    for text, field, spec, conv in string.Formatter().parse(url):
+        parts.append(escape(text))
+        if field is None:
+            continue
 
-def find_provider(id):
+        fmt = (('!' + conv) if conv else '') + ((':' + spec) if spec else '')
+        if field in constants:
+            value = ('{' + fmt + '}').format(constants[field])
+            parts.append(escape(value))
+        elif field in URL_FIELDS:
+            parts.append('{' + str(URL_FIELDS.index(field)) + fmt + '}')
+        else:
+            parts.append('{' + field + fmt + '}')
+    return ''.join(parts).format
+
+class ProviderRegistry:
     """
-    Load map provider data from JSON file and create map provider.
+    Process-wide registry of map providers.
 
-    :param id: Map provider identificator.
+    Map provider identificators, map provider data and GeoTiler
+    configuration are read once. Map providers are created once, and
+    a copy of a map provider is returned on each lookup, so a change of
+    a map provider of one map does not affect other maps. The copies share
+    subdomain selector of the map provider. The registry is thread safe.
+
+    Use :py:meth:`ProviderRegistry.reload` method to read map providers
+    and configuration again.
     """
-    data = read_provider_data(id)
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids: tp.Optional[tp.List[str]] = None
+        self._providers: tp.Dict[str, MapProvider] = {}
+        self._config: tp.Optional[configparser.ConfigParser] = None
 
-    api_key_ref = data.get('api-key-ref')
-    api_key = None
-    if api_key_ref:
-        cp = read_config()
+    def providers(self) -> tp.List[str]:
+        """
+        Get sorted list of all map providers identificators.
+        """
+        with self._lock:
+            if self._ids is None:
+                path = os.path.join(base_dir(), '*.json')
+                if __debug__:
+                    logger.debug('list map providers from {}'.format(path))
+                pid = lambda fn: os.path.splitext(os.path.basename(fn))[0]
+                self._ids = sorted(pid(fn) for fn in glob.iglob(path))
+            return list(self._ids)
 
-        # no api key for the api key reference, then raise fatal error; no
-        # api key means no access
-        if not cp.has_option('api-key', api_key_ref):
-            raise GeoTilerError('No API key for for reference "{}"'.format(api_key_ref))
+    def find(self, id: str) -> MapProvider:
+        """
+        Get copy of map provider.
 
-        api_key = cp.get('api-key', api_key_ref)
+        The map provider is created on first use.
 
-    if __debug__:
-        logger.debug('map provider "{}" api key reference: {}'.format(
-            id, api_key_ref
-        ))
+        :param id: Map provider identificator.
+        """
+        provider = self._providers.get(id)
+        if provider is None:
+            with self._lock:
+                provider = self._providers.get(id)
+                if provider is None:
+                    provider = self._create(id)
+                    self._providers[id] = provider
+        return copy.copy(provider)
+
+    def config(self) -> configparser.ConfigParser:
+        """
+        Get GeoTiler configuration.
+        """
+        with self._lock:
+            if self._config is None:
+                self._config = read_config()
+            return self._config
+
+    def reload(self) -> None:
+        """
+        Forget map providers and configuration, so they are read again
+        on next use.
+        """
+        with self._lock:
+            self._ids = None
+            self._providers = {}
+            self._config = None
+
+        if __debug__:
+            logger.debug('map providers registry reloaded')
+
+    def _create(self, id: str) -> MapProvider:
+        """
+        Load map provider data from JSON file and create map provider.
+
+        :param id: Map provider identificator.
+        """
+        data = read_provider_data(id)
+        data.setdefault('id', id)
+        if 'url' not in data:
+            raise GeoTilerError('No URL of map provider "{}"'.format(id))
+
+        api_key_ref = data.get('api-key-ref')
+        api_key = None
+        if api_key_ref:
+            cp = self.config()
+
+            # no api key for the api key reference, then raise fatal error;
+            # no api key means no access
+            if not cp.has_option('api-key', api_key_ref):
+                raise GeoTilerError('No API key for for reference "{}"'.format(api_key_ref))
+
+            api_key = cp.get('api-key', api_key_ref)
+
+        if __debug__:
+            logger.debug('map provider "{}" api key reference: {}'.format(
+                id, api_key_ref
+            ))
+
+        return MapProvider(data, api_key=api_key)
+
+def providers():
+    """
+    Get sorted list of all map providers identificators.
+
+    .. seealso:: :py:class:`geotiler.provider.ProviderRegistry`
+    """
+    return REGISTRY.providers()
+
+def find_provider(id):
+    """
+    Find map provider.
 
-    provider = MapProvider(data, api_key=api_key)
-    return provider
+    The map provider data is loaded from JSON file on first use. Each
+    call returns a copy of the map provider.
+
+    :param id: Map provider identificator.
+
+    .. seealso:: :py:class:`geotiler.provider.ProviderRegistry`
+    """
+    return REGISTRY.find(id)
+
+def reload_providers():
+    """
+    Read map providers and GeoTiler configuration again on next use.
+    """
+    REGISTRY.reload()
 
 def base_dir() -> str:
     """
@@ -165,4 +394,7 @@ def read_provider_data(id: str) -> tp.Dict:
 
     return data
 
+# process-wide registry of map providers
+REGISTRY = ProviderRegistry()
+
 # vim:et sts=4 sw=4:
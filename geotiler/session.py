@@ -0,0 +1,251 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Map rendering session to render the newest state of a map.
+"""
+
+import asyncio
+import copy
+import logging
+
+from .errors import TileNotFoundError
+from .map import _map_tiles
+from .tile.io import fetch_tiles as _fetch_tiles
+from .tile.img import render_image
+from .util import obfuscate
+
+logger = logging.getLogger(__name__)
+
+FMT_NOT_DOWNLOADED = 'Download of {} stopped'.format
+
+class RenderSession:
+    """
+    Map rendering session.
+
+    A render session renders the newest state of a map. When a map is
+    rendered within the session, then previous rendering of a map is
+    superseded and it stops. Downloads of the tiles, which are still
+    needed by the newest map, are reused. Downloads of the tiles, which are
+    not needed anymore, are cancelled.
+
+    :var downloader: Map tiles downloader.
+    :var kw: Parameters passed to the downloader.
+    :var _tiles: Futures of map tiles needed by the newest map.
+    :var _batches: Download tasks with URLs of map tiles they download.
+    :var _superseded: Future, which is done when the newest rendering is
+        superseded.
+    """
+    def __init__(self, downloader=None, **kw):
+        """
+        Create map rendering session.
+
+        If `downloader` is null, then default map tiles downloader is used
+        (:py:func:`geotiler.tile.io.fetch_tiles`).
+
+        :param downloader: Map tiles downloader.
+        :param kw: Parameters passed to the downloader.
+        """
+        self.downloader = _fetch_tiles if downloader is None else downloader
+        self.kw = kw
+
+        self._tiles = {}
+        self._batches = []
+        self._superseded = None
+
+    async def render(self, map):
+        """
+        Download map tiles and render map image.
+
+        Previous rendering of a map within the session is superseded.
+
+        The PIL image object is returned. If the rendering is superseded
+        by another one, then `None` is returned.
+
+        :param map: Map instance.
+        """
+        map = copy.copy(map)
+        superseded = self._supersede()
+        tiles = self._fetch_tiles(map, list(_map_tiles(map)), superseded)
+        image = await render_image(map, tiles)
+        return None if superseded.done() else image
+
+    def fetch_tiles(self, map):
+        """
+        Create and fetch map tiles.
+
+        Previous rendering of a map within the session is superseded.
+
+        Asynchronous generator of map tiles is returned. The generator
+        stops when it is superseded by another rendering of a map.
+
+        :param map: Map instance.
+        """
+        superseded = self._supersede()
+        return self._fetch_tiles(map, list(_map_tiles(map)), superseded)
+
+    def cancel(self):
+        """
+        Supersede current rendering of a map and cancel all downloads of
+        map tiles.
+        """
+        self._supersede()
+        for task, _ in self._batches:
+            task.cancel()
+        self._batches = []
+        self._tiles = {}
+
+    def _supersede(self):
+        """
+        Supersede current rendering of a map.
+
+        Future, which is done when the new rendering is superseded, is
+        returned.
+        """
+        if self._superseded is not None and not self._superseded.done():
+            self._superseded.set_result(None)
+        self._superseded = asyncio.get_running_loop().create_future()
+        return self._superseded
+
+    async def _fetch_tiles(self, map, tiles, superseded):
+        """
+        Fetch map tiles until superseded.
+
+        :param map: Map instance.
+        :param tiles: Map tiles without data.
+        :param superseded: Future, which is done when the rendering is
+            superseded.
+        """
+        if superseded.done():
+            return
+
+        # map tiles of the same URL are downloaded once
+        offsets = {}
+        for t in tiles:
+            offsets.setdefault(t.url, []).append(t.offset)
+        tiles = list({t.url: t for t in tiles}.values())
+        futures = self._schedule(tiles, map.provider.limit)
+
+        queue = asyncio.Queue()
+        superseded.add_done_callback(queue.put_nowait)
+        for f in futures:
+            f.add_done_callback(queue.put_nowait)
+
+        for _ in range(len(futures)):
+            f = await queue.get()
+            if superseded.done():
+                if __debug__:
+                    logger.debug('rendering superseded')
+                return
+
+            tile = f.result()
+            for offset in offsets[tile.url]:
+                yield tile._replace(offset=offset)
+
+    def _schedule(self, tiles, num_workers):
+        """
+        Schedule download of map tiles.
+
+        Downloads of map tiles, which are in progress or finished, are
+        reused. The downloads not needed by the map tiles are cancelled.
+        Map tiles, which failed to download, are downloaded again.
+
+        List of futures of the map tiles is returned.
+
+        :param tiles: Map tiles without data.
+        :param num_workers: Number of workers used to connect to a map
+            provider service.
+        """
+        urls = {t.url for t in tiles}
+
+        self._tiles = {
+            u: f for u, f in self._tiles.items()
+            if u in urls and not _is_failed(f)
+        }
+        for task, batch in self._batches:
+            if not urls & batch:
+                task.cancel()
+        self._batches = [
+            (task, batch) for task, batch in self._batches
+            if not task.done() and urls & batch
+        ]
+
+        loop = asyncio.get_running_loop()
+        missing = [t for t in tiles if t.url not in self._tiles]
+        if missing:
+            futures = {t.url: loop.create_future() for t in missing}
+            self._tiles.update(futures)
+
+            task = asyncio.ensure_future(
+                self._download(missing, num_workers, futures)
+            )
+            self._batches.append((task, set(futures)))
+
+        if __debug__:
+            logger.debug('tiles to download: {}, reused: {}'.format(
+                len(missing), len(tiles) - len(missing)
+            ))
+
+        return [self._tiles[t.url] for t in tiles]
+
+    async def _download(self, tiles, num_workers, futures):
+        """
+        Download map tiles and set results of their futures.
+
+        :param tiles: Map tiles to download.
+        :param num_workers: Number of workers used to connect to a map
+            provider service.
+        :param futures: Futures of the map tiles.
+        """
+        try:
+            result = self.downloader(tiles, num_workers, **self.kw)
+            async for tile in result:
+                f = futures.get(tile.url)
+                if f is not None and not f.done():
+                    f.set_result(tile)
+        finally:
+            # downloader stopped before returning all tiles
+            for t in tiles:
+                f = futures[t.url]
+                if not f.done():
+                    error = ValueError(FMT_NOT_DOWNLOADED(obfuscate(t.url)))
+                    f.set_result(t._replace(img=None, error=error))
+
+def _is_failed(future):
+    """
+    Check if download of a map tile failed.
+
+    Missing map tile is not a failure.
+
+    :param future: Future of a map tile.
+    """
+    if not future.done():
+        return False
+    error = future.result().error
+    return error is not None and not isinstance(error, TileNotFoundError)
+
+# vim: sw=4:et:ai
@@ -30,10 +30,13 @@ Caching downloader unit tests.
 """
 
 import asyncio
+import os
 from functools import partial
 
+from geotiler.errors import TileNotFoundError
 from geotiler.map import Tile
-from geotiler.cache import caching_downloader, redis_downloader
+from geotiler.cache import caching_downloader, redis_downloader, \
+    fs_downloader, fs_get, fs_set, MISSING, _fs_path
 
 from unittest import mock
 
@@ -57,9 +60,8 @@ def test_redis_downloader_and_cache():
     urls = ['url1', 'url2', 'url3']
     tiles = [Tile(url, None, None, None) for url in urls]
 
-    loop = asyncio.get_event_loop()
     tiles = downloader(tiles, 2)
-    result = loop.run_until_complete(as_list(tiles))
+    result = asyncio.run(as_list(tiles))
 
     args = [v[0][0] for v in client.get.call_args_list]
     assert ['url1', 'url2', 'url3'] == args
@@ -71,4 +73,113 @@ def test_redis_downloader_and_cache():
     assert ('url3', 10, 'c-img3') == args[2]
 
 
+def test_caching_downloader_timeout():
+    """
+    Test if caching downloader passes remaining time of download timeout
+    to the original downloader.
+    """
+    timeouts = []
+    async def images(tiles, num_workers, timeout=None):
+        timeouts.append(timeout)
+        for t in tiles:
+            yield t._replace(img='img')
+
+    async def as_list(tiles):
+        return [t async for t in tiles]
+
+    urls = ['url{}'.format(i) for i in range(15)]
+    tiles = [Tile(url, None, None, None) for url in urls]
+
+    get = lambda url: None
+    set = lambda url, img: None
+    tiles = caching_downloader(get, set, images, tiles, 2, timeout=10)
+    result = asyncio.run(as_list(tiles))
+
+    assert 15 == len(result)
+    assert 2 == len(timeouts)
+    assert all(0 < t <= 10 for t in timeouts)
+    assert timeouts[0] >= timeouts[1]
+
+def test_fs_cache(tmp_path):
+    """
+    Test file system cache functions.
+    """
+    path = str(tmp_path)
+    assert fs_get(path, 'url1') is None
+
+    fs_set(path, 'url1', b'img1')
+    fs_set(path, 'url2', None)
+    assert b'img1' == fs_get(path, 'url1')
+    assert fs_get(path, 'url2') is None
+
+def test_fs_downloader(tmp_path):
+    """
+    Test file system cache downloader.
+    """
+    urls = []
+    async def images(tiles, num_workers):
+        for t in tiles:
+            urls.append(t.url)
+            yield t._replace(img=b'img')
+
+    async def as_list(tiles):
+        return [t async for t in tiles]
+
+    path = str(tmp_path)
+    fs_set(path, 'url1', b'c-img1')
+    downloader = fs_downloader(path, downloader=images)
+
+    tiles = [Tile(url, None, None, None) for url in ['url1', 'url2']]
+    result = asyncio.run(as_list(downloader(tiles, 2)))
+
+    assert ['url2'] == urls
+    assert [b'c-img1', b'img'] == [t.img for t in result]
+    assert b'img' == fs_get(path, 'url2')
+
+def test_caching_downloader_missing():
+    """
+    Test caching of map tiles, which do not exist.
+    """
+    urls = []
+    async def images(tiles, num_workers):
+        for t in tiles:
+            urls.append(t.url)
+            error = TileNotFoundError('not found') if t.url == 'url2' \
+                else ValueError('error')
+            yield t._replace(error=error)
+
+    async def as_list(tiles):
+        return [t async for t in tiles]
+
+    cache = {}
+    get = cache.get
+    set = cache.__setitem__
+    set_missing = lambda url: set(url, MISSING)
+    downloader = partial(
+        caching_downloader, get, set, images, set_missing=set_missing,
+        placeholder=b'blank'
+    )
+
+    tiles = [Tile(url, None, None, None) for url in ['url1', 'url2']]
+    for _ in range(2):
+        result = asyncio.run(as_list(downloader(tiles, 2)))
+        assert {'url1': None, 'url2': b'blank'} == {t.url: t.img for t in result}
+
+    # known missing tile is downloaded once, other errors are not cached
+    assert ['url1', 'url2', 'url1'] == urls
+    assert {'url2': MISSING} == cache
+
+def test_fs_cache_missing(tmp_path):
+    """
+    Test expiry of known missing map tile in file system cache.
+    """
+    path = str(tmp_path)
+    fs_set(path, 'url1', MISSING)
+    assert MISSING == fs_get(path, 'url1', missing_timeout=10)
+
+    fn = _fs_path(path, 'url1')
+    os.utime(fn, (0, 0))
+    assert fs_get(path, 'url1', missing_timeout=10) is None
+    assert MISSING == fs_get(path, 'url1')
+
 # vim: sw=4:et:ai
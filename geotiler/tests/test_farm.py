@@ -0,0 +1,164 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Unit tests for rendering maps with a pool of processes.
+"""
+
+import io
+import PIL.Image  # type: ignore
+from multiprocessing.shared_memory import SharedMemory
+from unittest import mock
+
+import geotiler
+import geotiler.farm
+from geotiler.cache import MISSING, fs_set
+from geotiler.farm import render_maps, map_spec, spec_map
+from geotiler.map import _map_tiles
+from geotiler.tile.img import blank_tile
+
+import pytest
+
+def create_map(zoom):
+    return geotiler.Map(center=(11.788137, 46.481832), zoom=zoom, size=(300, 200))
+
+def test_map_spec():
+    """
+    Test creating map from its specification.
+    """
+    map = create_map(15)
+    spec = map_spec(map)
+    assert 'osm' == spec.provider
+
+    result = spec_map(spec)
+    assert map.zoom == result.zoom
+    assert map.size == result.size
+    assert map.origin == result.origin
+    assert map.offset == result.offset
+    assert map.extent == result.extent
+
+def test_map_spec_no_provider_id():
+    """
+    Test if error is raised for map provider without identificator.
+    """
+    map = create_map(15)
+    map.provider.id = None
+    with pytest.raises(ValueError):
+        map_spec(map)
+
+def test_render_maps(tmp_path):
+    """
+    Test rendering maps with a pool of processes.
+    """
+    tile = PIL.Image.new('RGB', (256, 256), 'red')
+    f = io.BytesIO()
+    tile.save(f, format='png')
+    data = f.getvalue()
+
+    urls = []
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            urls.append(t.url)
+            yield t._replace(img=data)
+
+    maps = [create_map(17), create_map(17), create_map(16)]
+    images = list(render_maps(maps, 2, str(tmp_path), downloader))
+
+    # tiles of the same maps are downloaded once
+    assert 8 == len(urls)
+    assert len(urls) == len(set(urls))
+
+    assert 3 == len(images)
+    assert all((300, 200) == img.size for img in images)
+    assert (255, 0, 0, 255) == images[2].getpixel((150, 100))
+    assert all([] == img.info['missing_tiles'] for img in images)
+
+def test_render_maps_error(tmp_path):
+    """
+    Test rendering maps with map tiles, which could not be downloaded.
+    """
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            yield t._replace(error=ValueError('no data'))
+
+    map = create_map(17)
+    image, = render_maps([map], 1, str(tmp_path), downloader)
+
+    expected = {t.url for t in _map_tiles(map)}
+    missing = image.info['missing_tiles']
+    assert expected == {t.url for t in missing}
+    assert all(isinstance(t.error, ValueError) for t in missing)
+
+@pytest.mark.parametrize('placeholder', [None, blank_tile()])
+def test_render_maps_missing(tmp_path, placeholder):
+    """
+    Test rendering maps with known missing map tiles.
+    """
+    map = create_map(17)
+    for t in _map_tiles(map):
+        fs_set(str(tmp_path), t.url, MISSING)
+
+    urls = []
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            urls.append(t.url)
+            yield t
+
+    images = render_maps([map], 1, str(tmp_path), downloader, placeholder)
+    image, = images
+    assert image.getbbox() is None
+
+    # known missing tiles are not downloaded
+    assert [] == urls
+
+def test_render_maps_release(tmp_path):
+    """
+    Test if shared memory of map images, which are not consumed, is
+    released.
+    """
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            yield t._replace(img=blank_tile())
+
+    names = []
+    release = geotiler.farm._release_image
+    def release_image(future):
+        release(future)
+        if not future.cancelled():
+            names.append(future.result()[0])
+
+    maps = [create_map(17), create_map(16), create_map(15)]
+    with mock.patch.object(geotiler.farm, '_release_image', release_image):
+        images = render_maps(maps, 1, str(tmp_path), downloader)
+        next(images)
+        images.close()
+
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
@@ -0,0 +1,113 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Tests for rendering sequences of map images.
+"""
+
+import io
+from unittest import mock
+
+import PIL.Image  # type: ignore
+import pytest
+
+import geotiler.frames as frames
+from geotiler.map import Map
+
+def _downloader(calls):
+    """
+    Create map tiles downloader returning PNG data of red tile image.
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGB', (256, 256), 'red').save(f, format='png')
+    data = f.getvalue()
+
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            calls.append(t.url)
+            yield t._replace(img=data)
+    return downloader
+
+def test_keyframe_positions():
+    """
+    Test interpolating positions between keyframes.
+    """
+    keyframes = [(0, 0, 10), (1, 2, 12), (1, 2, 13)]
+    result = list(frames.keyframe_positions(keyframes, 2))
+    expected = [
+        (0, 0, 10), (0.5, 1, 11), (1, 2, 12), (1, 2, 12.5), (1, 2, 13)
+    ]
+    assert expected == result
+
+def test_frame_maps():
+    """
+    Test creating maps of frames.
+    """
+    map = Map(center=(0, 0), zoom=10, size=(100, 100))
+    maps = list(frames.frame_maps(map, [(1, 2), (3, 4, 11)]))
+
+    assert (1, 2) == pytest.approx(maps[0].center, abs=1e-3)
+    assert 10 == maps[0].zoom
+    assert (3, 4) == pytest.approx(maps[1].center, abs=1e-3)
+    assert 11 == maps[1].zoom
+    assert (0, 0) == pytest.approx(map.center, abs=1e-6)
+
+def test_render_frames():
+    """
+    Test rendering frames with reuse of map tiles.
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    positions = [(11.788137 + i * 0.001, 46.481832) for i in range(6)]
+    maps = list(frames.frame_maps(map, positions))
+
+    calls = []
+    downloader = _downloader(calls)
+    with mock.patch.object(
+                frames, '_tile_image', wraps=frames._tile_image
+            ) as tf:
+        items = frames.render_frames(
+            maps, downloader=downloader, window=4, mode='RGB'
+        )
+        result = [(img.size, img.mode) for img in items]
+
+    assert [((300, 300), 'RGB')] * 6 == result
+    assert 6 < len(calls)
+
+    # each tile is downloaded and decoded once
+    assert len(calls) == len(set(calls))
+    assert len(calls) == tf.call_count
+
+def test_write_raw():
+    """
+    Test writing raw data of frames into a file.
+    """
+    images = [PIL.Image.new('RGB', (2, 2)), PIL.Image.new('RGB', (2, 2))]
+    f = io.BytesIO()
+    assert 2 == frames.write_raw(images, f)
+    assert 24 == len(f.getvalue())
+
+# vim: sw=4:et:ai
@@ -0,0 +1,144 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Tests for array based grid of map tiles.
+"""
+
+import copy
+
+from geotiler.grid import TileGrid
+from geotiler.map import Map, _map_tiles
+from geotiler.provider import MapProvider
+
+import pytest
+
+def test_grid_from_map():
+    """
+    Test creating grid of map tiles of a map.
+    """
+    for zoom in (17, 16.4, 1):
+        map = Map(center=(11.788137, 46.481832), zoom=zoom, size=(1000, 700))
+        grid = TileGrid.from_map(map)
+
+        assert list(_map_tiles(map)) == list(grid.tiles(size=3))
+
+def test_grid_urls():
+    """
+    Test creating URLs of map tiles of a grid.
+    """
+    provider = MapProvider({
+        'url': 'http://{subdomain}.a/{z}/{x}/{y}.{ext}?k={api_key}',
+        'subdomains': ['s1', 's2'],
+        'extension': 'jpg',
+    }, api_key='key')
+    grid = TileGrid(provider, 3, [(1, 2), (3, 4), (5, 6)])
+
+    expected = [
+        'http://s1.a/3/1/2.jpg?k=key',
+        'http://s2.a/3/3/4.jpg?k=key',
+        'http://s1.a/3/5/6.jpg?k=key',
+    ]
+    assert expected == grid.urls().tolist()
+
+def test_grid_urls_format_spec():
+    """
+    Test creating URLs of map tiles of a grid is the same as creating them
+    with map provider for URL template with format specification.
+    """
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y:03d}.png'})
+    grid = TileGrid(provider, 5, [(1, 2), (3, 4), (1, 2)])
+
+    expected = provider.tile_urls([(1, 2), (3, 4), (1, 2)], 5)
+    assert ['http://a/5/1/002.png', 'http://a/5/3/004.png'] == expected[:2]
+    assert expected == grid.urls().tolist()
+
+def test_grid_from_extent():
+    """
+    Test creating grid of map tiles covering geographical extent.
+    """
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y}.png'})
+    grid = TileGrid.from_extent(provider, (-180, -85, 180, 85), 2)
+
+    assert 16 == len(grid)
+    assert grid.offsets is None
+    assert [[0, 0], [0, 1]] == grid.coords[:2].tolist()
+
+def test_grid_set_operations():
+    """
+    Test difference and union of grids of map tiles.
+    """
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y}.png'})
+    g1 = TileGrid(provider, 3, [(1, 1), (1, 2), (2, 2)], [(0, 0)] * 3)
+    g2 = TileGrid(provider, 3, [(2, 2), (3, 3)], [(1, 1)] * 2)
+
+    result = g1.difference(g2)
+    assert [[1, 1], [1, 2]] == result.coords.tolist()
+
+    result = g1.union(g2)
+    assert [[1, 1], [1, 2], [2, 2], [3, 3]] == result.coords.tolist()
+    assert [[0, 0]] * 3 + [[1, 1]] == result.offsets.tolist()
+
+    with pytest.raises(ValueError):
+        g1.union(TileGrid(provider, 4, [(1, 1)]))
+
+    # copy of map provider is the same map provider
+    g3 = TileGrid(copy.copy(provider), 3, [(4, 4)])
+    assert 4 == len(g1.union(g3))
+
+    other = MapProvider({'url': 'http://b/{z}/{x}/{y}.png'})
+    with pytest.raises(ValueError):
+        g1.union(TileGrid(other, 3, [(1, 1)]))
+
+def test_grid_batches():
+    """
+    Test splitting grid of map tiles into batches.
+    """
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y}.png'})
+    grid = TileGrid.from_extent(provider, (-180, -85, 180, 85), 3)
+
+    batches = list(grid.batches(size=30))
+    assert [30, 30, 4] == [len(b) for b in batches]
+    assert [0, 7] == grid[7].coords[0].tolist()
+
+def test_grid_tiles_mirrors():
+    """
+    Test creating map tiles with URLs of mirrors of map provider.
+    """
+    data = {
+        'url': 'http://a/{z}/{x}/{y}.png',
+        'mirrors': ['http://b/{z}/{x}/{y}.png'],
+    }
+    provider = MapProvider(data)
+    map = Map(center=(0, 0), zoom=3, size=(256, 256), provider=provider)
+    grid = TileGrid.from_map(map)
+
+    tiles = list(grid.tiles())
+    assert list(_map_tiles(map)) == tiles
+    assert ('http://b/3/3/3.png',) == tiles[0].mirrors
+
+# vim: sw=4:et:ai
@@ -0,0 +1,59 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Lazy import of heavy modules by GeoTiler package tests.
+"""
+
+import subprocess
+import sys
+
+# modules, which are imported on first use only
+HEAVY_MODULES = (
+    'aiohttp', 'PIL', 'numpy', 'redis', 'pkg_resources', 'cytoolz',
+    'sqlite3', 'importlib.metadata',
+)
+
+CODE = """
+import sys
+import geotiler
+print(' '.join(m for m in {!r} if m in sys.modules))
+""".format(HEAVY_MODULES)
+
+def test_import_lazy():
+    """
+    Test heavy modules are not imported by GeoTiler package.
+
+    GeoTiler is imported in a new Python interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', CODE],
+        capture_output=True, text=True, check=True,
+    )
+    assert [] == result.stdout.split()
+
+# vim: sw=4:et:ai
@@ -0,0 +1,126 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Background event loop and synchronous map rendering unit tests.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import geotiler
+from geotiler.loop import event_loop, run_coroutine, run_sync
+
+import pytest
+
+async def images(tiles, num_workers):
+    for t in tiles:
+        yield t._replace(error=ValueError('no data'))
+
+def test_event_loop_shared():
+    """
+    Test if background event loop is shared between threads.
+    """
+    with ThreadPoolExecutor(4) as executor:
+        loops = list(executor.map(lambda _: event_loop(), range(8)))
+    assert all(loop is loops[0] for loop in loops)
+    assert loops[0].is_running()
+
+def test_run_coroutine():
+    """
+    Test running coroutine in background event loop.
+    """
+    async def f():
+        return threading.current_thread().name
+
+    future = run_coroutine(f())
+    assert 'geotiler-loop' == future.result()
+
+def test_run_coroutine_deadlock():
+    """
+    Test if error is raised when waiting for a coroutine within background
+    event loop.
+    """
+    async def f():
+        return 1
+
+    async def g():
+        run_sync(f())
+
+    with pytest.raises(RuntimeError):
+        run_sync(g())
+
+def test_render_map_loop_deadlock():
+    """
+    Test if error is raised when rendering map synchronously within
+    background event loop.
+    """
+    async def f():
+        map = geotiler.Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+        geotiler.render_map(map, downloader=images)
+
+    with pytest.raises(RuntimeError):
+        run_sync(f())
+
+def test_render_map_future_loop():
+    """
+    Test scheduling map rendering within background event loop.
+    """
+    async def f():
+        map = geotiler.Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+        future = geotiler.render_map_future(map, downloader=images)
+        return await asyncio.wrap_future(future)
+
+    img = run_sync(f())
+    assert (300, 300) == img.size
+
+def test_render_map_threads():
+    """
+    Test rendering map from multiple threads.
+    """
+    def render(zoom):
+        map = geotiler.Map(center=(11.788137, 46.481832), zoom=zoom, size=(300, 300))
+        return geotiler.render_map(map, downloader=images)
+
+    with ThreadPoolExecutor(4) as executor:
+        result = list(executor.map(render, range(10, 18)))
+
+    assert 8 == len(result)
+    assert all((300, 300) == img.size for img in result)
+
+def test_render_map_running_loop():
+    """
+    Test rendering map within running event loop.
+    """
+    async def f():
+        map = geotiler.Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+        return geotiler.render_map(map, downloader=images)
+
+    img = asyncio.run(f())
+    assert (300, 300) == img.size
@@ -25,9 +25,17 @@
 #   License: BSD
 #
 
+import asyncio
+import io
+import math
 import numpy as np
+import PIL.Image  # type: ignore
 from functools import partial
-from geotiler.map import Map, _find_top_left_tile, _tile_coords, _tile_offsets
+from geotiler.map import Map, render_map_layers_async, \
+    render_map_async, render_map_async_encoded, render_map_async_sizes, \
+    render_map_async_region, fetch_tiles, _find_top_left_tile, \
+    _tile_coords, _tile_offsets, _map_tiles, _tile_zoom
+from geotiler.provider import MapProvider
 
 import pytest
 import unittest
@@ -342,6 +350,23 @@ def test_map_create_center_zoom_size_numpy():
     assert (69827, 46376) == map.origin
     assert (-238, -194) == map.offset
 
+def test_map_create_extent_size_exact():
+    """
+    Test map instantiation with extent and size, and fractional zoom
+    fitting the extent exactly
+    """
+    extent = 11.78, 46.47, 11.80, 46.49
+    map = Map(extent=extent, size=(512, 512), exact=True)
+
+    assert 14 < map.zoom < 15
+    assert map.zoom != int(map.zoom)
+
+    # the extent fits exactly, up to a pixel, in one dimension of the map
+    # image
+    lon1, lat1, lon2, lat2 = map.extent
+    assert lon1 <= 11.78 and lon2 >= 11.80
+    assert (46.47, 46.49) == pytest.approx((lat1, lat2), abs=1e-4)
+
 def test_map_zoom_change_same():
     """
     Test if extent and center of map holds after zoom reset to same value.
@@ -380,4 +405,305 @@ def test_map_error_set_size():
     with pytest.raises(TypeError):
         map.size = (512.0, 512.0)
 
+def test_tile_zoom():
+    """
+    Test calculation of zoom level of map tiles
+    """
+    assert 17 == _tile_zoom(17)
+    assert 17 == _tile_zoom(17.0)
+    assert isinstance(_tile_zoom(17.0), int)
+    assert 18 == _tile_zoom(17.2)
+    assert 18 == _tile_zoom(17.9)
+    assert 17 == _tile_zoom(17.2, 17)
+    assert 17 == _tile_zoom(19, 17)
+
+def test_map_tiles_fractional_zoom():
+    """
+    Test creating map tiles for map with fractional zoom
+    """
+    center = 11.788137, 46.481832
+    map = Map(center=center, zoom=16.5, size=(300, 200))
+    tiles = list(_map_tiles(map))
+
+    urls = [t.url for t in tiles]
+    assert all(u.startswith('http://tile.openstreetmap.org/17/') for u in urls)
+    assert 4 == len(tiles)
+
+    # tile size is scaled by 2 ** -0.5 and adjacent tiles share edges
+    t1, t2, t3, t4 = (t.offset for t in tiles)
+    assert 181 == t1[2] - t1[0]
+    assert t1[2] == t3[0]
+    assert t1[3] == t2[1]
+    assert t2[2] == t4[0]
+
+    # top-left corner of a tile matches its geographical location
+    projection = map.provider.projection
+    loc = projection.geocode((69828, 46377), 17)
+    assert map.rev_geocode(loc) == pytest.approx(t4[:2], abs=1)
+
+def test_render_map_layers():
+    """
+    Test rendering map image with multiple map layers
+    """
+    calls = []
+    async def downloader(tiles, num_workers):
+        tiles = list(tiles)
+        calls.append((num_workers, [t.url for t in tiles]))
+        for t in tiles:
+            yield t._replace(error=ValueError('no data'))
+
+    p1 = MapProvider({'url': 'http://a/{z}/{x}/{y}.png', 'limit': 2})
+    p2 = MapProvider({'url': 'http://b/{z}/{x}/{y}.png', 'limit': 3})
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+
+    task = render_map_layers_async(map, [p1, p2], downloader=downloader)
+    image = asyncio.run(task)
+
+    assert (300, 300) == image.size
+    assert 8 == len(image.info['missing_tiles'])
+
+    # one downloader call with tiles of layers interleaved
+    assert 1 == len(calls)
+    num_workers, urls = calls[0]
+    assert 2 == num_workers
+    assert ['a', 'b'] * 4 == [u[7] for u in urls]
+
+def test_render_map_layers_same_url():
+    """
+    Test rendering map image with map layers using the same map tile URLs
+    """
+    calls = []
+    downloader, _ = _png_downloader(calls)
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+
+    task = render_map_layers_async(map, ['osm', 'osm'], downloader=downloader)
+    image = asyncio.run(task)
+
+    assert (255, 0, 0, 255) == image.getpixel((150, 150))
+    assert [] == image.info['missing_tiles']
+    assert 4 == len(calls)
+
+def test_render_map_layers_no_tiles():
+    """
+    Test rendering map image with map layers having no map tiles
+    """
+    calls = []
+    async def downloader(tiles, num_workers):
+        tiles = list(tiles)
+        calls.append(tiles)
+        for t in tiles:
+            yield t
+
+    # zoom out of the valid range of map providers
+    p1 = MapProvider({'url': 'http://a/{z}/{x}/{y}.png', 'min-zoom': 2})
+    p2 = MapProvider({'url': 'http://b/{z}/{x}/{y}.png', 'min-zoom': 3})
+    map = Map(center=(0, 0), zoom=1, size=(300, 300), provider=p1)
+
+    task = render_map_layers_async(map, [p1, p2], downloader=downloader)
+    image = asyncio.run(task)
+
+    assert (300, 300) == image.size
+    assert (0, 0, 0, 0) == image.getpixel((150, 150))
+    assert [] == image.info['missing_tiles']
+    assert all(not tiles for tiles in calls)
+
+def test_render_map_layers_tile_size_error():
+    """
+    Test rendering map image with map layers of different tile sizes
+    """
+    p1 = MapProvider({'url': 'http://a/{z}/{x}/{y}.png'})
+    p2 = MapProvider({'url': 'http://b/{z}/{x}/{y}.png', 'tile-width': 512})
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+
+    task = render_map_layers_async(map, [p1, p2])
+    with pytest.raises(ValueError):
+        asyncio.run(task)
+
+def _png_downloader(calls):
+    """
+    Create map tiles downloader returning PNG data of red tile image.
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGB', (256, 256), 'red').save(f, format='png')
+    data = f.getvalue()
+
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            calls.append(t.url)
+            yield t._replace(img=data)
+    return downloader, data
+
+def test_render_map_encoded_tile():
+    """
+    Test rendering encoded map image, which is exactly one map tile
+    """
+    calls = []
+    downloader, data = _png_downloader(calls)
+    lat = math.degrees(math.atan(math.sinh(math.pi / 4)))
+    map = Map(center=(-45, lat), zoom=2, size=(256, 256))
+
+    task = render_map_async_encoded(map, 'png', downloader=downloader)
+    result = asyncio.run(task)
+
+    assert data == result
+    assert ['http://tile.openstreetmap.org/2/1/1.png'] == calls
+
+def test_render_map_encoded():
+    """
+    Test rendering encoded map image in JPEG format
+    """
+    calls = []
+    downloader, data = _png_downloader(calls)
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+
+    task = render_map_async_encoded(
+        map, 'jpg', quality=50, downloader=downloader
+    )
+    result = asyncio.run(task)
+
+    image = PIL.Image.open(io.BytesIO(result))
+    assert 'JPEG' == image.format
+    assert (300, 300) == image.size
+    assert 4 == len(calls)
+
+def test_render_map_encoded_format_error():
+    """
+    Test rendering encoded map image in unsupported format
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    with pytest.raises(ValueError):
+        asyncio.run(render_map_async_encoded(map, 'tiff'))
+
+def test_render_map_sizes():
+    """
+    Test rendering map image downsampled to multiple sizes
+    """
+    calls = []
+    downloader, data = _png_downloader(calls)
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 200))
+
+    sizes = [(300, 200), (150, 100), (100, 70)]
+    task = render_map_async_sizes(map, sizes, downloader=downloader)
+    images = asyncio.run(task)
+
+    assert sizes == [img.size for img in images]
+    assert (255, 0, 0, 255) == images[1].getpixel((50, 50))
+    assert [] == images[2].info['missing_tiles']
+
+    # map tiles downloaded once
+    assert len(calls) == len(set(calls))
+
+def test_render_map_sizes_error():
+    """
+    Test rendering map image downsampled to size larger than map size
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 200))
+    task = render_map_async_sizes(map, [(100, 100), (400, 100)])
+    with pytest.raises(ValueError):
+        asyncio.run(task)
+
+def test_render_map_region():
+    """
+    Test rendering region of map image
+    """
+    calls = []
+    async def downloader(tiles, num_workers):
+        for t in tiles:
+            calls.append(t.url)
+            f = io.BytesIO()
+            color = (sum(t.url.encode()) % 256, 0, 0)
+            PIL.Image.new('RGB', (256, 256), color).save(f, format='png')
+            yield t._replace(img=f.getvalue())
+
+    for zoom in (17, 16.5):
+        map = Map(center=(11.788137, 46.481832), zoom=zoom, size=(300, 300))
+        image = asyncio.run(render_map_async(map, downloader=downloader))
+
+        calls.clear()
+        box = (10, 20, 60, 40)
+        task = render_map_async_region(map, box, downloader=downloader)
+        region = asyncio.run(task)
+
+        assert 1 == len(calls)
+        assert (50, 20) == region.size
+        assert image.crop(box).tobytes() == region.tobytes()
+
+def test_render_map_region_error():
+    """
+    Test rendering empty region of map image
+    """
+    map = Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+    task = render_map_async_region(map, (300, 0, 400, 10))
+    with pytest.raises(ValueError):
+        asyncio.run(task)
+
+def test_map_tiles_world_wrap():
+    """
+    Test map tiles wrapped around the world and skipped out of the world
+    """
+    map = Map(center=(0, 0), zoom=1, size=(1024, 768))
+    tiles = list(_map_tiles(map))
+
+    # 4 columns, 4 rows, but only 2 rows are within the world
+    assert 8 == len(tiles)
+    assert 4 == len({t.url for t in tiles})
+    assert {(0, 0), (1, 0), (0, 1), (1, 1)} == {
+        tuple(int(v) for v in t.url[:-4].split('/')[-2:]) for t in tiles
+    }
+
+    # no tiles for zoom out of the valid range of map provider
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y}.png', 'min-zoom': 2})
+    map = Map(center=(0, 0), zoom=1, size=(1024, 768), provider=provider)
+    assert [] == list(_map_tiles(map))
+
+def test_map_tiles_max_zoom():
+    """
+    Test map tiles are upscaled from maximum zoom level of map provider
+    """
+    provider = MapProvider({'url': 'http://a/{z}/{x}/{y}.png', 'max-zoom': 18})
+    for zoom in (18.3, 19):
+        map = Map(
+            center=(11.788137, 46.481832), zoom=zoom, size=(512, 512),
+            provider=provider
+        )
+        tiles = list(_map_tiles(map))
+        assert tiles
+        assert {'18'} == {t.url.split('/')[3] for t in tiles}
+        assert all(len(t.offset) == 4 for t in tiles)
+
+        # tiles cover the map image
+        assert 0 >= min(t.offset[0] for t in tiles)
+        assert 512 <= max(t.offset[2] for t in tiles)
+
+def test_map_tiles_world_wrap_subdomains():
+    """
+    Test map tiles wrapped around the world have the same URL for map
+    provider with subdomains
+    """
+    provider = MapProvider({
+        'url': 'http://{subdomain}.tile.a.org/{z}/{x}/{y}.png',
+        'subdomains': ['a', 'b', 'c'],
+    })
+    map = Map(center=(0, 0), zoom=1, size=(1024, 768), provider=provider)
+    tiles = list(_map_tiles(map))
+
+    assert 8 == len(tiles)
+    assert 4 == len({t.url for t in tiles})
+
+def test_fetch_tiles_unique():
+    """
+    Test fetching map tiles with the same URL once
+    """
+    calls = []
+    downloader, _ = _png_downloader(calls)
+    map = Map(center=(0, 0), zoom=1, size=(1024, 768))
+
+    async def fetch():
+        return [t async for t in fetch_tiles(map, downloader)]
+
+    tiles = asyncio.run(fetch())
+    assert 4 == len(calls)
+    assert 8 == len(tiles)
+    assert len(tiles) == len({t.offset for t in tiles})
+
 # vim: sw=4:et:ai
@@ -0,0 +1,143 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Map tiles prefetching unit tests.
+"""
+
+import asyncio
+from functools import partial
+
+from geotiler.map import Map, _map_tiles
+from geotiler.provider import MapProvider
+from geotiler.tile.io import _BACKGROUND
+from geotiler.prefetch import prefetch_tiles, _prefetch_maps, \
+    _prefetch_tiles, _destination
+
+import pytest
+
+approx = partial(pytest.approx, abs=1e-3)
+
+def create_map():
+    return Map(center=(11.788137, 46.481832), zoom=17, size=(300, 300))
+
+def test_destination() -> None:
+    """
+    Test calculation of destination location.
+    """
+    # 1 degree of latitude is about 111.2 km
+    assert (0, 1) == approx(_destination((0, 0), 111195, 0))
+    assert (1, 0) == approx(_destination((0, 0), 111195, 90))
+    assert (0, 0) == approx(_destination((0, 0), 0, 45))
+
+def test_prefetch_maps_margin() -> None:
+    """
+    Test creating map with margin ring for prefetching.
+    """
+    map = create_map()
+    maps = list(_prefetch_maps(map, 1, 0, 0, False))
+
+    assert 1 == len(maps)
+    assert (812, 812) == maps[0].size
+    assert map.center == approx(maps[0].center)
+
+    # original map is not changed
+    assert (300, 300) == map.size
+
+def test_prefetch_maps_path() -> None:
+    """
+    Test creating maps along projected path for prefetching.
+    """
+    map = create_map()
+    maps = list(_prefetch_maps(map, 0, 1000, 90, False))
+
+    # about 0.82m per pixel, so 150 pixels per step is about 123m
+    assert 9 == len(maps)
+    lons = [m.center[0] for m in maps]
+    assert lons == sorted(lons)
+    assert all(m.center[1] == approx(map.center[1]) for m in maps)
+    assert map.center[0] < lons[0]
+
+def test_prefetch_maps_zoom() -> None:
+    """
+    Test creating maps at next zoom levels for prefetching.
+    """
+    map = create_map()
+    maps = list(_prefetch_maps(map, 0, 0, 0, True))
+
+    assert [18, 16] == [m.zoom for m in maps]
+    assert 17 == map.zoom
+
+def test_prefetch_maps_zoom_provider() -> None:
+    """
+    Test if maps at next zoom levels respect zoom range of map provider.
+    """
+    provider = MapProvider({
+        'url': 'http://a/{z}/{x}/{y}.png', 'min-zoom': 3, 'max-zoom': 5
+    })
+    center = 11.788137, 46.481832
+    map = Map(center=center, zoom=3, size=(300, 300), provider=provider)
+    maps = list(_prefetch_maps(map, 0, 0, 0, True))
+    assert [4] == [m.zoom for m in maps]
+
+    # map above maximum zoom level is rendered with upscaled map tiles
+    map = Map(center=center, zoom=5, size=(300, 300), provider=provider)
+    maps = list(_prefetch_maps(map, 0, 0, 0, True))
+    assert [6, 4] == [m.zoom for m in maps]
+
+def test_prefetch_tiles_unique() -> None:
+    """
+    Test if map tiles to prefetch are unique and exclude tiles of a map.
+    """
+    map = create_map()
+    maps = list(_prefetch_maps(map, 1, 0, 0, False)) * 2
+    tiles = _prefetch_tiles(map, maps)
+
+    urls = [t.url for t in tiles]
+    assert len(urls) == len(set(urls))
+    assert 16 - 4 == len(urls)
+    assert not set(urls) & {t.url for t in _map_tiles(map)}
+
+def test_prefetch_tiles_download() -> None:
+    """
+    Test downloading map tiles to prefetch.
+    """
+    workers = []
+    async def images(tiles, num_workers):
+        workers.append(num_workers)
+        assert _BACKGROUND.get()
+        for t in tiles:
+            yield t._replace(img='img')
+
+    map = create_map()
+    task = prefetch_tiles(map, images, margin=1, zoom=False, num_workers=4)
+    result = asyncio.run(task)
+
+    assert 12 == result
+    assert [map.provider.limit] == workers
+    assert not _BACKGROUND.get()
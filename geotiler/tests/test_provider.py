@@ -25,10 +25,13 @@
 #   License: BSD
 #
 
-from geotiler.provider import MapProvider, base_dir
+from geotiler.errors import GeoTilerError
+from geotiler.provider import MapProvider, ProviderRegistry, base_dir
 
 from unittest import mock
 
+import pytest
+
 
 def test_provider_init_default():
     """
@@ -111,6 +114,137 @@ def test_provider_tile_url_api_key():
     url = provider.tile_url((1, 2), 15)
     assert 'http://tile.openstreetmap.org/15/1/2.png?apikey=a-key-ref' == url
 
+def test_provider_tile_bounds():
+    """
+    Test range of valid tile coordinates of map provider.
+    """
+    data = {
+        'url': 'http://tile.openstreetmap.org/{z}/{x}/{y}.{ext}',
+        'min-zoom': 2,
+        'max-zoom': 10,
+    }
+    provider = MapProvider(data)
+    assert provider.tile_bounds(1) is None
+    assert provider.tile_bounds(11) is None
+    assert (0, 0, 3, 3) == provider.tile_bounds(2)
+
+    provider.bounds = (0, -10, 10, 80)
+    assert (2, 0, 2, 2) == provider.tile_bounds(2)
+
+def test_provider_tile_urls():
+    """
+    Test creating URLs of many map tiles.
+    """
+    data = {
+        'url': 'http://{subdomain}.tile.a.org/{z}/{x}/{y:03d}.{ext}?k={api_key}',
+        'subdomains': ['a', 'b'],
+    }
+    provider = MapProvider(data, api_key='{key}')
+    urls = provider.tile_urls([(1, 2), (3, 4)], 15)
+    expected = [
+        'http://a.tile.a.org/15/1/002.png?k={key}',
+        'http://b.tile.a.org/15/3/004.png?k={key}',
+    ]
+    assert expected == urls
+    assert expected[0] == provider.tile_url((1, 2), 15)
+
+    # url builder is compiled again on change of api key
+    provider.api_key = 'key'
+    url = provider.tile_url((1, 2), 15)
+    assert 'http://b.tile.a.org/15/1/002.png?k=key' == url
+
+def test_provider_mirror_urls():
+    """
+    Test creating URLs of a map tile at mirrors of map provider.
+    """
+    data = {
+        'url': 'http://{subdomain}.tile.a.org/{z}/{x}/{y}.{ext}',
+        'subdomains': ['a', 'b'],
+        'mirrors': [
+            'http://tile.b.org/{z}/{x}/{y}.{ext}',
+            'http://{subdomain}.tile.c.org/{z}/{x}/{y}.{ext}',
+        ],
+    }
+    provider = MapProvider(data)
+    urls = provider.mirror_urls((1, 2), 15)
+    expected = (
+        'http://tile.b.org/15/1/2.png',
+        'http://a.tile.c.org/15/1/2.png',
+    )
+    assert expected == urls
+
+    provider.mirrors = ()
+    assert () == provider.mirror_urls((1, 2), 15)
+
+def test_registry_find():
+    """
+    Test finding map provider in map providers registry.
+    """
+    registry = ProviderRegistry()
+    provider = registry.find('osm')
+    assert 'osm' == provider.id
+
+    # copy of map provider is returned, sharing the subdomain selector
+    result = registry.find('osm')
+    assert provider is not result
+    assert provider.url == result.url
+    assert provider.subdomain_selector is result.subdomain_selector
+
+    # change of a map provider does not affect other map providers
+    provider.id = None
+    provider.limit = 10
+    result = registry.find('osm')
+    assert 'osm' == result.id
+    assert 10 != result.limit
+
+    registry.reload()
+    result = registry.find('osm')
+    assert provider.subdomain_selector is not result.subdomain_selector
+
+@mock.patch('glob.iglob')
+def test_registry_providers(mock_glob):
+    """
+    Test listing map providers identificators once.
+    """
+    mock_glob.return_value = ['/a/osm.json', '/a/bluemarble.json']
+    registry = ProviderRegistry()
+    assert ['bluemarble', 'osm'] == registry.providers()
+    assert ['bluemarble', 'osm'] == registry.providers()
+    assert 1 == mock_glob.call_count
+
+    registry.reload()
+    registry.providers()
+    assert 2 == mock_glob.call_count
+
+@mock.patch('geotiler.provider.read_config')
+@mock.patch('geotiler.provider.read_provider_data')
+def test_registry_config(mock_read, mock_config):
+    """
+    Test reading configuration once for map providers with API key
+    reference.
+    """
+    mock_read.side_effect = lambda id: {
+        'url': 'http://a/{z}/{x}/{y}.png?k={api_key}',
+        'api-key-ref': 'a-ref',
+    }
+    mock_config.return_value.has_option.return_value = True
+    mock_config.return_value.get.return_value = 'a-key'
+
+    registry = ProviderRegistry()
+    assert 'a-key' == registry.find('a').api_key
+    assert 'a-key' == registry.find('b').api_key
+    assert 1 == mock_config.call_count
+
+@mock.patch('geotiler.provider.read_provider_data')
+def test_registry_no_url(mock_read):
+    """
+    Test if error is raised for map provider without URL.
+    """
+    mock_read.return_value = {'name': 'A'}
+    registry = ProviderRegistry()
+    with pytest.raises(GeoTilerError):
+        registry.find('a')
+
 def test_base_dir():
     """
     Test base dir retrieval.
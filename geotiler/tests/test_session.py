@@ -0,0 +1,167 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+
+"""
+Map rendering session unit tests.
+"""
+
+import asyncio
+
+from geotiler.map import Map
+from geotiler.session import RenderSession
+
+import pytest
+
+class Downloader:
+    """
+    Map tiles downloader returning tiles on request.
+    """
+    def __init__(self):
+        self.requested = []
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, tiles, num_workers):
+        tiles = list(tiles)
+        self.requested.append({t.url for t in tiles})
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+        for t in tiles:
+            yield t._replace(error=ValueError('no data'))
+
+def create_map(center):
+    return Map(center=center, zoom=17, size=(300, 300))
+
+@pytest.mark.asyncio
+async def test_render_supersede():
+    """
+    Test superseding map rendering.
+    """
+    downloader = Downloader()
+    session = RenderSession(downloader=downloader)
+
+    map = create_map((11.788137, 46.481832))
+    t1 = asyncio.ensure_future(session.render(map))
+    await asyncio.sleep(0)
+
+    # move map far away, so no tile is reused
+    map.center = 11.888137, 46.481832
+    t2 = asyncio.ensure_future(session.render(map))
+    await asyncio.sleep(0)
+
+    downloader.release.set()
+    img1, img2 = await asyncio.gather(t1, t2)
+
+    assert img1 is None
+    assert (300, 300) == img2.size
+    assert 4 == len(img2.info['missing_tiles'])
+
+    assert 2 == len(downloader.requested)
+    assert not (downloader.requested[0] & downloader.requested[1])
+    assert 1 == downloader.cancelled
+
+@pytest.mark.asyncio
+async def test_render_reuse_downloads():
+    """
+    Test reusing downloads of map tiles when map rendering is superseded.
+    """
+    downloader = Downloader()
+    session = RenderSession(downloader=downloader)
+
+    map = create_map((11.788137, 46.481832))
+    t1 = asyncio.ensure_future(session.render(map))
+    await asyncio.sleep(0)
+
+    # move map by one tile
+    x, y = map.rev_geocode(map.center)
+    map.center = map.geocode((x + 256, y))
+    t2 = asyncio.ensure_future(session.render(map))
+    await asyncio.sleep(0)
+
+    downloader.release.set()
+    img1, img2 = await asyncio.gather(t1, t2)
+
+    assert img1 is None
+    assert 4 == len(img2.info['missing_tiles'])
+
+    # only a column of tiles is downloaded for the second map
+    r1, r2 = downloader.requested
+    assert 4 == len(r1)
+    assert 2 == len(r2)
+    assert not (r1 & r2)
+    assert 0 == downloader.cancelled
+
+@pytest.mark.asyncio
+async def test_render_retry_failed():
+    """
+    Test downloading again map tiles, which failed to download.
+    """
+    downloader = Downloader()
+    downloader.release.set()
+    session = RenderSession(downloader=downloader)
+
+    map = create_map((11.788137, 46.481832))
+    img = await session.render(map)
+    assert 4 == len(img.info['missing_tiles'])
+
+    # move map by one tile
+    x, y = map.rev_geocode(map.center)
+    map.center = map.geocode((x + 256, y))
+    img = await session.render(map)
+    assert 4 == len(img.info['missing_tiles'])
+
+    # all tiles of the second map are requested again
+    r1, r2 = downloader.requested
+    assert 4 == len(r1)
+    assert 4 == len(r2)
+    assert 2 == len(r1 & r2)
+
+@pytest.mark.asyncio
+async def test_fetch_tiles_supersede():
+    """
+    Test if map tiles generator stops when superseded.
+    """
+    downloader = Downloader()
+    session = RenderSession(downloader=downloader)
+
+    map = create_map((11.788137, 46.481832))
+    tiles = session.fetch_tiles(map)
+    t1 = asyncio.ensure_future(tiles.__anext__())
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+    session.cancel()
+    with pytest.raises(StopAsyncIteration):
+        await t1
+
+    await asyncio.sleep(0)
+    assert 1 == downloader.cancelled
@@ -0,0 +1,119 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Circuit breaker of map tiles downloads unit tests.
+"""
+
+import asyncio
+from unittest import mock
+
+from geotiler.errors import CircuitOpenError, TileNotFoundError
+from geotiler.map import Tile
+from geotiler.tile.breaker import CircuitBreaker
+from geotiler.tile.io import fetch_tile_breaker
+
+import pytest
+
+@mock.patch('time.monotonic')
+def test_breaker_open(monotonic):
+    """
+    Test opening circuit breaker on high error rate.
+    """
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(threshold=0.5, min_requests=4, reset=30)
+    for failed in (True, False, True):
+        assert breaker.allow()
+        breaker.record(failed)
+    assert 'closed' == breaker.state
+
+    breaker.record(True)
+    assert 'open' == breaker.state
+    assert not breaker.allow()
+
+    monotonic.return_value = 129
+    assert not breaker.allow()
+
+@mock.patch('time.monotonic')
+def test_breaker_half_open(monotonic):
+    """
+    Test probing map provider service with half-open circuit breaker.
+    """
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(min_requests=1, reset=30, probes=2)
+    breaker.record(True)
+    assert 'open' == breaker.state
+
+    # two probes are allowed, the third download is not
+    monotonic.return_value = 130
+    assert breaker.allow()
+    assert 'half-open' == breaker.state
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record(False)
+    assert 'half-open' == breaker.state
+    breaker.record(False)
+    assert 'closed' == breaker.state
+
+@mock.patch('time.monotonic')
+def test_breaker_half_open_failure(monotonic):
+    """
+    Test opening half-open circuit breaker on failed probe.
+    """
+    monotonic.return_value = 100
+    breaker = CircuitBreaker(min_requests=1, reset=30)
+    breaker.record(True)
+
+    monotonic.return_value = 130
+    assert breaker.allow()
+    breaker.record(True)
+    assert 'open' == breaker.state
+    assert not breaker.allow()
+
+@pytest.mark.asyncio
+async def test_fetch_tile_breaker():
+    """
+    Test fetching map tile with circuit breaker.
+    """
+    errors = [ValueError('e'), TileNotFoundError('e')]
+    fetch = mock.AsyncMock(side_effect=lambda t: t._replace(error=errors.pop()))
+    breaker = CircuitBreaker(min_requests=1)
+
+    # missing tile is not a failure
+    tile = Tile('http://a.b.c', None, None, None)
+    await fetch_tile_breaker(fetch, breaker, tile)
+    assert 'closed' == breaker.state
+
+    await fetch_tile_breaker(fetch, breaker, tile)
+    assert 'open' == breaker.state
+
+    result = await fetch_tile_breaker(fetch, breaker, tile)
+    assert isinstance(result.error, CircuitOpenError)
+    assert 2 == fetch.call_count
+
+# vim: sw=4:et:ai
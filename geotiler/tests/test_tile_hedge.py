@@ -0,0 +1,63 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Hedge policy of map tiles downloads unit tests.
+"""
+
+from geotiler.tile.hedge import HedgePolicy
+
+def test_hedge_delay():
+    """
+    Test hedge delay is quantile of recorded latencies.
+    """
+    hedge = HedgePolicy(min_samples=10)
+    for i in range(9):
+        hedge.record(i + 1)
+    assert hedge.delay() is None
+
+    hedge.record(10)
+    assert 10 == hedge.delay()
+
+    for i in range(100):
+        hedge.record(1)
+    assert 1 == hedge.delay()
+
+def test_hedge_budget():
+    """
+    Test hedged downloads are limited by hedge budget.
+    """
+    hedge = HedgePolicy(budget=0.1)
+    assert not hedge.allow()
+
+    for i in range(10):
+        hedge.start()
+    assert hedge.allow()
+    assert not hedge.allow()
+    assert 1 == hedge.hedges
+
+# vim: sw=4:et:ai
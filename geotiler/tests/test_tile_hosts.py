@@ -0,0 +1,130 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Map provider service hosts statistics unit tests.
+"""
+
+import math
+import threading
+
+from geotiler.provider import MapProvider
+from geotiler.tile.hosts import HostRegistry, SubdomainSelector
+
+import pytest
+
+def test_registry_score():
+    """
+    Test score of map provider service host.
+    """
+    registry = HostRegistry()
+    assert 0 == registry.score('a')
+
+    registry.start('a')
+    registry.finish('a', 0.5)
+    registry.start('a')
+    assert 1.0 == registry.score('a')
+
+    registry.finish('a')
+    assert 0.5 == registry.score('a')
+
+def test_registry_sideline():
+    """
+    Test sidelining of failing map provider service host.
+    """
+    registry = HostRegistry(max_failures=2)
+    for _ in range(2):
+        registry.start('a')
+        registry.finish('a', 0.1, error=True)
+    assert math.inf == registry.score('a')
+
+    registry.get('a').sidelined = 0
+    assert 0.1 == pytest.approx(registry.score('a'))
+
+def test_selector_round_robin():
+    """
+    Test round-robin selection of subdomains with equal scores.
+    """
+    selector = SubdomainSelector('abc', 'abc', HostRegistry())
+    assert list('abcabc') == [next(selector) for _ in range(6)]
+
+def test_selector_latency():
+    """
+    Test selection of subdomains avoiding slow host.
+    """
+    registry = HostRegistry()
+    for host, latency in zip('abc', (0.1, 2, 0.1)):
+        registry.start(host)
+        registry.finish(host, latency)
+
+    selector = SubdomainSelector('abc', 'abc', registry)
+    result = [next(selector) for _ in range(6)]
+    assert 'b' not in result
+
+def test_selector_take():
+    """
+    Test selection of subdomains for many map tiles.
+    """
+    registry = HostRegistry()
+    selector = SubdomainSelector('abc', 'abc', registry)
+    assert list('abcab') == selector.take(5)
+    assert 'c' == next(selector)
+
+    registry.start('b')
+    registry.finish('b', 2)
+    result = selector.take(6)
+    assert 'b' not in result
+
+def test_selector_threads():
+    """
+    Test selection of subdomains from multiple threads.
+    """
+    selector = SubdomainSelector('abc', 'abc', HostRegistry())
+    result = []
+    def select():
+        result.extend(next(selector) for _ in range(300))
+
+    threads = [threading.Thread(target=select) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [400] * 3 == [result.count(s) for s in 'abc']
+
+def test_provider_hosts():
+    """
+    Test host names of map provider subdomains.
+    """
+    provider = MapProvider({
+        'url': 'http://{subdomain}.tile.osm.org/{z}/{x}/{y}.png',
+        'subdomains': ['a', 'b'],
+    })
+    expected = ('a.tile.osm.org', 'b.tile.osm.org')
+    assert expected == provider.subdomain_selector.hosts
+
+# vim: sw=4:et:ai
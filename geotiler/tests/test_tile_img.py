@@ -32,7 +32,9 @@ Tests for rendering map image using map tile data.
 import asyncio
 import io
 import PIL.Image  # type: ignore
+import pytest
 
+from geotiler.errors import TileNotFoundError
 from geotiler.map import Tile
 import geotiler.tile.img as tile_img
 
@@ -46,9 +48,8 @@ def _run_render_image(map, tiles):
     :param map: Map object.
     :param tiles: Asynchronous generator of tiles.
     """
-    loop = asyncio.get_event_loop()
     task = tile_img.render_image(map, tiles)
-    image = loop.run_until_complete(task)
+    image = asyncio.run(task)
     return image
 
 async def _tile_generator(offsets, data):
@@ -88,6 +89,18 @@ def test_tile_image_jpg():
     img = tile_img._tile_image(f.getbuffer())
     assert (12, 10) == img.size
 
+def test_tile_image_resize():
+    """
+    Test converting JPEG data into PIL image object of given size.
+    """
+    tile = PIL.Image.new('RGB', (256, 256))
+    f = io.BytesIO()
+    tile.save(f, format='jpeg')
+
+    img = tile_img._tile_image(f.getbuffer(), (100, 101))
+    assert (100, 101) == img.size
+    assert 'RGBA' == img.mode
+
 def test_render_image():
     """
     Test rendering map image.
@@ -108,7 +121,7 @@ def test_render_image():
         image = _run_render_image(map, tiles)
         img_new.assert_called_once_with('RGBA', (30, 20))
         assert 4 == tf.call_count
-        tf.assert_called_with(tile)
+        tf.assert_called_with(tile, None, None, 'RGBA')
 
 def test_render_image_error():
     """
@@ -127,6 +140,337 @@ def test_render_image_error():
         tiles = _tile_generator(offsets, data)
         image = _run_render_image(map, tiles)
         assert 4 == tf.call_count
-        tf.assert_called_with(tile)
+        tf.assert_called_with(tile, None, None, 'RGBA')
+
+        missing = [t.offset for t in image.info['missing_tiles']]
+        assert [(20, 0), (10, 10)] == missing
+
+def test_render_image_not_found():
+    """
+    Test rendering map image with map tile, which does not exist.
+    """
+    map = mock.MagicMock()
+    map.size = 512, 256
+    map.provider.tile_width = 256
+    map.provider.tile_height = 256
+
+    async def tiles():
+        yield Tile('a', (0, 0), None, ValueError('error'))
+        yield Tile('b', (256, 0), None, TileNotFoundError('not found'))
+
+    image = _run_render_image(map, tiles())
+
+    # error tile is not blank, missing tile is transparent
+    assert image.crop((0, 0, 256, 256)).getbbox() is not None
+    assert image.crop((256, 0, 512, 256)).getbbox() is None
+    assert ['a', 'b'] == [t.url for t in image.info['missing_tiles']]
+
+def _run_render_image_progressive(map, tiles, rate=None):
+    """
+    Run asynchronous generator rendering map image progressively and
+    collect its results.
+    """
+    async def collect():
+        items = tile_img.render_image_progressive(map, tiles, rate=rate)
+        return [(img, boxes) async for img, boxes in items]
+
+    return asyncio.run(collect())
+
+def test_render_image_progressive():
+    """
+    Test rendering map image progressively.
+    """
+    tile = PIL.Image.new('RGBA', (10, 10))
+    map = mock.MagicMock()
+    map.size = 25, 20
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    with mock.patch('geotiler.tile.img._tile_image') as tf:
+        tf.return_value = tile
+        data = (tile, tile, None)
+        offsets = ((-5, 0), (5, 0), (15, 10))
+        tiles = _tile_generator(offsets, data)
+        result = _run_render_image_progressive(map, tiles)
+
+        assert 3 == len(result)
+        assert 2 == tf.call_count
+
+        image = result[0][0]
+        assert all(image is img for img, _ in result)
+        assert (25, 20) == image.size
+
+        boxes = [b for _, b in result]
+        assert [[(0, 0, 5, 10)], [(5, 0, 15, 10)], [(15, 10, 25, 20)]] == boxes
+
+def test_render_image_progressive_rate():
+    """
+    Test rendering map image progressively with limited number of updates.
+    """
+    tile = PIL.Image.new('RGBA', (10, 10))
+    map = mock.MagicMock()
+    map.size = 30, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    with mock.patch('geotiler.tile.img._tile_image') as tf:
+        tf.return_value = tile
+        data = (tile, tile, tile)
+        offsets = ((0, 0), (10, 0), (20, 0))
+        tiles = _tile_generator(offsets, data)
+        result = _run_render_image_progressive(map, tiles, rate=1e-6)
+
+        # first tile is yielded immediately, the rest on finish
+        boxes = [b for _, b in result]
+        assert [[(0, 0, 10, 10)], [(10, 0, 20, 10), (20, 0, 30, 10)]] == boxes
+
+def test_render_image_progressive_trailing():
+    """
+    Test if changed rectangles are yielded when update interval expires
+    without new tiles.
+    """
+    tile = PIL.Image.new('RGBA', (10, 10))
+    map = mock.MagicMock()
+    map.size = 30, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    events = []
+    async def tiles():
+        yield Tile('a', (0, 0), 'img', None)
+        yield Tile('b', (10, 0), 'img', None)
+        await asyncio.sleep(0.2)
+        events.append('tile')
+        yield Tile('c', (20, 0), 'img', None)
+
+    async def collect():
+        items = tile_img.render_image_progressive(map, tiles(), rate=10)
+        async for _, boxes in items:
+            events.append(boxes)
+
+    with mock.patch('geotiler.tile.img._tile_image') as tf:
+        tf.return_value = tile
+        asyncio.run(collect())
+
+    # second tile is flushed before third tile arrives
+    expected = [
+        [(0, 0, 10, 10)], [(10, 0, 20, 10)], 'tile', [(20, 0, 30, 10)]
+    ]
+    assert expected == events
+
+def test_render_image_box():
+    """
+    Test rendering map image using tiles with boxes as offsets.
+    """
+    tile = PIL.Image.new('RGBA', (10, 10), 'red')
+    f = io.BytesIO()
+    tile.save(f, format='png')
+
+    map = mock.MagicMock()
+    map.size = 14, 7
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    data = (f.getvalue(), None)
+    offsets = ((0, 0, 7, 7), (7, 0, 14, 7))
+    tiles = _tile_generator(offsets, data)
+    image = _run_render_image(map, tiles)
+
+    assert (14, 7) == image.size
+    assert (255, 0, 0, 255) == image.getpixel((6, 6))
+    assert [(7, 0, 14, 7)] == [t.offset for t in image.info['missing_tiles']]
+
+def test_render_layers_image():
+    """
+    Test rendering map image using map tiles of multiple map layers.
+    """
+    def png(color):
+        f = io.BytesIO()
+        PIL.Image.new('RGBA', (10, 10), color).save(f, format='png')
+        return f.getvalue()
+
+    async def tiles():
+        yield Tile('b1', (0, 0), png((255, 0, 0, 255)), None)
+        yield Tile('o2', (10, 0), None, None)
+        yield Tile('o1', (0, 0), png((0, 0, 255, 0)), None)
+        yield Tile('b2', (10, 0), png((0, 255, 0, 255)), None)
+
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    layers = {'b1': [0], 'b2': [0], 'o1': [1], 'o2': [1]}
+    image = asyncio.run(tile_img.render_layers_image(map, tiles(), layers))
+
+    assert (20, 10) == image.size
+    assert (255, 0, 0, 255) == image.getpixel((5, 5))
+    assert (0, 255, 0, 255) == image.getpixel((15, 1))
+    assert ['o2'] == [t.url for t in image.info['missing_tiles']]
+
+def test_render_layers_image_incomplete():
+    """
+    Test rendering map image when map tiles of some layers are not
+    received.
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (10, 10), (255, 0, 0, 255)).save(f, format='png')
+
+    async def tiles():
+        yield Tile('b1', (0, 0), f.getvalue(), None)
+
+    map = mock.MagicMock()
+    map.size = 10, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    layers = {'b1': [0], 'o1': [1]}
+    image = asyncio.run(tile_img.render_layers_image(map, tiles(), layers))
+    assert (255, 0, 0, 255) == image.getpixel((5, 5))
+
+def test_tile_image_mode():
+    """
+    Test converting image data into PIL image object of requested mode.
+    """
+    f = io.BytesIO()
+    PIL.Image.new('L', (10, 10)).save(f, format='png')
+
+    with mock.patch.object(PIL.Image.Image, 'convert') as convert:
+        img = tile_img._tile_image(f.getvalue(), mode='L')
+        assert 'L' == img.mode
+        assert not convert.called
+
+    img = tile_img._tile_image(f.getvalue(), mode='RGB')
+    assert 'RGB' == img.mode
+
+def test_render_image_mode():
+    """
+    Test rendering map image in RGB and P modes.
+    """
+    tile = PIL.Image.new('RGB', (10, 10), 'red')
+    f = io.BytesIO()
+    tile.save(f, format='jpeg')
+
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    tiles = _tile_generator(((0, 0), (10, 0)), (f.getvalue(), None))
+    image = asyncio.run(tile_img.render_image(map, tiles, mode='RGB'))
+    assert 'RGB' == image.mode
+    assert 3 == len(image.getpixel((5, 5)))
+
+    tiles = _tile_generator(((0, 0), (10, 0)), (f.getvalue(), None))
+    image = asyncio.run(tile_img.render_image(map, tiles, mode='P'))
+    assert 'P' == image.mode
+    assert [(10, 0)] == [t.offset for t in image.info['missing_tiles']]
+
+def test_render_image_mode_error():
+    """
+    Test rendering map image in unsupported mode.
+    """
+    map = mock.MagicMock()
+    tiles = _tile_generator((), ())
+    with pytest.raises(ValueError):
+        asyncio.run(tile_img.render_image(map, tiles, mode='CMYK'))
+
+    with pytest.raises(ValueError):
+        _run_render_image_progressive_mode(map, tiles, 'P')
+
+def _run_render_image_progressive_mode(map, tiles, mode):
+    """
+    Run asynchronous generator rendering map image progressively in given
+    mode.
+    """
+    async def collect():
+        items = tile_img.render_image_progressive(map, tiles, mode=mode)
+        return [item async for item in items]
+
+    return asyncio.run(collect())
+
+def test_render_image_target():
+    """
+    Test rendering map image into existing image.
+    """
+    tile = PIL.Image.new('RGB', (10, 10), 'red')
+    f = io.BytesIO()
+    tile.save(f, format='png')
+
+    map = mock.MagicMock()
+    map.size = 20, 10
+    map.provider.tile_width = 10
+    map.provider.tile_height = 10
+
+    target = PIL.Image.new('RGB', (20, 10), 'blue')
+    target.info['missing_tiles'] = ['old']
+    tiles = _tile_generator(((0, 0), (10, 0)), (f.getvalue(), None))
+    with mock.patch.object(PIL.Image, 'new') as img_new:
+        task = tile_img.render_image(map, tiles, mode='RGB', image=target)
+        image = asyncio.run(task)
+        assert not img_new.called
+
+    assert image is target
+    assert (255, 0, 0) == image.getpixel((5, 5))
+    assert [(10, 0)] == [t.offset for t in image.info['missing_tiles']]
+
+def test_render_image_target_error():
+    """
+    Test rendering map image into image of invalid size or mode.
+    """
+    map = mock.MagicMock()
+    map.size = 20, 10
+
+    images = [
+        PIL.Image.new('RGBA', (10, 10)),
+        PIL.Image.new('RGB', (20, 10)),
+        PIL.Image.new('P', (20, 10)),
+    ]
+    for mode, target in zip(('RGBA', 'RGBA', 'P'), images):
+        tiles = _tile_generator((), ())
+        task = tile_img.render_image(map, tiles, mode=mode, image=target)
+        with pytest.raises(ValueError):
+            asyncio.run(task)
+
+def test_canvas_pool():
+    """
+    Test reusing images with pool of map images.
+    """
+    pool = tile_img.CanvasPool(size=1)
+    img1 = pool.get((20, 10))
+    img2 = pool.get((20, 10))
+    assert img1 is not img2
+    assert ((20, 10), 'RGBA') == (img1.size, img1.mode)
+
+    pool.put(img1)
+    pool.put(img1)
+    pool.put(img2)
+    assert img1 is pool.get((20, 10))
+    assert img1 is not pool.get((20, 10))
+
+    img3 = pool.get((20, 10), 'RGB')
+    assert 'RGB' == img3.mode
+
+def test_downsample_image():
+    """
+    Test downsampling map image by reducing and resizing.
+    """
+    image = PIL.Image.new('RGBA', (40, 20))
+    with mock.patch.object(image, 'reduce', wraps=image.reduce) as reduce:
+        assert (10, 5) == tile_img.downsample_image(image, (10, 5)).size
+        reduce.assert_called_once_with((4, 4))
+
+    assert (30, 15) == tile_img.downsample_image(image, (30, 15)).size
+    assert image is tile_img.downsample_image(image, (40, 20))
+    with pytest.raises(ValueError):
+        tile_img.downsample_image(image, (50, 20))
+
+def test_blank_tile():
+    """
+    Test creating PNG data of transparent map tile image.
+    """
+    img = tile_img._tile_image(tile_img.blank_tile(10, 12))
+    assert (10, 12) == img.size
+    assert (0, 0, 0, 0) == img.getpixel((5, 5))
 
 # vim: sw=4:et:ai
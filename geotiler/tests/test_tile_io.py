@@ -31,11 +31,19 @@ Map tile downloading unit tests.
 
 import asyncio
 import aiohttp
+import gc
+import threading
 from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import geotiler.tile.io
+from geotiler.errors import TileNotFoundError
+from geotiler.loop import run_sync
 from geotiler.map import Tile
-from geotiler.tile.io import fetch_tile, fetch_tiles
+from geotiler.tile.hedge import HedgePolicy
+from geotiler.tile.hosts import HOSTS
+from geotiler.tile.io import fetch_tile, fetch_tile_until, fetch_tiles, \
+    fetch_tile_mirrors, client_session, close_session
 
 import pytest
 from unittest import mock
@@ -116,7 +124,10 @@ async def test_fetch_tiles(session):
         task.set_result(tile)
 
     ctx_ac = mock.patch.object(asyncio, 'as_completed')
-    ctx_ft = mock.patch.object(geotiler.tile.io, 'fetch_tile')
+    # tasks are mocked, so `fetch_tile` coroutines are never awaited
+    ctx_ft = mock.patch.object(
+        geotiler.tile.io, 'fetch_tile', new_callable=mock.MagicMock
+    )
     with ctx_ac as mock_as_completed, ctx_ft:
         mock_as_completed.return_value = tasks
         tiles = [t async for t in fetch_tiles(tiles, 2)]
@@ -127,4 +138,263 @@ async def test_fetch_tiles(session):
         error = [tile.error for tile in tiles]
         assert [None, None, 'error', None] == error, tiles
 
+def test_client_session():
+    """
+    Test if HTTP client session is shared within background event loop.
+    """
+    async def f():
+        return client_session()
+
+    session = run_sync(f())
+    try:
+        assert session is run_sync(f())
+    finally:
+        run_sync(close_session())
+
+    assert session.closed
+    assert session is not run_sync(f())
+    run_sync(close_session())
+
+def test_client_session_loop(recwarn):
+    """
+    Test if HTTP client session is not shared outside background event
+    loop, and its connections are closed.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '5')
+            self.end_headers()
+            self.wfile.write(b'image')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/{{}}'.format(server.server_port)
+
+    async def images():
+        tiles = [Tile(url.format(i), None, None, None) for i in range(4)]
+        return [t.img async for t in fetch_tiles(tiles, 2)]
+
+    sessions = []
+    create = geotiler.tile.io._new_session
+    def new_session():
+        sessions.append(create())
+        return sessions[-1]
+
+    try:
+        with mock.patch.object(geotiler.tile.io, '_new_session', new_session):
+            for _ in range(2):
+                assert [b'image'] * 4 == asyncio.run(images())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # new session for each event loop, closed when download is finished
+    assert 2 == len(sessions)
+    assert all(s.closed for s in sessions)
+
+    gc.collect()
+    assert not [w for w in recwarn if issubclass(w.category, ResourceWarning)]
+
+    with pytest.raises(RuntimeError):
+        client_session()
+
+@pytest.mark.asyncio
+@mock.patch('aiohttp.ClientSession')
+async def test_fetch_tile_timeout(session):
+    """
+    Test fetching a map tile with a timeout error.
+    """
+    tile = Tile('http://a.b.c', None, None, None)
+    mock_get = session.get.return_value
+    mock_get.__aenter__.side_effect = asyncio.TimeoutError()
+
+    tile = await fetch_tile(session, tile)
+    assert tile.img is None
+
+    error = 'Unable to download http://a.b.c (error: timeout)'
+    assert error == str(tile.error)
+
+@pytest.mark.asyncio
+@mock.patch('aiohttp.ClientSession')
+async def test_fetch_tile_slow(session):
+    """
+    Test if slow download of a map tile is cancelled on timeout, even if
+    tile data keeps arriving.
+    """
+    async def read():
+        await asyncio.sleep(1)
+        return 'image'
+
+    tile = Tile('http://a.b.c', None, None, None)
+    with mock_url_open(session, None) as session:
+        mock_ctx = session.get.return_value.__aenter__.return_value
+        mock_ctx.read = read
+        tile = await fetch_tile(session, tile, timeout=0.05)
+
+    assert tile.img is None
+    error = 'Unable to download http://a.b.c (error: timeout)'
+    assert error == str(tile.error)
+
+@pytest.mark.asyncio
+@mock.patch('aiohttp.ClientSession')
+async def test_fetch_tile_hosts_outstanding(session):
+    """
+    Test if number of outstanding downloads of a host is decremented when
+    a download is cancelled or fails with unexpected error.
+    """
+    async def read():
+        await asyncio.sleep(1)
+
+    with mock_url_open(session, None) as session:
+        mock_ctx = session.get.return_value.__aenter__.return_value
+        mock_ctx.read = read
+
+        tile = Tile('http://outstanding.test/1', None, None, None)
+        task = asyncio.ensure_future(fetch_tile(session, tile))
+        await asyncio.sleep(0)
+        assert 1 == HOSTS.get('outstanding.test').outstanding
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert 0 == HOSTS.get('outstanding.test').outstanding
+
+        mock_ctx.read = mock.AsyncMock(side_effect=RuntimeError('error'))
+        with pytest.raises(RuntimeError):
+            await fetch_tile(session, tile)
+        assert 0 == HOSTS.get('outstanding.test').outstanding
+
+@pytest.mark.asyncio
+async def test_fetch_tile_until():
+    """
+    Test fetching a map tile with a deadline.
+    """
+    async def fetch(tile):
+        await asyncio.sleep(delay)
+        return tile._replace(img='image')
+
+    tile = Tile('http://a.b.c', None, None, None)
+    deadline = asyncio.get_running_loop().time() + 0.1
+
+    delay = 0
+    result = await fetch_tile_until(fetch, deadline, tile)
+    assert 'image' == result.img
+    assert result.error is None
+
+    delay = 10
+    result = await fetch_tile_until(fetch, deadline, tile)
+    assert result.img is None
+    error = 'Unable to download http://a.b.c (error: deadline exceeded)'
+    assert error == str(result.error)
+
+@pytest.mark.asyncio
+@mock.patch('aiohttp.ClientSession')
+async def test_fetch_tile_not_found(session):
+    """
+    Test fetching a map tile, which does not exist.
+    """
+    tile = Tile('http://a.b.c', None, None, None)
+    mock_get = session.get.return_value
+    mock_get.__aenter__.side_effect = aiohttp.ClientResponseError(
+        mock.MagicMock(), (), status=404
+    )
+
+    tile = await fetch_tile(session, tile)
+    assert tile.img is None
+    assert isinstance(tile.error, TileNotFoundError)
+
+@pytest.mark.asyncio
+async def test_fetch_tile_mirrors_failover():
+    """
+    Test fetching a map tile failing over to a mirror.
+    """
+    async def fetch(tile):
+        if tile.url == 'http://a':
+            return tile._replace(error=ValueError('error'))
+        return tile._replace(img=tile.url)
+
+    tile = Tile('http://a', None, None, None, ('http://b', 'http://c'))
+    result = await fetch_tile_mirrors(fetch, None, tile)
+    assert 'http://b' == result.img
+    assert 'http://a' == result.url
+    assert result.error is None
+
+@pytest.mark.asyncio
+async def test_fetch_tile_mirrors_not_found():
+    """
+    Test fetching a map tile, which does not exist, is not failing over
+    to a mirror.
+    """
+    fetch = mock.AsyncMock(
+        side_effect=lambda t: t._replace(error=TileNotFoundError('e'))
+    )
+
+    tile = Tile('http://a', None, None, None, ('http://b',))
+    result = await fetch_tile_mirrors(fetch, None, tile)
+    assert isinstance(result.error, TileNotFoundError)
+    assert 1 == fetch.call_count
+
+@pytest.mark.asyncio
+async def test_fetch_tile_mirrors_hedge():
+    """
+    Test hedging a slow download of a map tile at a mirror.
+    """
+    async def fetch(tile):
+        if tile.url == 'http://a':
+            await asyncio.sleep(10)
+        return tile._replace(img=tile.url)
+
+    hedge = HedgePolicy(min_samples=1, budget=1)
+    hedge.record(0.01)
+
+    tile = Tile('http://a', None, None, None, ('http://b',))
+    result = await asyncio.wait_for(fetch_tile_mirrors(fetch, hedge, tile), 1)
+    assert 'http://b' == result.img
+    assert 'http://a' == result.url
+    assert 1 == hedge.hedges
+
+@pytest.mark.asyncio
+async def test_fetch_tile_mirrors_hedge_refused_failover():
+    """
+    Test failing over to a mirror when hedge of a download is refused.
+    """
+    async def fetch(tile):
+        if tile.url == 'http://a':
+            await asyncio.sleep(0.05)
+            return tile._replace(error=ValueError('error'))
+        return tile._replace(img=tile.url)
+
+    hedge = HedgePolicy(min_samples=1, budget=0)
+    hedge.record(0.01)
+
+    tile = Tile('http://a', None, None, None, ('http://b',))
+    result = await fetch_tile_mirrors(fetch, hedge, tile)
+    assert 'http://b' == result.img
+    assert result.error is None
+    assert 0 == hedge.hedges
+
+@pytest.mark.asyncio
+async def test_fetch_tile_mirrors_hedge_budget():
+    """
+    Test a slow download of a map tile is not hedged when hedge budget is
+    exhausted.
+    """
+    async def fetch(tile):
+        await asyncio.sleep(0.05)
+        return tile._replace(img=tile.url)
+
+    hedge = HedgePolicy(min_samples=1, budget=0)
+    hedge.record(0.01)
+
+    tile = Tile('http://a', None, None, None, ('http://b',))
+    result = await fetch_tile_mirrors(fetch, hedge, tile)
+    assert 'http://a' == result.img
+    assert 0 == hedge.hedges
+
 # vim: sw=4:et:ai
@@ -0,0 +1,238 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Adaptive limiter of map tiles downloads unit tests.
+"""
+
+import asyncio
+import aiohttp
+from unittest import mock
+
+from geotiler.map import Tile
+from geotiler.tile.io import fetch_tile_limited, _is_congested
+from geotiler.tile.limit import AdaptiveLimiter, HostLimit
+
+import pytest
+
+def test_limiter_increase():
+    """
+    Test additive increase of limit of adaptive limiter up to ceiling.
+    """
+    async def run():
+        for _ in range(20):
+            await limiter.acquire(4)
+            limiter.release(0.1)
+
+    limiter = AdaptiveLimiter()
+    asyncio.run(run())
+    assert 4 == limiter.limit
+    assert 0.1 == pytest.approx(limiter.latency)
+
+def test_limiter_decrease():
+    """
+    Test multiplicative decrease of limit of adaptive limiter.
+    """
+    async def run(latency, congested):
+        await limiter.acquire(16)
+        limiter.release(latency, congested)
+
+    limiter = AdaptiveLimiter(limit=8)
+
+    # decreased once for a burst of errors
+    asyncio.run(run(0.1, True))
+    asyncio.run(run(0.1, True))
+    assert 4 == limiter.limit
+
+    # latency spike
+    limiter._last_decrease = 0
+    asyncio.run(run(1, False))
+    assert 2 == limiter.limit
+
+def test_limiter_acquire():
+    """
+    Test waiting for a download slot of adaptive limiter.
+    """
+    async def run():
+        await limiter.acquire(10)
+        await limiter.acquire(10)
+        task = asyncio.ensure_future(limiter.acquire(10))
+        await asyncio.sleep(0)
+        assert not task.done()
+
+        limiter.release()
+        await task
+        assert 2 == limiter._active
+
+    limiter = AdaptiveLimiter(limit=2)
+    asyncio.run(run())
+    assert 2 == limiter.limit
+
+def test_limiter_scaling():
+    """
+    Test if adaptive limiter wakes one waiting download per free download
+    slot, so many downloads are started in linear time.
+    """
+    async def download():
+        await limiter.acquire(10)
+        await asyncio.sleep(0)
+        limiter.release()
+
+    async def run(n):
+        await asyncio.gather(*(download() for _ in range(n)))
+
+    limiter = AdaptiveLimiter(limit=2)
+    futures = []
+    loop = asyncio.new_event_loop()
+    create_future = loop.create_future
+    def counted():
+        futures.append(1)
+        return create_future()
+
+    with mock.patch.object(loop, 'create_future', counted):
+        loop.run_until_complete(run(4000))
+    loop.close()
+
+    # each waiting download waits once
+    assert len(futures) <= 4000
+    assert 0 == limiter._active
+    assert not limiter._waiters
+
+def test_fetch_tile_limited():
+    """
+    Test fetching map tile with adaptive limiter.
+    """
+    async def fetch(tile):
+        error = ValueError('error')
+        error.__cause__ = aiohttp.ClientResponseError(
+            mock.MagicMock(), (), status=503
+        )
+        return tile._replace(error=error)
+
+    limiter = AdaptiveLimiter(limit=4)
+    tile = Tile('http://a.b.c', None, None, None)
+    asyncio.run(fetch_tile_limited(fetch, limiter, 8, tile))
+
+    assert 2 == limiter.limit
+    assert 0 == limiter._active
+
+def test_is_congested():
+    """
+    Test checking if map tile download error indicates congestion.
+    """
+    def error(cause):
+        ex = ValueError('error')
+        ex.__cause__ = cause
+        return ex
+
+    response = lambda status: aiohttp.ClientResponseError(
+        mock.MagicMock(), (), status=status
+    )
+    assert _is_congested(error(response(429)))
+    assert _is_congested(error(response(502)))
+    assert _is_congested(error(asyncio.TimeoutError()))
+    assert not _is_congested(error(response(404)))
+    assert not _is_congested(None)
+
+def test_host_limit_background():
+    """
+    Test if background download yields to foreground download waiting for
+    host limit.
+    """
+    async def download(name, num_workers, background):
+        await limit.acquire(num_workers, background)
+        order.append(name)
+        await asyncio.sleep(0)
+        limit.release()
+
+    async def run():
+        await limit.acquire(1)
+        tasks = [
+            asyncio.create_task(download('bg', 1, True)),
+            asyncio.create_task(download('fg', 1, False)),
+        ]
+        await asyncio.sleep(0)
+        limit.release()
+        await asyncio.gather(*tasks)
+
+    limit = HostLimit()
+    order = []
+    asyncio.run(run())
+    assert ['fg', 'bg'] == order
+
+def test_host_limit_scaling():
+    """
+    Test if host limit wakes one waiting download per finished download,
+    so many downloads are started in linear time.
+    """
+    async def download():
+        await limit.acquire(2)
+        await asyncio.sleep(0)
+        limit.release()
+
+    async def run(n):
+        await asyncio.gather(*(download() for _ in range(n)))
+
+    limit = HostLimit()
+    futures = []
+    loop = asyncio.new_event_loop()
+    create_future = loop.create_future
+    def counted():
+        futures.append(1)
+        return create_future()
+
+    with mock.patch.object(loop, 'create_future', counted):
+        loop.run_until_complete(run(4000))
+    loop.close()
+
+    # each waiting download waits once
+    assert len(futures) <= 4000
+    assert 0 == limit._active
+    assert not limit._foreground
+
+def test_host_limit_cancel():
+    """
+    Test if download started for a cancelled waiting download is passed
+    on to next waiting download.
+    """
+    async def run():
+        await limit.acquire(1)
+        t1 = asyncio.ensure_future(limit.acquire(1))
+        t2 = asyncio.ensure_future(limit.acquire(1))
+        await asyncio.sleep(0)
+
+        # slot handed over to first waiting download, which is cancelled
+        limit.release()
+        t1.cancel()
+        await asyncio.gather(t1, return_exceptions=True)
+        await t2
+        assert 1 == limit._active
+
+    limit = HostLimit()
+    asyncio.run(run())
+
+# vim: sw=4:et:ai
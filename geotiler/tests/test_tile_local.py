@@ -0,0 +1,130 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Local sources of map tiles unit tests.
+"""
+
+import asyncio
+import io
+import sqlite3
+
+import PIL.Image
+
+from geotiler.errors import TileNotFoundError
+from geotiler.map import Map, Tile, render_map_async
+from geotiler.provider import MapProvider
+from geotiler.tile.io import fetch_tiles
+from geotiler.tile.local import is_local
+
+def tile_data(color):
+    """
+    Create PNG image data of a map tile.
+    """
+    f = io.BytesIO()
+    PIL.Image.new('RGB', (256, 256), color).save(f, format='PNG')
+    return f.getvalue()
+
+async def fetch(tiles, num_workers):
+    return {t.url: t async for t in fetch_tiles(tiles, num_workers)}
+
+def test_is_local():
+    """
+    Test checking if URL of a map tile points to a local source.
+    """
+    assert is_local('file:///tiles/1/2/3.png')
+    assert is_local('mbtiles:///world.mbtiles#1/2/3')
+    assert not is_local('https://tile.openstreetmap.org/1/2/3.png')
+
+def test_fetch_files(tmp_path):
+    """
+    Test reading map tiles from tree of map tiles files.
+    """
+    (tmp_path / '1' / '0').mkdir(parents=True)
+    (tmp_path / '1' / '0' / '1.png').write_bytes(b'tile')
+
+    url = 'file://{}/1/0/{{}}.png'.format(tmp_path)
+    tiles = [Tile(url.format(1), (0, 0), None, None)]
+    tiles.append(Tile(url.format(0), (0, 256), None, None))
+
+    result = asyncio.run(fetch(tiles, 1))
+    assert b'tile' == result[url.format(1)].img
+    assert (0, 0) == result[url.format(1)].offset
+    assert isinstance(result[url.format(0)].error, TileNotFoundError)
+
+def test_fetch_mbtiles(tmp_path):
+    """
+    Test reading map tiles from MBTiles file.
+    """
+    path = tmp_path / 'world.mbtiles'
+    db = sqlite3.connect(str(path))
+    db.execute(
+        'create table tiles (zoom_level integer, tile_column integer,'
+        ' tile_row integer, tile_data blob)'
+    )
+    # row of tile 2/1/0 is flipped
+    db.execute('insert into tiles values (2, 1, 3, ?)', (b'tile',))
+    db.commit()
+    db.close()
+
+    url = 'mbtiles://{}#2/{{}}/{{}}'.format(path)
+    tiles = [Tile(url.format(x, 0), None, None, None) for x in range(3)]
+    result = asyncio.run(fetch(tiles, 2))
+
+    assert b'tile' == result[url.format(1, 0)].img
+    assert isinstance(result[url.format(0, 0)].error, TileNotFoundError)
+    assert isinstance(result[url.format(2, 0)].error, TileNotFoundError)
+
+def test_fetch_mbtiles_error(tmp_path):
+    """
+    Test reading map tiles from MBTiles file, which does not exist.
+    """
+    url = 'mbtiles://{}/none.mbtiles#0/0/0'.format(tmp_path)
+    result = asyncio.run(fetch([Tile(url, None, None, None)], 1))
+    assert isinstance(result[url].error, ValueError)
+    assert not isinstance(result[url].error, TileNotFoundError)
+
+def test_render_map_files(tmp_path):
+    """
+    Test rendering map using tree of map tiles files.
+    """
+    for x in range(2):
+        for y in range(2):
+            (tmp_path / '1' / str(x)).mkdir(parents=True, exist_ok=True)
+            path = tmp_path / '1' / str(x) / '{}.png'.format(y)
+            path.write_bytes(tile_data((x * 255, y * 255, 0)))
+
+    url = 'file://{}/{{z}}/{{x}}/{{y}}.{{ext}}'.format(tmp_path)
+    provider = MapProvider({'url': url, 'limit': 2})
+    map = Map(center=(0, 0), zoom=1, size=(512, 512), provider=provider)
+    image = asyncio.run(render_map_async(map))
+
+    assert (0, 0, 0, 255) == image.getpixel((10, 10))
+    assert (255, 255, 0, 255) == image.getpixel((500, 500))
+    assert [] == image.info['missing_tiles']
+
+# vim: sw=4:et:ai
@@ -0,0 +1,148 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Circuit breaker of map tiles downloads.
+"""
+
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+class CircuitBreaker:
+    """
+    Circuit breaker of map tiles downloads from map provider service.
+
+    The circuit breaker is closed initially and map tiles are downloaded.
+    It opens when error rate of recent downloads is greater or equal
+    `threshold`. While open, the downloads fail immediately. After `reset`
+    seconds, the circuit breaker is half-open and allows `probes`
+    downloads. It closes if all of them succeed, and opens again on first
+    error.
+
+    Use one circuit breaker per map provider. The circuit breaker is not
+    thread safe.
+
+    :var threshold: Error rate, which opens the circuit breaker.
+    :var min_requests: Minimum number of recent downloads to calculate
+        error rate.
+    :var reset: Time in seconds after which open circuit breaker becomes
+        half-open.
+    :var probes: Number of downloads allowed by half-open circuit breaker.
+    :var state: State of the circuit breaker - closed, open or half-open.
+    """
+    def __init__(
+            self, threshold=0.5, min_requests=10, window=20, reset=30,
+            probes=3
+        ):
+        """
+        Create circuit breaker.
+
+        :param threshold: Error rate, which opens the circuit breaker.
+        :param min_requests: Minimum number of recent downloads to
+            calculate error rate.
+        :param window: Number of recent downloads used to calculate error
+            rate.
+        :param reset: Time in seconds after which open circuit breaker
+            becomes half-open.
+        :param probes: Number of downloads allowed by half-open circuit
+            breaker.
+        """
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.reset = reset
+        self.probes = probes
+        self.state = CLOSED
+
+        self._results = collections.deque(maxlen=window)
+        self._opened = None
+        self._probing = 0
+        self._succeeded = 0
+
+    def allow(self):
+        """
+        Check if a map tile can be downloaded.
+
+        If true is returned, then result of the download has to be
+        recorded with :py:meth:`CircuitBreaker.record` method.
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened < self.reset:
+                return False
+            self._change(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._probing + self._succeeded >= self.probes:
+                return False
+            self._probing += 1
+
+        return True
+
+    def record(self, failed=None):
+        """
+        Record result of a map tile download.
+
+        If `failed` is null, i.e. download was cancelled, then the result
+        is ignored.
+
+        :param failed: True if the download failed.
+        """
+        if self.state == HALF_OPEN:
+            self._probing = max(0, self._probing - 1)
+            if failed:
+                self._change(OPEN)
+            elif failed is not None:
+                self._succeeded += 1
+                if self._succeeded >= self.probes:
+                    self._change(CLOSED)
+        elif self.state == CLOSED and failed is not None:
+            results = self._results
+            results.append(failed)
+            n = len(results)
+            if n >= self.min_requests and sum(results) / n >= self.threshold:
+                self._change(OPEN)
+
+    def _change(self, state):
+        """
+        Change state of the circuit breaker.
+        """
+        if state == OPEN:
+            self._opened = time.monotonic()
+        self._results.clear()
+        self._probing = 0
+        self._succeeded = 0
+        self.state = state
+        if __debug__:
+            logger.debug('circuit breaker {}'.format(state))
+
+# vim: sw=4:et:ai
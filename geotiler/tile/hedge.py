@@ -0,0 +1,121 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Hedged requests to reduce tail latency of map tiles downloads.
+"""
+
+import collections
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+class HedgePolicy:
+    """
+    Policy of hedged downloads of map tiles.
+
+    If a map tile is not downloaded after a quantile of latency of recent
+    downloads (p95 by default), then duplicate download of the tile is
+    started at a mirror of map provider service. The first successful
+    download wins, and the other one is cancelled.
+
+    The number of hedged downloads is limited by `budget`, which is the
+    fraction of all downloads. No downloads are hedged until `min_samples`
+    latencies are recorded.
+
+    Use one policy per map provider. The policy is not thread safe.
+
+    :var quantile: Quantile of latency after which a download is hedged.
+    :var budget: Maximum fraction of hedged downloads.
+    :var min_samples: Minimum number of recorded latencies to hedge
+        downloads.
+    :var requests: Number of downloads of map tiles.
+    :var hedges: Number of hedged downloads of map tiles.
+    """
+    def __init__(self, quantile=0.95, budget=0.1, min_samples=20, window=100):
+        """
+        Create policy of hedged downloads.
+
+        :param quantile: Quantile of latency after which a download is
+            hedged.
+        :param budget: Maximum fraction of hedged downloads.
+        :param min_samples: Minimum number of recorded latencies to hedge
+            downloads.
+        :param window: Number of recent latencies used to estimate the
+            quantile.
+        """
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+
+        self._latencies = collections.deque(maxlen=window)
+
+    def delay(self):
+        """
+        Get time in seconds after which a download is hedged.
+
+        Null is returned if there are not enough latencies recorded.
+        """
+        n = len(self._latencies)
+        if n < max(1, self.min_samples):
+            return None
+        latencies = sorted(self._latencies)
+        k = min(n - 1, math.ceil(self.quantile * n) - 1)
+        return latencies[max(0, k)]
+
+    def start(self):
+        """
+        Register start of a download of a map tile.
+        """
+        self.requests += 1
+
+    def allow(self):
+        """
+        Check if a download can be hedged and register the hedged download
+        if so.
+        """
+        allowed = self.hedges < self.budget * self.requests
+        if allowed:
+            self.hedges += 1
+        if __debug__:
+            logger.debug('hedge download: {}, hedges: {}'.format(
+                allowed, self.hedges
+            ))
+        return allowed
+
+    def record(self, latency):
+        """
+        Record latency of a successful download of a map tile.
+
+        :param latency: Latency of the download in seconds.
+        """
+        self._latencies.append(latency)
+
+# vim: sw=4:et:ai
@@ -0,0 +1,233 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Statistics of map provider service hosts and latency aware selection of
+map provider subdomains.
+"""
+
+import logging
+import math
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+class HostStats:
+    """
+    Statistics of a map provider service host.
+
+    :var latency: Average latency of downloads (exponential moving
+        average), null if unknown.
+    :var outstanding: Number of downloads in progress.
+    :var failures: Number of consecutive failed downloads.
+    :var sidelined: Time until the host is sidelined (monotonic clock).
+    """
+    __slots__ = 'latency', 'outstanding', 'failures', 'sidelined'
+
+    def __init__(self):
+        self.latency = None
+        self.outstanding = 0
+        self.failures = 0
+        self.sidelined = 0
+
+class HostRegistry:
+    """
+    Thread safe registry of statistics of map provider service hosts.
+
+    A host is sidelined for `sideline` seconds after `max_failures`
+    consecutive failed downloads.
+
+    :var max_failures: Number of consecutive failures sidelining a host.
+    :var sideline: Time in seconds, for which a host is sidelined.
+    """
+    def __init__(self, max_failures=3, sideline=30):
+        """
+        Create registry of statistics of map provider service hosts.
+
+        :param max_failures: Number of consecutive failures sidelining a
+            host.
+        :param sideline: Time in seconds, for which a host is sidelined.
+        """
+        self.max_failures = max_failures
+        self.sideline = sideline
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """
+        Get statistics of a host.
+
+        :param host: Host name.
+        """
+        with self._lock:
+            return self._hosts.setdefault(host, HostStats())
+
+    def start(self, host):
+        """
+        Register start of a download from a host.
+
+        :param host: Host name.
+        """
+        with self._lock:
+            self._hosts.setdefault(host, HostStats()).outstanding += 1
+
+    def finish(self, host, latency=None, error=False):
+        """
+        Register end of a download from a host.
+
+        If latency is null, i.e. download was cancelled, then latency and
+        failure statistics are not changed.
+
+        :param host: Host name.
+        :param latency: Latency of the download in seconds.
+        :param error: True if the download failed.
+        """
+        with self._lock:
+            stats = self._hosts.setdefault(host, HostStats())
+            stats.outstanding = max(0, stats.outstanding - 1)
+            if latency is None:
+                return
+
+            avg = stats.latency
+            stats.latency = latency if avg is None else 0.8 * avg + 0.2 * latency
+            if not error:
+                stats.failures = 0
+                return
+
+            stats.failures += 1
+            if stats.failures >= self.max_failures:
+                stats.sidelined = time.monotonic() + self.sideline
+                stats.failures = 0
+                logger.warning('host sidelined: {}'.format(host))
+
+    def score(self, host):
+        """
+        Get score of a host; the lower score, the better host.
+
+        The score is average latency multiplied by number of downloads in
+        progress plus one. Sidelined host has infinite score. Host with
+        unknown latency has score zero, so it is tried.
+
+        :param host: Host name.
+        """
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats is None or stats.latency is None:
+                return 0
+            if stats.sidelined > time.monotonic():
+                return math.inf
+            return stats.latency * (stats.outstanding + 1)
+
+    def clear(self):
+        """
+        Remove statistics of all hosts.
+        """
+        with self._lock:
+            self._hosts.clear()
+
+class SubdomainSelector:
+    """
+    Thread safe, latency aware selector of map provider subdomains.
+
+    The selector takes next two subdomains in round-robin order, and
+    chooses the subdomain with better score of its host (see
+    :py:meth:`HostRegistry.score`). If scores are equal, the selection is
+    round-robin.
+
+    :var subdomains: Subdomains of a map provider.
+    :var hosts: Host names of the subdomains.
+    :var registry: Registry of statistics of hosts.
+    """
+    def __init__(self, subdomains, hosts, registry=None):
+        """
+        Create selector of map provider subdomains.
+
+        :param subdomains: Subdomains of a map provider.
+        :param hosts: Host names of the subdomains.
+        :param registry: Registry of statistics of hosts, global registry
+            by default.
+        """
+        self.subdomains = tuple(subdomains)
+        self.hosts = tuple(hosts)
+        self.registry = HOSTS if registry is None else registry
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        n = len(self.subdomains)
+        if n == 1:
+            return self.subdomains[0]
+
+        with self._lock:
+            i = self._next
+            self._next = (i + 1) % n
+
+        j = (i + 1) % n
+        score = self.registry.score
+        k = j if score(self.hosts[j]) < score(self.hosts[i]) else i
+        return self.subdomains[k]
+
+    def take(self, n):
+        """
+        Select subdomains for `n` map tiles.
+
+        Scores of the hosts are read once for all the map tiles.
+
+        :param n: Number of map tiles.
+        """
+        k = len(self.subdomains)
+        if k == 1:
+            return [self.subdomains[0]] * n
+
+        with self._lock:
+            start = self._next
+            self._next = (start + n) % k
+
+        scores = [self.registry.score(h) for h in self.hosts]
+        choice = [
+            self.subdomains[(i + 1) % k if scores[(i + 1) % k] < scores[i] else i]
+            for i in range(k)
+        ]
+        return [choice[(start + p) % k] for p in range(n)]
+
+def url_host(url):
+    """
+    Get host name of URL.
+
+    :param url: URL.
+    """
+    return urlsplit(url).hostname
+
+# global registry of statistics of map provider service hosts
+HOSTS = HostRegistry()
+
+# vim: sw=4:et:ai
@@ -27,18 +27,29 @@
 
 """
 Render map image using map tile data.
+
+The `PIL` library is imported on first use to keep import of GeoTiler
+fast.
 """
 
+import asyncio
+import collections
 import io
 import functools
 import logging
+import threading
 
-import PIL.Image  # type: ignore
-import PIL.ImageDraw  # type: ignore
+from ..errors import TileNotFoundError
 
 logger = logging.getLogger(__name__)
 
-async def render_image(map, tiles):
+# supported modes of map image
+MODES = 'RGBA', 'RGB', 'L', 'P'
+
+# supported formats of encoded map image
+FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+async def render_image(map, tiles, resample=None, mode='RGBA', image=None):
     """
     Redner map image using map tile data.
 
@@ -48,28 +59,489 @@ async def render_image(map, tiles):
     could not be downloaded, i.e. due to network error.
 
     The map tiles are rendered into single map image. Error tile image is
-    rendered if data for a tile does not exist.
+    rendered if data for a tile does not exist. A map tile, which does not
+    exist at map provider service (see
+    :py:class:`geotiler.errors.TileNotFoundError`), is rendered blank. The
+    list of such tiles is stored in `missing_tiles` item of map image
+    `info` dictionary.
+
+    Tile offset is either a position of a tile in map image or a box (see
+    `PIL.Image.paste`). If it is a box, then the tile image is resampled to
+    the size of the box with `resample` filter.
+
+    The map image mode is one of `RGBA`, `RGB`, `L` or `P`. A tile image is
+    converted only if its mode is different than the map image mode. The
+    map image in `P` mode is rendered in `RGB` mode and converted using
+    adaptive palette.
+
+    If `image` is specified, then the image is cleared and the map is
+    rendered into the image. The image has to have size of the map and the
+    map image mode, which cannot be `P` mode (see also
+    :py:class:`CanvasPool`).
 
     The PIL image object is returned.
 
     :param map: Map object.
     :param tiles: Asynchronous generator of map tiles.
+    :param resample: Resampling filter (see `PIL.Image.resize`).
+    :param mode: Map image mode.
+    :param image: Optional image to render map into.
     """
     if __debug__:
         logger.debug('combining tiles')
 
-    provider = map.provider
+    image, error = _new_image(map, mode, image)
+    async for tile in tiles:
+        _paste_tile(image, tile, error, resample, error.mode)
+
+    return _finish_image(image, mode)
+
+async def render_image_progressive(
+        map, tiles, rate=None, resample=None, mode='RGBA', image=None
+    ):
+    """
+    Render map image using map tile data and yield the map image as tiles
+    arrive.
+
+    Asynchronous generator of tuples is returned. Each tuple contains the
+    map image and the list of rectangles of map image, which changed since
+    the previous tuple was yielded. A rectangle is a tuple `(x0, y0, x1,
+    y1)` clipped to the map image size.
+
+    The same PIL image object is yielded each time. The tiles, which could
+    not be rendered, are listed in `missing_tiles` item of map image `info`
+    dictionary (see also :py:func:`render_image`). If `rate` is
+    specified, then the map image is yielded at most `rate` times per
+    second. The rectangles changed since the last update are yielded when
+    the update interval expires, even if no more tiles arrive. The map
+    image is always yielded after the last tile is rendered.
+
+    The map image mode is one of `RGBA`, `RGB` or `L` (see also
+    :py:func:`render_image`).
+
+    If `image` is specified, then the map is rendered into the image (see
+    also :py:func:`render_image`).
+
+    :param map: Map object.
+    :param tiles: Asynchronous generator of map tiles.
+    :param rate: Maximum number of map image updates per second.
+    :param resample: Resampling filter (see `PIL.Image.resize`).
+    :param mode: Map image mode.
+    :param image: Optional image to render map into.
+    """
+    if __debug__:
+        logger.debug('combining tiles progressively')
+
+    if mode == 'P':
+        raise ValueError('Progressive rendering does not support P mode')
+
+    image, error = _new_image(map, mode, image)
+
+    loop = asyncio.get_running_loop()
+    interval = 1 / rate if rate else 0
+    last = None
+    boxes = []
+
+    tiles = tiles.__aiter__()
+    task = None
+    try:
+        while True:
+            if task is None:
+                task = asyncio.ensure_future(_next_tile(tiles))
+
+            # wait for next tile, but flush changed rectangles when the
+            # interval expires
+            timeout = max(0, last + interval - loop.time()) if boxes else None
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if not done:
+                yield image, boxes
+                last = loop.time()
+                boxes = []
+                continue
+
+            tile, task = task.result(), None
+            if tile is None:
+                break
+
+            img = _paste_tile(image, tile, error, resample, mode)
+            boxes.append(_tile_box(tile.offset, img.size, image.size))
+
+            now = loop.time()
+            if last is None or now - last >= interval:
+                yield image, boxes
+                last = now
+                boxes = []
+    finally:
+        if task is not None:
+            task.cancel()
+
+    if boxes:
+        yield image, boxes
+
+async def _next_tile(tiles):
+    """
+    Get next map tile from asynchronous iterator of map tiles.
+
+    Null is returned if there are no more map tiles.
+
+    :param tiles: Asynchronous iterator of map tiles.
+    """
+    try:
+        return await tiles.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def render_layers_image(
+        map, tiles, layers, resample=None, mode='RGBA', depth=None
+    ):
+    """
+    Render map image using map tile data of multiple map layers.
+
+    The map tiles of all layers, which have the same offset, are alpha
+    composited in the order of the layers and then rendered into the map
+    image. Only the map tiles waiting for the map tiles of other layers
+    are kept in memory.
+
+    Error tile image is used for a layer if tile data does not exist. The
+    list of such tiles is stored in `missing_tiles` item of map image
+    `info` dictionary.
+
+    The map tiles are composited in `RGBA` mode and then converted to the
+    map image mode (see also :py:func:`render_image`).
+
+    If some layers have no map tiles at an offset, then number of layers
+    for each offset is specified with `depth` dictionary.
+
+    Multiple layers might use the same map tile URL, i.e. the same map
+    provider is used twice. Such map tile is used by all its layers.
+
+    If the map tiles of some layers are not received for an offset, then
+    the received layers are composited for the offset.
+
+    The PIL image object is returned.
+
+    :param map: Map object.
+    :param tiles: Asynchronous generator of map tiles of all layers.
+    :param layers: Dictionary of map tile URL and collection of indexes of
+        its layers.
+    :param resample: Resampling filter (see `PIL.Image.resize`).
+    :param mode: Map image mode.
+    :param depth: Dictionary of tile offset and number of its layers.
+    """
+    if __debug__:
+        logger.debug('combining tiles of map layers')
+
+    # no layers if map zoom is out of zoom range of all map providers
+    n = max((max(v) for v in layers.values()), default=-1) + 1
+    image, _ = _new_image(map, mode)
+    error = _error_image(map.provider.tile_width, map.provider.tile_height)
+
+    pending = {}
+    async for tile in tiles:
+        stack = pending.setdefault(tile.offset, [None] * n)
+        img = _decode_tile(image, tile, error, resample, 'RGBA')
+        for k in layers[tile.url]:
+            stack[k] = img
+
+        count = n - stack.count(None)
+        if count == (n if depth is None else depth[tile.offset]):
+            del pending[tile.offset]
+            image.paste(_composite(stack, error), tile.offset)
+
+    if pending:
+        logger.warning(
+            'Map tiles of some layers not received for {} offsets'
+            .format(len(pending))
+        )
+    for offset, stack in pending.items():
+        image.paste(_composite(stack, error), offset)
+
+    return _finish_image(image, mode)
+
+def encode_image(image, format='png', quality=None):
+    """
+    Encode map image in PNG, JPEG or WebP format.
+
+    Map image in `RGBA` mode is converted to `RGB` mode when encoded in
+    JPEG format.
+
+    Encoded image data is returned.
+
+    :param image: Map image.
+    :param format: Image format, one of `png`, `jpg`, `jpeg` or `webp`.
+    :param quality: Quality of image for JPEG and WebP formats.
+    """
+    fmt = image_format(format)
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    params = {} if quality is None else {'quality': quality}
+    f = io.BytesIO()
+    image.save(f, format=fmt, **params)
+    return f.getvalue()
+
+def downsample_image(image, size):
+    """
+    Downsample map image to the image size with area averaging.
+
+    If image size is a multiple of the requested size, then the image is
+    reduced by the factor. Otherwise, the image is resized with box
+    filter.
+
+    :param image: Map image.
+    :param size: Size of downsampled image.
+    """
+    import PIL.Image  # type: ignore
+
+    size = tuple(size)
+    width, height = image.size
+    if size == image.size:
+        return image
+    if size[0] > width or size[1] > height:
+        raise ValueError('Image size {} larger than {}'.format(size, image.size))
+
+    fx, rx = divmod(width, size[0])
+    fy, ry = divmod(height, size[1])
+    if rx == 0 and ry == 0:
+        return image.reduce((fx, fy))
+    return image.resize(size, PIL.Image.Resampling.BOX)
+
+def image_format(format):
+    """
+    Get name of PIL image format for image format name.
+
+    :param format: Image format, one of `png`, `jpg`, `jpeg` or `webp`.
+    """
+    try:
+        return FORMATS[format.lower()]
+    except KeyError:
+        raise ValueError('Unsupported image format: {}'.format(format))
+
+class CanvasPool:
+    """
+    Pool of map images, which can be reused to render maps.
+
+    The pool keeps at most `size` images for each image size and mode.
+    The pool is thread safe.
+
+    :var size: Maximum number of images of the same size and mode in the
+        pool.
+    """
+    def __init__(self, size=2):
+        """
+        Create pool of map images.
+
+        :param size: Maximum number of images of the same size and mode.
+        """
+        self.size = size
+        self._images = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, size, mode='RGBA'):
+        """
+        Get image of given size and mode from the pool.
+
+        New image is created if there is no such image in the pool.
+
+        :param size: Image size.
+        :param mode: Image mode.
+        """
+        import PIL.Image  # type: ignore
+
+        key = tuple(size), mode
+        with self._lock:
+            images = self._images[key]
+            image = images.pop() if images else None
+
+        if image is None:
+            if __debug__:
+                logger.debug('new canvas: {}'.format(key))
+            image = PIL.Image.new(mode, key[0])
+        return image
+
+    def put(self, image):
+        """
+        Return image to the pool.
+
+        The image is discarded if the pool is full.
+
+        :param image: Image to return to the pool.
+        """
+        key = image.size, image.mode
+        with self._lock:
+            images = self._images[key]
+            new = all(img is not image for img in images)
+            if new and len(images) < self.size:
+                images.append(image)
+
+def _new_image(map, mode, image=None):
+    """
+    Create map image and error tile image for a map image mode.
+
+    If image is specified, then it is validated and used as map image.
+
+    The error tile image has the mode used to render the map image.
+
+    :param map: Map object.
+    :param mode: Map image mode.
+    :param image: Optional image to render map into.
+    """
+    import PIL.Image  # type: ignore
+
+    if mode not in MODES:
+        raise ValueError('Unsupported map image mode: {}'.format(mode))
 
     # PIL requires image size to be a tuple
-    image = PIL.Image.new('RGBA', tuple(map.size))
+    size = tuple(map.size)
+    if image is None:
+        # render image in P mode as RGB image and convert it when finished
+        mode = 'RGB' if mode == 'P' else mode
+        image = PIL.Image.new(mode, size)
+    elif mode == 'P' or image.mode != mode or image.size != size:
+        raise ValueError(
+            'Image mode and size expected: {}, {}'.format(mode, size)
+        )
+    else:
+        # map tiles might not cover whole map image
+        image.paste(0, (0, 0) + size)
+
+    provider = map.provider
+    image.info['missing_tiles'] = []
     error = _error_image(provider.tile_width, provider.tile_height)
+    if mode != error.mode:
+        error = error.convert(mode)
+    return image, error
 
-    async for tile in tiles:
-        img = _tile_image(tile.img) if tile.img else error
-        image.paste(img, tile.offset)
+def _finish_image(image, mode):
+    """
+    Convert rendered map image to the map image mode if needed.
+
+    :param image: Rendered map image.
+    :param mode: Map image mode.
+    """
+    import PIL.Image  # type: ignore
 
+    if mode == 'P':
+        info = image.info
+        image = image.convert('P', palette=PIL.Image.Palette.ADAPTIVE)
+        image.info = info
     return image
 
+def _paste_tile(image, tile, error, resample=None, mode='RGBA'):
+    """
+    Paste map tile into map image.
+
+    If tile has no image data, then error tile image is pasted and the
+    tile is added to the list of missing tiles of the map image.
+
+    If tile offset is a box, then tile image is resampled to the size of
+    the box.
+
+    The pasted tile image is returned.
+
+    :param image: Map image.
+    :param tile: Map tile.
+    :param error: Error tile image.
+    :param resample: Resampling filter.
+    :param mode: Mode of tile image.
+    """
+    img = _decode_tile(image, tile, error, resample, mode)
+    image.paste(img, tile.offset)
+    return img
+
+def _composite(stack, error):
+    """
+    Alpha composite map tile images of map layers.
+
+    :param stack: Map tile images of map layers, null for missing layer.
+    :param error: Error tile image.
+    """
+    stack = [img for img in stack if img is not None]
+    img = stack[0].copy() if stack[0] is error else stack[0]
+    for layer in stack[1:]:
+        # the same image can be used by multiple layers
+        img = img.copy() if layer is img else img
+        img.alpha_composite(layer)
+    return img
+
+def _decode_tile(image, tile, error, resample, mode):
+    """
+    Decode map tile image data.
+
+    If tile has no image data, then error tile image or blank image is
+    returned (see :py:func:`_missing_image`), and the tile is added to the
+    list of missing tiles of the map image.
+
+    If tile offset is a box, then tile image is resampled to the size of
+    the box.
+
+    :param image: Map image.
+    :param tile: Map tile.
+    :param error: Error tile image.
+    :param resample: Resampling filter.
+    :param mode: Mode of tile image.
+    """
+    offset = tile.offset
+    size = None
+    if len(offset) == 4:
+        size = offset[2] - offset[0], offset[3] - offset[1]
+
+    if tile.img:
+        img = _tile_image(tile.img, size, resample, mode)
+    else:
+        img = _missing_image(tile, error)
+        img = img.resize(size, resample) if size else img
+        image.info['missing_tiles'].append(tile)
+    return img
+
+def _missing_image(tile, error):
+    """
+    Get image of a map tile without image data.
+
+    A map tile, which does not exist at map provider service, is blank.
+    Otherwise, error tile image is returned.
+
+    :param tile: Map tile or null.
+    :param error: Error tile image.
+    """
+    import PIL.Image  # type: ignore
+
+    if tile is not None and isinstance(tile.error, TileNotFoundError):
+        return PIL.Image.new(error.mode, error.size)
+    return error
+
+def _tile_box(offset, size, image_size):
+    """
+    Calculate rectangle of map image covered by a tile.
+
+    The rectangle is clipped to map image size.
+
+    :param offset: Tile offset in map image.
+    :param size: Tile image size.
+    :param image_size: Map image size.
+    """
+    x, y = offset[:2]
+    w, h = size
+    iw, ih = image_size
+    return max(x, 0), max(y, 0), min(x + w, iw), min(y + h, ih)
+
+@functools.lru_cache(maxsize=4)
+def blank_tile(width=256, height=256):
+    """
+    Create PNG data of transparent map tile image.
+
+    The data can be used as placeholder of map tiles, which do not exist
+    (see :py:func:`geotiler.cache.caching_downloader`).
+
+    :param width: Width of tile image.
+    :param height: Height of tile image.
+    """
+    import PIL.Image  # type: ignore
+
+    f = io.BytesIO()
+    PIL.Image.new('RGBA', (width, height)).save(f, format='png')
+    return f.getvalue()
+
 @functools.lru_cache(maxsize=4)
 def _error_image(width, height):
     """
@@ -81,6 +553,9 @@ def _error_image(width, height):
     :param width: Width of tile image.
     :param height: Height of tile image.
     """
+    import PIL.Image  # type: ignore
+    import PIL.ImageDraw  # type: ignore
+
     img = PIL.Image.new('RGBA', (width, height))
     draw = PIL.ImageDraw.Draw(img)
     msg = 'Error downloading map tile.'
@@ -92,15 +567,33 @@ def _error_image(width, height):
     draw.text((int(x), int(y)), msg, 'red')
     return img
 
-def _tile_image(data):
+def _tile_image(data, size=None, resample=None, mode='RGBA'):
     """
     Convert image data like PNG file data or JPEG file data into
     `PIL.Image` object.
 
+    The image is converted only if its mode is different than requested
+    image mode.
+
+    If size is specified, then the image is resampled to the size. When
+    downscaling, JPEG data is decoded at reduced size if possible.
+
     :param data: Tile data, i.e. PNG file data.
+    :param size: Size of image.
+    :param resample: Resampling filter (see `PIL.Image.resize`).
+    :param mode: Image mode.
     """
+    import PIL.Image  # type: ignore
+
     f = io.BytesIO(data)
-    return PIL.Image.open(f).convert('RGBA')
+    img = PIL.Image.open(f)
+    if size is not None:
+        img.draft(img.mode, size)
+    if img.mode != mode:
+        img = img.convert(mode)
+    if size is not None and img.size != size:
+        img = img.resize(size, resample)
+    return img
 
 
 # vim: sw=4:et:ai
@@ -27,50 +27,369 @@
 
 """
 Functions and coroutines to download map tiles.
+
+The `aiohttp` library is imported on first download of map tiles to keep
+import of GeoTiler fast.
 """
 
-import aiohttp
 import asyncio
+import collections
+import contextlib
+import contextvars
+import itertools
 import logging
-import pkg_resources
-from functools import partial
+import os
+import typing as tp
+from functools import lru_cache, partial
 
+from ..errors import CircuitOpenError, TileNotFoundError
+from ..loop import is_loop_thread
+from .hosts import HOSTS, url_host
+from .limit import HostLimit
+from .local import fetch_local_tiles, is_local
 from ..util import obfuscate
 
-logger = logging.getLogger(__name__)
+if tp.TYPE_CHECKING:
+    import aiohttp
 
-HEADERS = {
-    'User-Agent': 'GeoTiler/{}'.format(pkg_resources.get_distribution('geotiler').version),
-}
+logger = logging.getLogger(__name__)
 
-# client session params
+# client session params; HTTP headers are set on first download of map
+# tiles, see `_headers`
 PARAMS = {
-    'headers': HEADERS,
     'trust_env': True,
     'raise_for_status': True,
 }
 
+# HTTP statuses of map tiles, which do not exist
+NOT_FOUND = 404, 410
+
+# HTTP client session and limits of concurrent downloads per host shared
+# by downloads of map tiles within the background event loop, see
+# `client_session`
+_SESSION: tp.Optional['aiohttp.ClientSession'] = None
+_HOST_LIMITS: tp.Dict[str, HostLimit] = {}
+
+# downloads of map tiles started in background context yield to other
+# downloads, see `background`
+_BACKGROUND = contextvars.ContextVar('geotiler_background', default=False)
+
 FMT_DOWNLOAD_LOG = 'Cannot download a tile due to error: {}'.format
 FMT_DOWNLOAD_ERROR = 'Unable to download {} (error: {})'.format
 
-async def fetch_tile(session, tile):
+def client_session():
+    """
+    Get HTTP client session shared by downloads of map tiles within the
+    background event loop (see :py:mod:`geotiler.loop`).
+
+    The session is created on first call. `RuntimeError` is raised if
+    the function is not called within the background event loop.
+
+    .. seealso:: :py:func:`close_session`
+    """
+    global _SESSION
+
+    if not is_loop_thread():
+        raise RuntimeError('Not in the background event loop')
+
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = _new_session()
+        _HOST_LIMITS.clear()
+
+        if __debug__:
+            logger.debug('http client session created')
+
+    return _SESSION
+
+async def close_session():
+    """
+    Close HTTP client session of the background event loop, if any.
+    """
+    global _SESSION
+
+    session, _SESSION = _SESSION, None
+    _HOST_LIMITS.clear()
+    if session is not None:
+        await session.close()
+
+        if __debug__:
+            logger.debug('http client session closed')
+
+@contextlib.asynccontextmanager
+async def _open_session():
+    """
+    Open HTTP client session and limits of concurrent downloads per host
+    for downloads of map tiles.
+
+    The session and the limits are shared within the background event
+    loop. Otherwise, new session is created and closed on exit, so no
+    connections are left open when the running event loop is closed.
+    """
+    if is_loop_thread():
+        yield client_session(), _HOST_LIMITS
+    else:
+        async with _new_session() as session:
+            yield session, {}
+
+def _new_session():
+    """
+    Create HTTP client session.
+    """
+    import aiohttp
+
+    # connections per host are limited with `HostLimit`; use `trust_env`
+    # to get proxy configuration via env variables
+    connector = aiohttp.TCPConnector(limit=0)
+    return aiohttp.ClientSession(
+        connector=connector, headers=_headers(), **PARAMS
+    )
+
+@contextlib.contextmanager
+def background():
+    """
+    Context manager to download map tiles in background.
+
+    Downloads of map tiles started within the context yield to other
+    downloads from the same host, regardless of map tiles downloader
+    used.
+    """
+    token = _BACKGROUND.set(True)
+    try:
+        yield
+    finally:
+        _BACKGROUND.reset(token)
+
+async def fetch_tile(session, tile, timeout=None):
     """
     Fetch map tile.
 
+    If map tile does not exist at map provider service, then `Tile.error`
+    is set to :py:class:`geotiler.errors.TileNotFoundError`. The original
+    exception is the cause of the error.
+
+    Latency and errors of the download are registered in statistics of
+    map provider service hosts (see :py:mod:`geotiler.tile.hosts`).
+
+    If timeout is specified and download of the map tile takes longer than
+    the timeout, then the download is cancelled and `Tile.error` is set to
+    a value error.
+
+    :param session: HTTP client session.
     :param tile: Map tile.
+    :param timeout: Timeout of the download in seconds.
+    """
+    host = url_host(tile.url)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    latency = None
+    HOSTS.start(host)
+    try:
+        tile = await _download(session, tile, timeout)
+        latency = loop.time() - start
+    finally:
+        # statistics of the host are not changed by cancelled download,
+        # or download failed with unexpected error
+        error = latency is not None and _is_failure(tile.error)
+        HOSTS.finish(host, latency, error)
+    return tile
+
+async def _download(session, tile, timeout):
     """
+    Download map tile and set its data or error.
+
+    :param session: HTTP client session.
+    :param tile: Map tile.
+    :param timeout: Timeout of the download in seconds.
+    """
+    import aiohttp
+
     try:
-        async with session.get(tile.url) as response:
-            data = await response.read()
+        data = await asyncio.wait_for(_read(session, tile.url), timeout)
+    except asyncio.TimeoutError as ex:
+        error = ValueError(FMT_DOWNLOAD_ERROR(obfuscate(tile.url), 'timeout'))
+        error.__cause__ = ex
+        tile = tile._replace(img=None, error=error)
+    except aiohttp.ClientResponseError as ex:
+        cls = TileNotFoundError if ex.status in NOT_FOUND else ValueError
+        error = cls(FMT_DOWNLOAD_ERROR(obfuscate(tile.url), ex))
+        error.__cause__ = ex
+        tile = tile._replace(img=None, error=error)
     except aiohttp.ClientError as ex:
         error = ValueError(FMT_DOWNLOAD_ERROR(obfuscate(tile.url), ex))
+        error.__cause__ = ex
         tile = tile._replace(img=None, error=error)
     else:
         tile = tile._replace(img=data, error=None)
+    return tile
+
+async def _read(session, url):
+    """
+    Read data of a map tile from an URL.
+
+    :param session: HTTP client session.
+    :param url: URL of the map tile.
+    """
+    async with session.get(url) as response:
+        return await response.read()
+
+async def fetch_tile_hosts(fetch, num_workers, limits, tile):
+    """
+    Fetch map tile respecting limit of concurrent downloads from a host.
+
+    Background downloads yield to other downloads (see
+    :py:func:`background`).
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param num_workers: Number of workers used to connect to a host.
+    :param limits: Limits of concurrent downloads per host.
+    :param tile: Map tile.
+    """
+    host = url_host(tile.url)
+    limit = limits.get(host)
+    if limit is None:
+        limit = limits[host] = HostLimit()
+
+    await limit.acquire(num_workers, _BACKGROUND.get())
+    try:
+        return await fetch(tile)
+    finally:
+        limit.release()
+
+async def fetch_tile_until(fetch, deadline, tile):
+    """
+    Fetch map tile with a deadline.
+
+    If the tile is not fetched before the deadline, then its download is
+    cancelled and `Tile.error` is set to a value error.
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param deadline: Deadline of map tile download (event loop time).
+    :param tile: Map tile.
+    """
+    timeout = deadline - asyncio.get_running_loop().time()
+    try:
+        tile = await asyncio.wait_for(fetch(tile), timeout)
+    except asyncio.TimeoutError:
+        msg = FMT_DOWNLOAD_ERROR(obfuscate(tile.url), 'deadline exceeded')
+        tile = tile._replace(img=None, error=ValueError(msg))
+
+    return tile
+
+async def fetch_tile_limited(fetch, limiter, ceiling, tile):
+    """
+    Fetch map tile when allowed by adaptive limiter.
+
+    Latency of the download and congestion of map provider service are
+    reported to the limiter.
 
+    :param fetch: Coroutine function to fetch a map tile.
+    :param limiter: Adaptive limiter of concurrent downloads.
+    :param ceiling: Hard ceiling of number of concurrent downloads.
+    :param tile: Map tile.
+    """
+    await limiter.acquire(ceiling)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        tile = await fetch(tile)
+    except BaseException:
+        limiter.release()
+        raise
+
+    limiter.release(loop.time() - start, _is_congested(tile.error))
     return tile
 
-async def fetch_tiles(tiles, num_workers):
+async def fetch_tile_breaker(fetch, breaker, tile):
+    """
+    Fetch map tile unless circuit breaker is open.
+
+    If circuit breaker is open, then `Tile.error` is set to
+    :py:class:`geotiler.errors.CircuitOpenError` without downloading
+    the map tile. A map tile, which does not exist, is not a failure.
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param breaker: Circuit breaker of map provider service.
+    :param tile: Map tile.
+    """
+    if not breaker.allow():
+        msg = FMT_DOWNLOAD_ERROR(obfuscate(tile.url), 'circuit open')
+        return tile._replace(img=None, error=CircuitOpenError(msg))
+
+    try:
+        tile = await fetch(tile)
+    except BaseException:
+        breaker.record()
+        raise
+
+    breaker.record(_is_failure(tile.error))
+    return tile
+
+async def fetch_tile_mirrors(fetch, hedge, tile):
+    """
+    Fetch map tile from map provider service or its mirrors.
+
+    If download of a map tile fails, then the download fails over to the
+    next mirror. A map tile, which does not exist, is not downloaded from
+    the mirrors.
+
+    If hedge policy is specified, and a map tile is not downloaded on time,
+    then duplicate download is started at the next mirror. The first
+    successful download wins, and the other one is cancelled. A map tile
+    is hedged at most once.
+
+    The URL of a map tile is kept, regardless of the URL used to download
+    the tile.
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param hedge: Policy of hedged downloads or null.
+    :param tile: Map tile.
+    """
+    urls = collections.deque(tile.mirrors)
+    start = partial(_fetch_mirror, fetch, hedge, tile)
+    if hedge is not None:
+        hedge.start()
+
+    pending = {start(tile.url)}
+    delay = hedge.delay() if hedge is not None and urls else None
+    result = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # hedge the download at most once; the mirror is taken
+                # only if the hedge is allowed, so it is still available
+                # for fail over otherwise
+                delay = None
+                if urls and hedge.allow():
+                    pending.add(start(urls.popleft()))
+                continue
+
+            for task in done:
+                result = task.result()
+                if result.error is None \
+                        or isinstance(result.error, TileNotFoundError):
+                    return result
+
+            # fail over does not depend on the hedge budget
+            if not pending and urls:
+                url = urls.popleft()
+                if __debug__:
+                    logger.debug('fail over to mirror {}'.format(
+                        obfuscate(url)
+                    ))
+                pending.add(start(url))
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return result
+
+async def fetch_tiles(
+        tiles, num_workers, timeout=None, tile_timeout=None, limiter=None,
+        hedge=None, breaker=None
+    ):
     """
     Download map tiles.
 
@@ -80,29 +399,176 @@ async def fetch_tiles(tiles, num_workers):
     has `Tile.img` attribute set. If there was an error while downloading
     a tile, then `Tile.img` is set to null and `Tile.error` to a value error.
 
+    If `timeout` is specified, then downloads of all tiles are cancelled
+    when the timeout expires and the tiles not downloaded on time are
+    returned with an error.
+
+    If `tile_timeout` is specified, then a tile download fails when the
+    whole download of the tile, i.e. connecting to a map provider service
+    and reading tile data, takes longer than the timeout. Waiting for a
+    free worker is not part of the download.
+
+    If `limiter` is specified, then number of concurrent downloads adapts
+    to latency and errors of map provider service. The number of workers
+    is the hard ceiling of the number of concurrent downloads.
+
+    Download of a map tile fails over to mirrors of map provider service,
+    see `Tile.mirrors`. If `hedge` is specified, then slow downloads are
+    hedged at the mirrors. Hedged downloads respect the number of workers
+    per host, and the limiter.
+
+    If `breaker` is specified, then downloads fail immediately while the
+    circuit breaker is open, i.e. during outage of map provider service.
+
+    HTTP client session and the number of workers per host are shared by
+    all downloads within the background event loop (see
+    :py:func:`client_session`). Otherwise, HTTP client session is opened
+    and closed by each call of the coroutine.
+
+    Map tiles of local sources, i.e. with `file` or `mbtiles` URLs, are
+    read without HTTP client (see :py:mod:`geotiler.tile.local`). All
+    tiles have to be of the same kind of map provider.
+
     :param tiles: Collection of tiles.
     :param num_workers: Number of workers used to connect to a map provider
         service.
+    :param timeout: Timeout of download of all tiles in seconds.
+    :param tile_timeout: Timeout of a tile download in seconds.
+    :param limiter: Adaptive limiter of concurrent downloads (see
+        :py:class:`geotiler.tile.limit.AdaptiveLimiter`).
+    :param hedge: Policy of hedged downloads (see
+        :py:class:`geotiler.tile.hedge.HedgePolicy`).
+    :param breaker: Circuit breaker of map provider service (see
+        :py:class:`geotiler.tile.breaker.CircuitBreaker`).
     """
+    tiles = iter(tiles)
+    first = next(tiles, None)
+    if first is None:
+        return
+    tiles = itertools.chain([first], tiles)
+
+    if is_local(first.url):
+        async for tile in fetch_local_tiles(tiles, num_workers):
+            if tile.error:
+                logger.warning(FMT_DOWNLOAD_LOG(tile.error))
+            yield tile
+        return
+
     if __debug__:
         logger.debug('fetching tiles...')
 
-    # respect connection limits by defining custom connector
-    connector = aiohttp.TCPConnector(limit_per_host=num_workers)
+    async with _open_session() as (session, limits):
+        f = partial(fetch_tile, session, timeout=tile_timeout)
+        f = partial(fetch_tile_hosts, f, num_workers, limits)
+        if limiter is not None:
+            f = partial(fetch_tile_limited, f, limiter, num_workers)
+        f = _with_mirrors(f, hedge)
+        if breaker is not None:
+            f = partial(fetch_tile_breaker, f, breaker)
+        if timeout is not None:
+            deadline = asyncio.get_running_loop().time() + timeout
+            f = partial(fetch_tile_until, f, deadline)
 
-    # use `trust_env` to get proxy configuration via env variables
-    async with aiohttp.ClientSession(connector=connector, **PARAMS) as session:
-        f = partial(fetch_tile, session)
-        tasks = [f(t) for t in tiles]
-        for task in asyncio.as_completed(tasks):
-            tile = await task  # no exception expected at this stage
+        # cancel downloads of the tiles, which are not consumed, before
+        # the session is closed or used by other downloads
+        tasks = [asyncio.ensure_future(f(t)) for t in tiles]
+        try:
+            for task in asyncio.as_completed(tasks):
+                tile = await task  # no exception expected at this stage
 
-            if tile.error:
-                logger.warning(FMT_DOWNLOAD_LOG(tile.error))
+                if tile.error:
+                    logger.warning(FMT_DOWNLOAD_LOG(tile.error))
 
-            yield tile
+                yield tile
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     if __debug__:
         logger.debug('fetching tiles done')
 
+def _with_mirrors(fetch, hedge):
+    """
+    Create coroutine function to fetch a map tile, which fails over to
+    mirrors of map provider service for map tiles having mirrors.
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param hedge: Policy of hedged downloads or null.
+    """
+    fetch_mirrors = partial(fetch_tile_mirrors, fetch, hedge)
+    return lambda tile: fetch_mirrors(tile) if tile.mirrors else fetch(tile)
+
+def _fetch_mirror(fetch, hedge, tile, url):
+    """
+    Start download of a map tile from an URL.
+
+    Latency of a successful download is recorded by hedge policy.
+
+    :param fetch: Coroutine function to fetch a map tile.
+    :param hedge: Policy of hedged downloads or null.
+    :param tile: Map tile.
+    :param url: URL of the map tile at map provider service or its mirror.
+    """
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await fetch(tile._replace(url=url))
+        if hedge is not None and result.error is None:
+            hedge.record(loop.time() - start)
+        return result._replace(url=tile.url)
+
+    return asyncio.ensure_future(run())
+
+@lru_cache(maxsize=None)
+def _headers():
+    """
+    Get HTTP headers of map tiles downloads.
+
+    GeoTiler version is read from package metadata on first use.
+    """
+    from importlib.metadata import version
+    return {'User-Agent': 'GeoTiler/{}'.format(version('geotiler'))}
+
+def _is_failure(error):
+    """
+    Check if map tile download error is failure of map provider service.
+
+    Missing map tile is not a failure.
+
+    :param error: Map tile download error.
+    """
+    return error is not None and not isinstance(error, TileNotFoundError)
+
+def _reset():
+    """
+    Discard HTTP client session in a forked process, which does not
+    inherit thread of the background event loop.
+
+    Connections of the session belong to the parent process, so they are
+    not closed.
+    """
+    global _SESSION
+
+    if _SESSION is not None:
+        _SESSION.detach()
+    _SESSION = None
+    _HOST_LIMITS.clear()
+
+def _is_congested(error):
+    """
+    Check if map tile download error indicates congestion of map provider
+    service, i.e. HTTP status 429 or 5xx, or timeout.
+
+    :param error: Map tile download error.
+    """
+    import aiohttp
+
+    cause = getattr(error, '__cause__', None)
+    if isinstance(cause, aiohttp.ClientResponseError):
+        return cause.status == 429 or cause.status >= 500
+    return isinstance(cause, asyncio.TimeoutError)
+
+os.register_at_fork(after_in_child=_reset)
+
 # vim: sw=4:et:ai
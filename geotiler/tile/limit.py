@@ -0,0 +1,242 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Adaptive concurrency control of map tiles downloads.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveLimiter:
+    """
+    Limiter of number of concurrent downloads of map tiles with additive
+    increase and multiplicative decrease (AIMD) of the limit.
+
+    The limit is increased by `increase / limit` after each successful
+    download, i.e. by `increase` per `limit` downloads. The limit is
+    multiplied by `decrease` on congestion, i.e. HTTP status 429 or 5xx,
+    timeout or latency spike. The limit is decreased at most once per
+    average latency, so a burst of errors does not collapse it.
+
+    The limit is never greater than `max_limit` and the number of workers
+    of a downloader (see :py:func:`geotiler.tile.io.fetch_tiles`), and
+    never less than 1.
+
+    Use one limiter per map provider. The limiter is not thread safe.
+
+    :var limit: Current limit of concurrent downloads.
+    :var max_limit: Maximum limit of concurrent downloads.
+    :var increase: Additive increase of the limit.
+    :var decrease: Multiplicative decrease of the limit.
+    :var spike: Latency spike factor; latency greater than average latency
+        times the factor is a latency spike.
+    :var latency: Average latency of downloads (exponential moving
+        average).
+    """
+    def __init__(
+            self, limit=1, max_limit=None, increase=1, decrease=0.5, spike=3
+        ):
+        """
+        Create adaptive limiter.
+
+        :param limit: Initial limit of concurrent downloads.
+        :param max_limit: Maximum limit of concurrent downloads.
+        :param increase: Additive increase of the limit.
+        :param decrease: Multiplicative decrease of the limit.
+        :param spike: Latency spike factor.
+        """
+        self.limit = limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.spike = spike
+        self.latency = None
+
+        self._active = 0
+        self._ceiling = math.inf if max_limit is None else max_limit
+        self._last_decrease = -math.inf
+        self._waiters = collections.deque()
+
+    async def acquire(self, ceiling=None):
+        """
+        Wait until a download can be started.
+
+        :param ceiling: Hard ceiling of the limit, i.e. number of workers
+            of a downloader.
+        """
+        if ceiling is not None:
+            self._ceiling = min(ceiling, self.max_limit or math.inf)
+
+        if not self._waiters and self._active < self._slots():
+            self._active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the download was started already, so pass it on
+                self.release()
+            raise
+
+    def release(self, latency=None, congested=False):
+        """
+        Finish a download and adapt the limit.
+
+        If latency is null, i.e. download was cancelled, then the limit is
+        not changed.
+
+        :param latency: Latency of the download in seconds.
+        :param congested: True if map provider service reported
+            congestion.
+        """
+        self._active -= 1
+        if latency is not None:
+            self._adapt(latency, congested)
+
+        # start waiting downloads in order of their arrival, one per free
+        # download slot
+        waiters = self._waiters
+        while waiters and self._active < self._slots():
+            waiter = waiters.popleft()
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+    def _slots(self):
+        """
+        Get number of download slots allowed by the limit and the ceiling.
+        """
+        return max(1, min(int(self.limit), self._ceiling))
+
+    def _adapt(self, latency, congested):
+        """
+        Adapt the limit using latency of a download and congestion status.
+        """
+        now = time.monotonic()
+        avg = self.latency
+        spike = avg is not None and latency > self.spike * avg
+
+        if congested or spike:
+            if now - self._last_decrease > (avg or 0):
+                self.limit = max(1, self.limit * self.decrease)
+                self._last_decrease = now
+                if __debug__:
+                    logger.debug('download limit decreased: {:.1f}'.format(
+                        self.limit
+                    ))
+        else:
+            limit = self.limit + self.increase / self.limit
+            self.limit = min(limit, self._ceiling)
+
+        self.latency = latency if avg is None else 0.8 * avg + 0.2 * latency
+
+class HostLimit:
+    """
+    Limit of concurrent downloads from a map provider service host shared
+    by downloaders.
+
+    A download starts if number of downloads in progress is less than the
+    number of workers of its downloader. A background download, i.e.
+    prefetching of map tiles, starts only if no foreground download is
+    waiting.
+
+    The limit is not thread safe.
+    """
+    def __init__(self):
+        """
+        Create limit of concurrent downloads from a host.
+        """
+        self._active = 0
+
+        # queues of waiting downloads; a waiting download is tuple of its
+        # future and number of workers of its downloader
+        self._foreground = collections.deque()
+        self._background = collections.deque()
+
+    async def acquire(self, num_workers, background=False):
+        """
+        Wait until a download can be started.
+
+        The waiting downloads are started in order of their arrival.
+
+        :param num_workers: Number of workers of a downloader.
+        :param background: True if the download is background download.
+        """
+        waiters = self._background if background else self._foreground
+        if not waiters and self._active < num_workers \
+                and not (background and self._foreground):
+            self._active += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append((waiter, num_workers))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the download was started already, so pass it on
+                self.release()
+            else:
+                self._wake()
+            raise
+
+    def release(self):
+        """
+        Finish a download.
+
+        Next waiting download is started, a foreground download first.
+        """
+        self._active -= 1
+        self._wake()
+
+    def _wake(self):
+        """
+        Start waiting downloads while the limit allows.
+        """
+        while True:
+            for waiters in (self._foreground, self._background):
+                while waiters and waiters[0][0].done():
+                    waiters.popleft()
+
+            waiters = self._foreground or self._background
+            if not waiters or self._active >= waiters[0][1]:
+                return
+
+            waiter, _ = waiters.popleft()
+            self._active += 1
+            waiter.set_result(None)
+
+# vim: sw=4:et:ai
@@ -0,0 +1,206 @@
+#
+# GeoTiler - library to create maps using tiles from a map provider
+#
+# Copyright (C) 2014 - 2024 by Artur Wroblewski <wrobell@riseup.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# This file incorporates work covered by the following copyright and
+# permission notice (restored, based on setup.py file from
+# https://github.com/stamen/modestmaps-py):
+#
+#   Copyright (C) 2007-2013 by Michal Migurski and other contributors
+#   License: BSD
+#
+
+"""
+Functions and coroutines to read map tiles from local sources.
+
+Two kinds of local sources of map tiles are supported
+
+`file`
+    Tree of map tiles files, i.e. `file:///data/tiles/{z}/{x}/{y}.png`.
+`mbtiles`
+    MBTiles file, i.e. `mbtiles:///data/world.mbtiles#{z}/{x}/{y}`. The
+    fragment of the URL identifies a map tile.
+
+The map tiles are read in a thread pool. Map tiles of MBTiles file are
+read with batched SQLite queries; the `sqlite3` module is imported on
+first use.
+"""
+
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from urllib.parse import urlsplit, unquote
+
+from ..errors import TileNotFoundError
+
+logger = logging.getLogger(__name__)
+
+SCHEMES = 'file', 'mbtiles'
+
+FMT_READ_ERROR = 'Unable to read {} (error: {})'.format
+
+SQL_TILES = """
+select tile_column, tile_row, tile_data
+from tiles
+where zoom_level = ?
+    and tile_column between ? and ?
+    and tile_row between ? and ?
+"""
+
+def is_local(url):
+    """
+    Check if URL of a map tile points to a local source of map tiles.
+
+    :param url: URL of a map tile.
+    """
+    return url.partition(':')[0] in SCHEMES
+
+async def fetch_local_tiles(tiles, num_workers, batch_size=64):
+    """
+    Read map tiles from local sources.
+
+    Asynchronous generator of map tiles is returned. The interface is the
+    same as of :py:func:`geotiler.tile.io.fetch_tiles` downloader.
+
+    If a map tile does not exist, then `Tile.error` is set to
+    :py:class:`geotiler.errors.TileNotFoundError`.
+
+    :param tiles: Collection of tiles.
+    :param num_workers: Number of batches of map tiles read at once (at
+        least 1).
+    :param batch_size: Number of map tiles read by a thread at once.
+    """
+    loop = asyncio.get_running_loop()
+    batches = _batches(tiles, batch_size)
+    num_workers = max(1, num_workers)
+    pending = set()
+    while True:
+        for batch in itertools.islice(batches, num_workers - len(pending)):
+            read = _read_mbtiles if batch[0].url.startswith('mbtiles:') \
+                else _read_files
+            pending.add(loop.run_in_executor(None, read, batch))
+
+        if not pending:
+            break
+
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            for tile in task.result():
+                yield tile
+
+def _batches(tiles, size):
+    """
+    Split map tiles into batches.
+
+    A batch contains map tiles of the same MBTiles file or tree of map
+    tiles files.
+    """
+    groups = defaultdict(list)
+    for tile in tiles:
+        key = tile.url.partition('#')[0] if tile.url.startswith('mbtiles:') \
+            else 'file'
+        batch = groups[key]
+        batch.append(tile)
+        if len(batch) == size:
+            yield batch
+            groups[key] = []
+    yield from (b for b in groups.values() if b)
+
+def _read_files(tiles):
+    """
+    Read map tiles files.
+
+    :param tiles: Map tiles with `file` URLs.
+    """
+    from urllib.request import url2pathname
+    return [_read_file(t, url2pathname) for t in tiles]
+
+def _read_file(tile, url2pathname):
+    path = url2pathname(unquote(urlsplit(tile.url).path))
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError as ex:
+        error = TileNotFoundError(FMT_READ_ERROR(tile.url, 'no file'))
+        error.__cause__ = ex
+        return tile._replace(img=None, error=error)
+    except OSError as ex:
+        error = ValueError(FMT_READ_ERROR(tile.url, ex))
+        error.__cause__ = ex
+        return tile._replace(img=None, error=error)
+    return tile._replace(img=data, error=None)
+
+def _read_mbtiles(tiles):
+    """
+    Read map tiles of MBTiles file.
+
+    The map tiles are read with one query per zoom level. Row of a map
+    tile in MBTiles file is flipped, i.e. `2 ** zoom - 1 - y`.
+
+    :param tiles: Map tiles with `mbtiles` URLs of the same MBTiles file.
+    """
+    import sqlite3
+
+    path = unquote(urlsplit(tiles[0].url).path)
+    keys = [_mbtiles_key(t.url) for t in tiles]
+
+    try:
+        data = {}
+        db = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        try:
+            zoom = lambda k: k[0]
+            for z, items in itertools.groupby(sorted(set(keys)), zoom):
+                items = list(items)
+                xs = [x for _, x, _ in items]
+                rows = [2 ** z - 1 - y for _, _, y in items]
+                params = (z, min(xs), max(xs), min(rows), max(rows))
+                result = db.execute(SQL_TILES, params)
+                data.update(
+                    ((z, x, 2 ** z - 1 - r), d) for x, r, d in result
+                )
+        finally:
+            db.close()
+    except sqlite3.Error as ex:
+        if __debug__:
+            logger.debug('cannot read mbtiles file {}: {}'.format(path, ex))
+        result = []
+        for tile in tiles:
+            error = ValueError(FMT_READ_ERROR(tile.url, ex))
+            error.__cause__ = ex
+            result.append(tile._replace(img=None, error=error))
+        return result
+
+    return [_mbtiles_tile(t, data.get(k)) for t, k in zip(tiles, keys)]
+
+def _mbtiles_key(url):
+    """
+    Get zoom, column and row of a map tile from its MBTiles URL.
+    """
+    z, x, y = urlsplit(url).fragment.split('/')
+    return int(z), int(x), int(y)
+
+def _mbtiles_tile(tile, data):
+    if data is None:
+        error = TileNotFoundError(FMT_READ_ERROR(tile.url, 'no tile'))
+        return tile._replace(img=None, error=error)
+    return tile._replace(img=bytes(data), error=None)
+
+# vim: sw=4:et:ai